@@ -0,0 +1,54 @@
+"""
+Benchmark of the in-process CPU load engine.
+Reports the load achieved by the duty-cycle workers against the requested load, and the cost of one
+drift step: retargeting the engine against starting a new stress-ng process (when stress-ng is installed).
+Run from the repository root: python -m benchmarks.cpu_engine_bench
+"""
+import shutil
+import subprocess
+import time
+
+import psutil
+
+from core.cpu.load_engine import CpuLoadEngine
+
+
+def _achieved_load(engine, seconds):
+    # Mean CPU usage of the workers, in percent of one CPU per worker
+    workers = [psutil.Process(pid) for pid in engine.pids]
+    before = [sum(worker.cpu_times()[:2]) for worker in workers]
+    time.sleep(seconds)
+    after = [sum(worker.cpu_times()[:2]) for worker in workers]
+    return sum(b - a for a, b in zip(before, after)) / seconds / len(workers) * 100
+
+
+if __name__ == '__main__':
+    engine = CpuLoadEngine().start()
+    try:
+        print(f"{engine.workers} workers, period {engine.period * 1e3:.0f} ms")
+        print("requested  achieved  error")
+        for requested in (10, 25, 50, 75, 90):
+            engine.set_load(requested)
+            time.sleep(0.5)
+            achieved = _achieved_load(engine, 3)
+            print(f"{requested:8.1f}% {achieved:8.1f}% {achieved - requested:+6.1f}")
+        engine.set_load(0)
+
+        repeat = 100
+        begin = time.perf_counter()
+        for i in range(repeat):
+            engine.set_load(i % 50)
+        print(f"retarget engine: {(time.perf_counter() - begin) / repeat * 1e6:.1f} us per step")
+    finally:
+        engine.stop()
+
+    if shutil.which('stress-ng'):
+        repeat = 20
+        begin = time.perf_counter()
+        for _ in range(repeat):
+            process = subprocess.Popen(['stress-ng', '-c', '2', '--cpu-load', '10'])
+            process.terminate()
+            process.wait()
+        print(f"start stress-ng: {(time.perf_counter() - begin) / repeat * 1e3:.2f} ms per step")
+    else:
+        print("stress-ng is not installed, skipping the process start comparison")
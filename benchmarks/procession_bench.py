@@ -0,0 +1,58 @@
+"""
+Benchmark of the label join of DataProcessor.
+Labels synthetic 10 s timesteps with the sorted-array join of convert_to_annotated_data and with the row by row
+join of convert_to_annotated_data_legacy, checks that both give the same result and reports their time.
+The legacy join is only run on the short span, it grows with timesteps x labels.
+Run from the repository root: python -m benchmarks.procession_bench
+"""
+import datetime
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.procession import DataProcessor
+
+LABELS_PER_DAY = 300
+
+
+def _make_data(days, seed=0):
+    rng = np.random.default_rng(seed)
+    begin = datetime.datetime(2023, 11, 3, 8, 0, 0)
+    end = begin + datetime.timedelta(days=days)
+    label_path = "storage/cpu_{}_to_{}.csv".format(begin.strftime('%Y-%m-%d_%H-%M-%S'),
+                                                   end.strftime('%Y-%m-%d_%H-%M-%S'))
+    count = int(days * LABELS_PER_DAY)
+    starts = np.sort(rng.uniform(0, days * 86400, count))
+    lengths = rng.choice([10, 60, 600, 3600], count) + rng.random(count)
+    types = rng.choice(['Sudden', 'Blip', 'Recurrent', 'Incremental', 'Gradual'], count)
+    rows = [[i + 1, types[i], (begin + datetime.timedelta(seconds=starts[i])).strftime('%d/%m/%Y %H:%M:%S.%f'),
+             (begin + datetime.timedelta(seconds=starts[i] + lengths[i])).strftime('%d/%m/%Y %H:%M:%S')]
+            for i in range(count)]
+    label_data = pd.DataFrame(rows, columns=['id', 'drift_label', 'drift_start', 'drift_end'])
+    index = pd.date_range(begin - datetime.timedelta(hours=8), end - datetime.timedelta(hours=8), freq='10s',
+                          tz='UTC')
+    drift_data = pd.DataFrame({'_value': rng.random(len(index))}, index=index)
+    return label_path, label_data, drift_data
+
+
+def _time_join(func, *args):
+    begin = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - begin
+
+
+if __name__ == '__main__':
+    label_path, label_data, drift_data = _make_data(2)
+    processor = DataProcessor(label_path, None)
+    legacy, legacy_seconds = _time_join(processor.convert_to_annotated_data_legacy, label_data, drift_data)
+    annotated, seconds = _time_join(processor.convert_to_annotated_data, label_data, drift_data)
+    assert annotated == legacy, "the sorted-array join differs from the legacy join"
+    print(f"2 days, {len(annotated)} timesteps, {len(label_data)} labels: identical results")
+    print(f"legacy join        {legacy_seconds:8.2f} s")
+    print(f"sorted-array join  {seconds:8.2f} s  ({legacy_seconds / seconds:.0f}x)")
+
+    label_path, label_data, drift_data = _make_data(180)
+    processor = DataProcessor(label_path, None)
+    annotated, seconds = _time_join(processor.convert_to_annotated_data, label_data, drift_data)
+    print(f"180 days, {len(annotated)} timesteps, {len(label_data)} labels: sorted-array join {seconds:.2f} s")
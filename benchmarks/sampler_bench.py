@@ -0,0 +1,35 @@
+"""
+Benchmark of the background metric sampler.
+Compares a read through core.toolkit.tools with the blocking psutil probe it replaced
+and reports the measured overhead of the sampler thread.
+Run from the repository root: python -m benchmarks.sampler_bench
+"""
+import time
+
+import psutil
+
+from core.toolkit.tools import get_current_cpu_utilization, get_current_processes_num, get_sampler
+
+
+def _time_call(func, repeat):
+    begin = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - begin) / repeat
+
+
+if __name__ == '__main__':
+    sampler = get_sampler()
+    sampler.wait_ready()
+    repeat = 10000
+    print(f"sampler read  get_current_cpu_utilization(): {_time_call(get_current_cpu_utilization, repeat) * 1e6:.2f} us")
+    print(f"sampler read  get_current_cpu_utilization(60): "
+          f"{_time_call(lambda: get_current_cpu_utilization(60), repeat) * 1e6:.2f} us")
+    print(f"sampler read  get_current_processes_num(): {_time_call(get_current_processes_num, repeat) * 1e6:.2f} us")
+    print(f"direct probe  psutil.cpu_percent(interval=1): {_time_call(lambda: psutil.cpu_percent(interval=1), 2):.3f} s")
+    print(f"direct probe  len(list(psutil.process_iter())): "
+          f"{_time_call(lambda: len(list(psutil.process_iter())), 20) * 1e3:.2f} ms")
+    time.sleep(10)
+    stats = sampler.stats()
+    print(f"sampler: {stats['samples']} samples, {stats['mean_probe_seconds'] * 1e3:.2f} ms per probe, "
+          f"overhead {stats['overhead'] * 100:.3f}% of one core")
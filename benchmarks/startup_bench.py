@@ -0,0 +1,66 @@
+"""
+Benchmark of the cold start of the command line entry points.
+Times --help of every entry point in a fresh interpreter, the best and median of several runs, against an empty
+interpreter, and lists the heavy modules each one imports with python -X importtime. Exits with 1 when the
+startup overhead of an entry point is above its budget.
+Run from the repository root: python -m benchmarks.startup_bench
+"""
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import click
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry point -> arguments of the interpreter and startup overhead budget in seconds over an empty interpreter
+ENTRY_POINTS = {
+    'main': (['main.py', '--help'], 0.15),
+    'batch': (['-m', 'utils.batch', '--help'], 0.15),
+    'visualization': (['-m', 'utils.visualization', '--help'], 0.25),
+}
+# Modules that only a running command needs
+HEAVY_MODULES = ['core.scheduler', 'pandas', 'matplotlib', 'psutil', 'psycopg2', 'sqlite3', 'yaml']
+
+
+def cold_start(args, runs):
+    # Wall times of runs fresh interpreters, the imports are not cached between them in sys.modules
+    times = []
+    for _ in range(runs):
+        begin = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=ROOT, stdout=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - begin)
+    return times
+
+
+def imported_modules(args):
+    # Top-level names of the modules imported by the entry point, parsed from the -X importtime report
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=ROOT, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True, check=True)
+    return {line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith('import time')}
+
+
+@click.command()
+@click.option('--runs', type=click.IntRange(min=1), default=10, show_default=True, help='Runs of every entry point')
+def _main(runs):
+    baseline = min(cold_start(['-c', 'pass'], runs))
+    print(f"empty interpreter: {baseline * 1000:.0f} ms")
+    over = []
+    for name, (args, budget) in ENTRY_POINTS.items():
+        times = cold_start(args, runs)
+        overhead = min(times) - baseline
+        heavy = [module for module in HEAVY_MODULES if module in imported_modules(args)]
+        print(f"{name}: best {min(times) * 1000:.0f} ms, median {statistics.median(times) * 1000:.0f} ms, "
+              f"overhead {overhead * 1000:.0f} ms (budget {budget * 1000:.0f} ms), "
+              f"heavy imports: {', '.join(heavy) or 'none'}")
+        if overhead > budget:
+            over.append(name)
+    if over:
+        print(f"Over budget: {', '.join(over)}")
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,72 @@
+"""
+Benchmark of the headless rendering of Visualization.
+Writes a synthetic 30 day export at 1 s with a few thousand labels, then times the LTTB downsampling alone,
+the overview image of the whole campaign, and the rendering of the daily chunk images. Also times the label
+lookup of every 500-sample chunk against the LabelIndex of tens of thousands of labels.
+Run from the repository root: python -m benchmarks.visualization_bench
+"""
+import datetime
+import os
+import pickle
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.visualization import LabelIndex, Visualization, lttb
+
+DAYS = 30
+LABELS_PER_DAY = 100
+
+
+def _write_data(directory, seed=0):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2023-11-03 00:00:00', periods=DAYS * 86400, freq='1s')
+    values = np.cumsum(rng.normal(size=len(times)))
+    csv_path = os.path.join(directory, 'export.csv')
+    pd.DataFrame({'_time': times.strftime('%Y-%m-%dT%H:%M:%SZ'), '_value': values}).to_csv(csv_path, index=False)
+    begin = datetime.datetime(2023, 11, 3, 8, 0, 0)
+    starts = np.sort(rng.uniform(0, DAYS * 86400, DAYS * LABELS_PER_DAY))
+    types = rng.choice(['Sudden', 'Blip', 'Recurrent', 'Incremental', 'Gradual'], len(starts))
+    labels = [[types[i], (begin + datetime.timedelta(seconds=start), begin + datetime.timedelta(seconds=start + 600))]
+              for i, start in enumerate(starts)]
+    pkl_path = os.path.join(directory, 'labels.pkl')
+    with open(pkl_path, 'wb') as file:
+        pickle.dump(labels, file)
+    return pkl_path, csv_path
+
+
+def _lookup_chunks(label_index, times, chunk_rows=500):
+    found = 0
+    for begin in range(0, len(times), chunk_rows):
+        found += len(label_index.sample_spans(times[begin:begin + chunk_rows]))
+    return found
+
+
+def _timed(func, *args, **kwargs):
+    begin = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - begin
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        pkl_path, csv_path = _write_data(directory)
+        v = Visualization(pkl_path, csv_path, chunk_rows=86400)
+        (x, y), seconds = _timed(v.load_series)
+        print(f"{len(x)} samples, {DAYS * LABELS_PER_DAY} labels, read in {seconds:.2f} s")
+        _, seconds = _timed(lttb, x, y, 2000)
+        print(f"LTTB to 2000 points      {seconds:8.2f} s")
+        _, seconds = _timed(v.overview, os.path.join(directory, 'overview.png'))
+        print(f"overview image           {seconds:8.2f} s (reading included)")
+        paths, seconds = _timed(v.render, os.path.join(directory, 'plots'))
+        print(f"{len(paths)} daily chunk images  {seconds:8.2f} s (reading included, {os.cpu_count()} CPUs)")
+
+        labels = [['Blip', (start, start + datetime.timedelta(seconds=30))]
+                  for start in pd.date_range('2023-11-03 08:00:00', periods=50000, freq='50s').to_pydatetime()]
+        label_index, seconds = _timed(LabelIndex, labels)
+        found, lookup_seconds = _timed(_lookup_chunks, label_index, x)
+        chunks = len(x) // 500
+        print(f"LabelIndex of {len(labels)} labels built in {seconds:.2f} s, {chunks} chunks looked up in "
+              f"{lookup_seconds:.2f} s ({lookup_seconds / chunks * 1e6:.0f} us per chunk, {found} spans)")
@@ -0,0 +1,202 @@
+import asyncio
+import os
+
+from core.toolkit.config import get_config
+from core.toolkit.logger import setup_logger
+from core.toolkit.tools import (get_current_cpu_utilization, get_current_memory_utilization,
+                                get_current_processes_num, get_total_memory)
+
+config = get_config('scheduler')
+
+config_arbiter = config['settings']['arbiter']
+
+RESOURCES = ('cpu', 'mem', 'processes')
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised when a command cannot be fitted into the load budget
+    """
+
+
+def _option_value(cmd, *flags):
+    """
+    Return the value following the first matching flag of a command, or None
+    """
+    for flag in flags:
+        if flag in cmd:
+            index = cmd.index(flag)
+            if index + 1 < len(cmd):
+                return cmd[index + 1]
+    return None
+
+
+def _parse_megabytes(value):
+    """
+    Convert a stress-ng size such as '512M', '1g' or '1048576' into MB
+    """
+    units = {'b': 1 / (1024 * 1024), 'k': 1 / 1024, 'm': 1, 'g': 1024}
+    value = str(value).strip().lower()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value) / (1024 * 1024)
+
+
+def estimate_demand(cmd, cpu_count=None):
+    """
+    Estimate the host resources a stress-ng command will hold.
+    Only the primary resource of every stressor is counted: cpu workers in percent of the whole host,
+    vm workers in MB and fork workers in processes.
+    :param cmd (list): The stress-ng command.
+    :param cpu_count (int or None): Number of CPUs of the host, the local one by default.
+    :return:
+        dict: The demand of the command for each resource.
+    """
+    cpu_count = cpu_count or os.cpu_count()
+    demand = dict.fromkeys(RESOURCES, 0.0)
+    cpu_workers = _option_value(cmd, '-c', '--cpu')
+    if cpu_workers is not None:
+        workers = int(cpu_workers) or cpu_count
+        cpu_load = float(_option_value(cmd, '--cpu-load') or 100)
+        demand['cpu'] = workers * cpu_load / cpu_count
+    vm_workers = _option_value(cmd, '--vm')
+    if vm_workers is not None:
+        # stress-ng allocates 256M per vm worker unless told otherwise
+        demand['mem'] = int(vm_workers) * _parse_megabytes(_option_value(cmd, '--vm-bytes') or '256M')
+    fork_workers = _option_value(cmd, '--fork')
+    if fork_workers is not None:
+        demand['processes'] = float(fork_workers)
+    return demand
+
+
+def scale_cmd(cmd, factor):
+    """
+    Return a copy of a stress-ng command with its load scaled by the given factor
+    """
+    cmd = list(cmd)
+    if '--cpu-load' in cmd:
+        index = cmd.index('--cpu-load') + 1
+        cmd[index] = str(float(cmd[index]) * factor)
+    if '--vm-bytes' in cmd:
+        index = cmd.index('--vm-bytes') + 1
+        cmd[index] = str(_parse_megabytes(cmd[index]) * factor) + "M"
+    if '--fork' in cmd:
+        index = cmd.index('--fork') + 1
+        cmd[index] = str(max(int(int(cmd[index]) * factor), 1))
+    return cmd
+
+
+class ResourceArbiter:
+    """
+    Shared load budget for drift timelines that run concurrently in one scheduler.
+    Every command reserves its estimated demand before it is started and gives it back when it exits,
+    so the drifts of all metrics together never push the host past the configured ceilings.
+    """
+
+    def __init__(self, budget, cpu_count=None):
+        """
+        :param budget (dict): The load each resource may still take on top of the host baseline.
+        :param cpu_count (int or None): Number of CPUs of the host, the local one by default.
+        """
+        self.budget = budget
+        self.cpu_count = cpu_count
+        self.reserved = dict.fromkeys(RESOURCES, 0.0)
+        self.logger = setup_logger("arbiter")
+        self._condition = None
+
+    @classmethod
+    def from_config(cls, cpu_count=None, total_mem=None):
+        """
+        Create an arbiter whose budget is the configured ceilings minus the current host usage
+        """
+        total_mem = total_mem or get_total_memory()
+        ceilings = {
+            'cpu': config_arbiter['cpu_ceiling_percentage'],
+            'mem': total_mem * config_arbiter['mem_ceiling_percentage'] / 100,
+            'processes': config_arbiter['processes_ceiling'],
+        }
+        baseline = {
+            'cpu': get_current_cpu_utilization(),
+            'mem': get_current_memory_utilization(),
+            'processes': get_current_processes_num(),
+        }
+        budget = {key: max(ceilings[key] - baseline[key], 0.0) for key in RESOURCES}
+        return cls(budget, cpu_count)
+
+    def fit(self, cmd):
+        """
+        Scale a command down when its demand alone exceeds the budget
+        """
+        demand = estimate_demand(cmd, self.cpu_count)
+        factor = 1.0
+        for key in RESOURCES:
+            if demand[key] > self.budget[key]:
+                factor = min(factor, self.budget[key] / demand[key])
+        if factor < 1.0:
+            self.logger.warning(f"Command {cmd} exceeds the load budget, scaled by {factor:.2f}")
+            cmd = scale_cmd(cmd, factor)
+        return cmd
+
+    def _fit_factor(self, demand):
+        # Share of the demand that the remaining budget can still hold
+        factor = 1.0
+        for key in RESOURCES:
+            if demand[key] > 0:
+                factor = min(factor, max(self.budget[key] - self.reserved[key], 0.0) / demand[key])
+        return factor
+
+    def _get_condition(self):
+        # Created lazily so that it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self, cmd):
+        """
+        Reserve the demand of a command before it is started.
+        A command that does not fit is scaled down to the remaining budget as long as min_share of it
+        still fits, otherwise it waits up to max_wait_seconds for other commands to release their load.
+        :param cmd (list): The command about to be started.
+        :return:
+            list: The command to start, scaled down when needed.
+            dict: The reserved demand, to be handed back to release.
+        :raises BudgetExceeded: The command could not be fitted in time.
+        """
+        cmd = self.fit(cmd)
+        condition = self._get_condition()
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + config_arbiter['max_wait_seconds']
+        async with condition:
+            while True:
+                demand = estimate_demand(cmd, self.cpu_count)
+                factor = self._fit_factor(demand)
+                if factor >= 1.0 - 1e-9:
+                    break
+                if factor >= config_arbiter['min_share']:
+                    self.logger.info(f"Command {cmd} scaled by {factor:.2f} to the remaining load budget")
+                    cmd = scale_cmd(cmd, factor)
+                    demand = estimate_demand(cmd, self.cpu_count)
+                    break
+                remaining = deadline - loop.time()
+                if remaining > 0:
+                    self.logger.info(f"Waiting for load budget: reserved {self.reserved}, requested {demand}")
+                    try:
+                        await asyncio.wait_for(condition.wait(), remaining)
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+                raise BudgetExceeded(f"No load budget for {cmd}: reserved {self.reserved}, "
+                                     f"budget {self.budget}")
+            for key in RESOURCES:
+                self.reserved[key] += demand[key]
+        return cmd, demand
+
+    async def release(self, demand):
+        """
+        Give the demand of an exited command back to the budget
+        """
+        condition = self._get_condition()
+        async with condition:
+            for key in RESOURCES:
+                self.reserved[key] = max(self.reserved[key] - demand[key], 0.0)
+            condition.notify_all()
@@ -1,16 +1,22 @@
 import random
-import yaml
-from core.toolkit.tools import get_current_cpu_available
-
-with open('config/cpu_config.yaml', 'r') as file:
-    config = yaml.safe_load(file)
-
-shell_gen = config['settings']['shell_gen']
+from core.toolkit.config import get_config
+from core.toolkit.tools import host_share
 
 
 class CpuCmdGenerator:
-    def __init__(self):
-        self._script_prefix = shell_gen['command_prefix']
+    def __init__(self, backend=None):
+        # Read on creation, the scheduler creates a new generator when config/cpu_config.yaml is reloaded
+        config = get_config('cpu')
+        shell_gen = config['settings']['shell_gen']
+        config_engine = config['settings']['engine']
+        # stress-ng commands, or pseudo-commands served by the in-process CpuLoadEngine
+        self.backend = backend or shell_gen['backend']
+        if self.backend == 'stress-ng':
+            self._script_prefix = shell_gen['command_prefix']
+        elif self.backend == 'engine':
+            self._script_prefix = config_engine['command_prefix']
+        else:
+            raise ValueError(f"Unknown CPU backend {self.backend}")
         self._sudden_load_scale = shell_gen['sudden_cpu_variation_range_percentage'][0]
         self._blip_load_scale = shell_gen['blip_cpu_variation_range_percentage'][0]
         self._recurrent_load_scale = shell_gen['recurrent_cpu_variation_range_percentage'][0]
@@ -38,16 +44,13 @@ class CpuCmdGenerator:
     def generate_sub_script(self, num_events):
         events = [random.choice(["Blip", "Recurrent"]) for _ in range(num_events)]
         cmds = []
-        # 获取当前可用的load
-        available_cpu = get_current_cpu_available()
         for event in events:
             timeout = random.uniform(30, 40) if event == "Blip" else random.uniform(120, 180)
-
+            # 命令启动时可用CPU的80%到100%
+            load = host_share('cpu_available', random.uniform(0.8, 1.0))
             if event == "Blip":
-                load = str(random.uniform((available_cpu * 4) / 5, available_cpu))
                 cmd, _, _ = self._generate_blip_script(timeout, load)
             else:
-                load = str(random.uniform((available_cpu * 4) / 5, available_cpu))
                 cmd, _, _ = self._generate_recurrent_script(timeout, load)
             cmds.append(cmd[0])
         return cmds, events
@@ -77,7 +80,7 @@ class CpuCmdGenerator:
         It is important to note that the timeout for blip should not be too large,
         and is generally recommended to have a relatively small duration paired with a higher CPU configuration value.
         :param timeout（int）: The timeout value for the blip drift
-        :param load (int or None): The CPU load for the blip drift.
+        :param load (int or str or None): The CPU load for the blip drift, or a host share of the available CPU.
         :return:
             list: A list containing the generated command for the blip drift.
             None: This function does not have any duration.
@@ -101,7 +104,7 @@ class CpuCmdGenerator:
         and is generally recommended to have a relatively moderate duration paired
         with an appropriate CPU configuration value.
         :param timeout (int): The timeout value for the recurrent script.
-        :param load (int or None): The CPU load for the recurrent script.
+        :param load (int or str or None): The CPU load for the recurrent script, or a host share of the available CPU.
         :return:
             list: A list containing the generated command for the recurrent script.
             None: This function does not have any specific return duration.
@@ -0,0 +1,175 @@
+import asyncio
+import atexit
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from core.toolkit.config import get_config
+from core.toolkit.tools import parse_stress_duration
+
+config = get_config('cpu')
+
+config_engine = config['settings']['engine']
+
+# First word of the pseudo-commands served by the engine instead of stress-ng
+ENGINE_COMMAND = config_engine['command_prefix'][0]
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def _duty_cycle_worker(conn, cpu, period):
+    """
+    Worker process: spin for duty * period, sleep for the rest of the period, and take a new duty
+    from the control pipe whenever one arrives. None stops the worker.
+    """
+    if cpu is not None and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError:
+            pass
+    duty = 0.0
+    while True:
+        # Block on the pipe while idle, otherwise only look at it once per period
+        if conn.poll(None if duty <= 0 else 0):
+            message = conn.recv()
+            if message is None:
+                return
+            duty = message
+            continue
+        begin = time.perf_counter()
+        busy_until = begin + period * duty
+        while time.perf_counter() < busy_until:
+            pass
+        rest = begin + period - time.perf_counter()
+        if rest > 0:
+            time.sleep(rest)
+
+
+def is_engine_cmd(cmd):
+    return len(cmd) > 0 and cmd[0] == ENGINE_COMMAND
+
+
+class CpuLoadEngine:
+    """
+    In-process alternative to stress-ng for CPU drifts.
+    A fixed pool of worker processes, each pinned to one CPU, runs a busy/sleep duty cycle. The load of
+    every running command is added up and sent to the workers over their control pipes, so a new drift
+    step only retargets the pool instead of starting new processes.
+    """
+
+    def __init__(self, workers=None, period=None):
+        """
+        :param workers (int): Number of worker processes, like the -c option of stress-ng.
+        :param period (float): Length of one busy/sleep cycle in seconds.
+        """
+        self.workers = workers if workers is not None else config_engine['workers']
+        self.period = period if period is not None else config_engine['period_seconds']
+        self.load = 0.0
+        self._processes = []
+        self._pipes = []
+        self._lock = threading.Lock()
+        self._lease_ids = itertools.count(1)
+
+    def start(self):
+        cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else [None]
+        for i in range(self.workers):
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_duty_cycle_worker, name=f"cpu-engine-{i}", daemon=True,
+                                              args=(child_conn, cpus[i % len(cpus)], self.period))
+            process.start()
+            self._processes.append(process)
+            self._pipes.append(parent_conn)
+        return self
+
+    @property
+    def pids(self):
+        return [process.pid for process in self._processes]
+
+    def set_load(self, load):
+        """
+        Retarget the workers to the given load, in percent of one CPU per worker
+        """
+        with self._lock:
+            self.load = max(load, 0.0)
+            duty = min(self.load, 100.0) / 100
+            for conn in self._pipes:
+                conn.send(duty)
+
+    def add_load(self, load):
+        with self._lock:
+            load = self.load + load
+        self.set_load(load)
+
+    def lease(self, cmd):
+        """
+        Hold the load of an engine command until its timeout expires or it is terminated
+        """
+        cpu_load = float(cmd[cmd.index('--cpu-load') + 1]) if '--cpu-load' in cmd else 100.0
+        timeout = parse_stress_duration(cmd[cmd.index('--timeout') + 1]) if '--timeout' in cmd else None
+        return EngineLease(self, next(self._lease_ids), cpu_load, timeout)
+
+    def stop(self):
+        for conn in self._pipes:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self._processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.kill()
+        self._processes, self._pipes = [], []
+        self.load = 0.0
+
+
+class EngineLease:
+    """
+    Handle of the load one engine command holds, with the interface of an asyncio subprocess
+    """
+
+    def __init__(self, engine, lease_id, load, timeout=None):
+        self.lease_id = lease_id
+        self.returncode = None
+        self._engine = engine
+        self._load = load
+        self._done = asyncio.Event()
+        self._timer = None
+        engine.add_load(load)
+        if timeout is not None:
+            self._timer = asyncio.get_event_loop().call_later(timeout, self._finish, 0)
+
+    def _finish(self, returncode):
+        if self.returncode is not None:
+            return
+        self.returncode = returncode
+        self._engine.add_load(-self._load)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._done.set()
+
+    async def wait(self):
+        await self._done.wait()
+        return self.returncode
+
+    def send_signal(self, sig):
+        self._finish(-sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+def get_engine():
+    # Start the shared CPU load engine on first use
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = CpuLoadEngine().start()
+            atexit.register(_engine.stop)
+    return _engine
@@ -1,15 +1,29 @@
+import bisect
 import random
+import numpy as np
 import yaml
-from typing import Dict, Union, List, Tuple
+from typing import Dict, Union, List, Tuple, Optional, Sequence
+
+from core.toolkit.config import get_config
+
+# One drawn drift event: indices into drift_category and drift_mode, the duration of Blip and Recurrent drifts
+# (-1 otherwise), the steps and seconds per step of Incremental drifts and the sequence length of Gradual drifts
+# (0 otherwise)
+DRIFT_DTYPE = np.dtype([('type', np.int8), ('mode', np.int8), ('duration', np.float64), ('steps', np.int32),
+                        ('step_seconds', np.int32), ('sequence_length', np.int32)])
 
 class DriftGenerator:
-    def __init__(self, config_path: str):
+    def __init__(self, config_path: Optional[str] = None):
         """
         Initialize DriftGenerator with configurations.
-        :param config_path: Path to the configuration YAML file.
+        :param config_path: Path to the configuration YAML file, the shared snapshot of
+            config/generator_config.yaml by default.
         """
-        with open(config_path, 'r') as file:
-            config = yaml.safe_load(file)
+        if config_path is None:
+            config = get_config('generator')
+        else:
+            with open(config_path, 'r') as file:
+                config = yaml.safe_load(file)
 
         self._drift_gen = config['settings']['drift_gen']
         self._drift_types = self._drift_gen['drift_category']
@@ -17,6 +31,8 @@ class DriftGenerator:
         self.increment_amount = self._drift_gen['incremental'][0]
         self.gradual_amount = self._drift_gen['gradual'][0]
         self.each_incremental_duration = self._drift_gen['incremental'][1]
+        self.type_weights = self._drift_gen.get('type_weights')
+        self.transition_matrix = self._drift_gen.get('transition_matrix')
 
     def generate_drift_parameters(self) -> Dict[str, Union[str, float, Tuple]]:
         """
@@ -81,21 +97,133 @@ class DriftGenerator:
         """
         return random.choice(self._drift_modes)
 
-    def _process_increment_or_gradual_duration(self, drift_type: str) -> List[int]:
+    def _process_increment_or_gradual_duration(self, drift_type: str) -> List:
         """
-        Generate a sequence of durations for Incremental and Gradual drift types.
+        Generate the shape of Incremental and Gradual drift types.
+        For Incremental the shape is the number of steps and the seconds between them,
+        for Gradual it is the increasing and decreasing duration sequences.
         :param drift_type: Type of drift.
-        :return: List containing duration sequences.
+        :return: List containing the shape.
         """
-        amount_config = self.increment_amount if drift_type == "Incremental" else self.gradual_amount
+        if drift_type == "Incremental":
+            num_transition = random.randint(self.increment_amount['amount_lower_bound'],
+                                            self.increment_amount['amount_higher_bound'])
+            duration_transition = random.randint(self.each_incremental_duration['time_fragment_lower_seconds'],
+                                                 self.each_incremental_duration['time_fragment_higher_seconds'])
+            return [num_transition, duration_transition]
+        amount_config = self.gradual_amount
         sequence_length = random.randint(amount_config['time_fragment_lower_seconds'],
                                          amount_config['time_fragment_higher_seconds'])
         increasing_sequence = list(range(1, sequence_length + 1))
         decreasing_sequence = list(range(sequence_length, 0, -1))
         return [increasing_sequence, decreasing_sequence]
 
+    def generate_batch(self, n: int, seed: Optional[int] = None, weights: Optional[Sequence[float]] = None,
+                       transition_matrix: Optional[Sequence[Sequence[float]]] = None) -> np.ndarray:
+        """
+        Draw the parameters of n drift events at once, reproducibly from the seed.
+        The types are drawn with the weights, or, with a transition matrix, as a Markov chain whose first type
+        is drawn with the weights and each next type from the row of the type before it.
+        :param n: Number of events.
+        :param seed: Seed of the NumPy generator, None for a fresh one.
+        :param weights: Weight of every drift type, in drift_category order. Defaults to type_weights of the
+            configuration, or equal weights.
+        :param transition_matrix: Row i holds the weights of the type following type i. Defaults to
+            transition_matrix of the configuration, or independent draws.
+        :return: A DRIFT_DTYPE array of n events, see to_parameters for the dict of one event.
+        """
+        if set(self._drift_types) - {"Sudden", "Blip", "Recurrent", "Incremental", "Gradual"}:
+            raise ValueError("Unknown drift type")
+        rng = np.random.default_rng(seed)
+        count = len(self._drift_types)
+        probabilities = self._normalize(weights if weights is not None else self.type_weights, count)
+        matrix = transition_matrix if transition_matrix is not None else self.transition_matrix
+        if matrix is None:
+            types = rng.choice(count, size=n, p=probabilities)
+        else:
+            if len(matrix) != count:
+                raise ValueError(f"The transition matrix needs {count} rows, one per drift type")
+            types = self._markov_chain(rng.random(n), probabilities, [self._normalize(row, count) for row in matrix])
+
+        batch = np.zeros(n, dtype=DRIFT_DTYPE)
+        batch['type'] = types
+        batch['mode'] = rng.integers(0, len(self._drift_modes), size=n)
+        batch['duration'] = -1
+        # Every parameter is drawn for all events, then kept for the types it belongs to
+        for drift_type in ("Blip", "Recurrent"):
+            scale = self._drift_gen[drift_type.lower()][0]
+            durations = rng.uniform(scale['duration_lower_bound_seconds'], scale['duration_higher_bound_seconds'], n)
+            selected = self._type_mask(types, drift_type)
+            batch['duration'][selected] = durations[selected]
+        selected = self._type_mask(types, "Incremental")
+        steps = rng.integers(self.increment_amount['amount_lower_bound'],
+                             self.increment_amount['amount_higher_bound'], size=n, endpoint=True)
+        step_seconds = rng.integers(self.each_incremental_duration['time_fragment_lower_seconds'],
+                                    self.each_incremental_duration['time_fragment_higher_seconds'], size=n,
+                                    endpoint=True)
+        batch['steps'][selected], batch['step_seconds'][selected] = steps[selected], step_seconds[selected]
+        selected = self._type_mask(types, "Gradual")
+        lengths = rng.integers(self.gradual_amount['time_fragment_lower_seconds'],
+                               self.gradual_amount['time_fragment_higher_seconds'], size=n, endpoint=True)
+        batch['sequence_length'][selected] = lengths[selected]
+        return batch
+
+    def to_parameters(self, event: np.void) -> Dict[str, Union[str, float, Tuple]]:
+        """
+        The generate_drift_parameters dict of one event drawn by generate_batch.
+        :param event: One element of a DRIFT_DTYPE array.
+        :return: Dictionary containing drift parameters.
+        """
+        drift_type = self._drift_types[event['type']]
+        shape = None
+        if drift_type == "Incremental":
+            shape = [int(event['steps']), int(event['step_seconds'])]
+        elif drift_type == "Gradual":
+            length = int(event['sequence_length'])
+            shape = [list(range(1, length + 1)), list(range(length, 0, -1))]
+        duration = float(event['duration']) if drift_type in ["Blip", "Recurrent"] else -1
+        return {"type": drift_type, "duration": duration, "shape": shape, "mode": self._drift_modes[event['mode']]}
+
+    def _type_mask(self, types: np.ndarray, drift_type: str) -> np.ndarray:
+        if drift_type not in self._drift_types:
+            return np.zeros(len(types), dtype=bool)
+        return types == self._drift_types.index(drift_type)
+
+    @staticmethod
+    def _normalize(weights: Optional[Sequence[float]], count: int) -> np.ndarray:
+        """
+        Probabilities of the weights, equal ones for None.
+        """
+        if weights is None:
+            return np.full(count, 1 / count)
+        weights = np.asarray(weights, dtype=float)
+        if weights.shape != (count,) or (weights < 0).any() or weights.sum() <= 0:
+            raise ValueError(f"Expected {count} non-negative weights with a positive sum, got {weights.tolist()}")
+        return weights / weights.sum()
+
+    @staticmethod
+    def _markov_chain(uniforms: np.ndarray, initial: np.ndarray, rows: List[np.ndarray]) -> np.ndarray:
+        """
+        Types of a Markov chain drawn by inverting the cumulative rows with the uniforms. Each step depends on the
+        one before it, so this is the only loop of generate_batch, over plain lists with bisect.
+        """
+        last = len(initial) - 1
+        cumulative = [np.cumsum(row).tolist() for row in rows]
+        types = np.empty(len(uniforms), dtype=np.int64)
+        if len(uniforms) == 0:
+            return types
+        state = min(bisect.bisect_right(np.cumsum(initial).tolist(), uniforms[0]), last)
+        chain = [state]
+        for u in uniforms[1:].tolist():
+            state = min(bisect.bisect_right(cumulative[state], u), last)
+            chain.append(state)
+        types[:] = chain
+        return types
+
 # Example usage:
 if __name__ == "__main__":
-    generator = DriftGenerator('config/generator_config.yaml')
+    generator = DriftGenerator()
     parameters = generator.generate_drift_parameters()
     print(parameters)
+    batch = generator.generate_batch(5, seed=1)
+    print([generator.to_parameters(event) for event in batch])
@@ -0,0 +1,181 @@
+import asyncio
+import datetime
+import gzip
+import json
+import random
+
+from core.generator import DriftGenerator
+from core.scheduler import AsyncScheduler, config_steady_state, create_cmd_generator
+from core.timeline import composite_label
+from core.toolkit.tools import get_timeout_from_cmd, parse_stress_duration
+
+PLAN_VERSION = 1
+
+
+class Planner:
+    """
+    Compiles a whole campaign into a timeline of drift events before anything runs.
+    Every event holds its absolute offset from the start of the campaign, its commands, all the waits
+    the scheduler would otherwise draw at run time, and the label windows it is expected to produce.
+    """
+
+    def __init__(self, metrics, seed=None):
+        self.metrics = list(metrics)
+        self.seed = seed
+
+    def compile(self, days):
+        """
+        Compile the events of every metric for the given number of days.
+        :param days (float): Length of the campaign in days.
+        :return:
+            dict: The plan, with its events sorted by offset.
+        """
+        horizon = days * 86400
+        events = []
+        for metric in self.metrics:
+            scheduler = AsyncScheduler(metric)
+            if self.seed is not None:
+                random.seed(f"{self.seed}-{metric}")
+            dg = DriftGenerator()
+            sg = create_cmd_generator(metric)
+            offset = 0.0
+            while offset < horizon:
+                event = self._plan_event(scheduler, dg, sg, offset)
+                events.append(event)
+                offset = event['end'] + scheduler.draw_event_interval()
+        events.sort(key=lambda e: e['offset'])
+        return {
+            'version': PLAN_VERSION,
+            'created': datetime.datetime.now().isoformat(),
+            'seed': self.seed,
+            'metrics': self.metrics,
+            'horizon': horizon,
+            'events': events,
+        }
+
+    @staticmethod
+    def _plan_event(scheduler, dg, sg, offset):
+        """
+        Draw one main event and estimate its label windows, using the detection window of
+        _get_end_time as the settling time of a father drift
+        """
+        event = scheduler.draw_event(dg, sg)
+        event.update(metric=scheduler.metric, offset=offset)
+        drift_type, cmds, duration = event['type'], event['cmds'], event['duration']
+        settle = config_steady_state['window_seconds']
+        expected = []
+        if drift_type in ["Sudden", "Incremental", "Gradual"]:
+            t = offset
+            if drift_type == "Sudden":
+                label_end = father_end = t + settle
+            elif drift_type == "Incremental":
+                label_end = father_end = t + len(cmds) * duration + settle
+            else:
+                for i, cmd in enumerate(cmds[:-1]):
+                    t += parse_stress_duration(cmd[cmd.index('--timeout') + 1]) + duration[i]
+                label_end = t + settle
+                father_end = label_end + duration[-1]
+            expected.append([drift_type, offset, label_end])
+            if event['mode'] == 'transmitted drift':
+                event['father_sub_interval'] = scheduler.father_sub_interval
+                sub_cmds, sub_events = sg.generate_sub_script(scheduler.draw_num_sub_events())
+                sub_intervals = [scheduler.draw_sub_interval() for _ in sub_cmds]
+                event.update(sub_cmds=sub_cmds, sub_events=sub_events, sub_intervals=sub_intervals)
+                t = father_end + event['father_sub_interval']
+                for cmd, sub_event, interval in zip(sub_cmds, sub_events, sub_intervals):
+                    timeout = get_timeout_from_cmd(cmd)
+                    expected.append([sub_event, t, t + timeout])
+                    t += timeout + interval
+            else:
+                event['span'] = scheduler.draw_span()
+                t = father_end + event['span']
+            end = t
+            event['overlays'] = Planner._plan_overlays(scheduler, sg, drift_type, father_end, end, expected)
+            expected.append(["Sudden", t, t])
+            expected.sort(key=lambda window: window[1])
+        else:
+            timeout = get_timeout_from_cmd(cmds[0])
+            expected.append([drift_type, offset, offset + timeout])
+            end = offset + timeout
+        event.update(expected=expected, end=end)
+        return event
+
+    @staticmethod
+    def _plan_overlays(scheduler, sg, drift_type, begin, end, expected):
+        """
+        Place overlays on a settled base drift between begin and end, clear of its sub-drift windows,
+        and add their composite labels to the expected windows
+        """
+        busy = [(start, stop) for _, start, stop in expected[1:]]
+        overlays = []
+        t = begin + scheduler.draw_overlay_interval()
+        while True:
+            cmds, sub_events = sg.generate_sub_script(1)
+            timeout = get_timeout_from_cmd(cmds[0])
+            if t + timeout > end:
+                break
+            clashes = [stop for start, stop in busy if start < t + timeout and t < stop]
+            if clashes:
+                t = max(clashes) + scheduler.draw_overlay_interval()
+                continue
+            overlays.append({'type': sub_events[0], 'offset': t, 'cmds': cmds, 'duration': None, 'load': None})
+            expected.append([composite_label([drift_type], sub_events[0]), t, t + timeout])
+            t += timeout + scheduler.draw_overlay_interval()
+        return overlays
+
+
+def shard_plan(plan, index, count):
+    """
+    Keep every count-th event of each metric, starting at index, so that count hosts share one plan
+    """
+    events, seen = [], {}
+    for event in plan['events']:
+        position = seen.get(event['metric'], 0)
+        seen[event['metric']] = position + 1
+        if position % count == index:
+            events.append(event)
+    return dict(plan, events=events, shard=[index, count])
+
+
+def save_plan(plan, file_path):
+    """
+    Write a plan as gzip compressed JSON
+    """
+    with gzip.open(file_path, 'wt', encoding='utf-8') as file:
+        json.dump(plan, file, separators=(',', ':'))
+    return file_path
+
+
+def load_plan(file_path):
+    with gzip.open(file_path, 'rt', encoding='utf-8') as file:
+        plan = json.load(file)
+    if plan.get('version') != PLAN_VERSION:
+        raise ValueError(f"Unsupported plan version {plan.get('version')}")
+    return plan
+
+
+async def play_events(scheduler, events, origin=None):
+    """
+    Play back the events of the scheduler metric at their offsets from origin, the current loop time by default.
+    Nothing is generated on the way, the timeline of the scheduler defers an event while the previous one still runs.
+    """
+    origin = origin if origin is not None else asyncio.get_event_loop().time()
+    scheduler.origin = origin
+    for event in events:
+        if event['metric'] == scheduler.metric:
+            scheduler.timeline.push(origin + event['offset'], event)
+    await scheduler.run_timeline()
+
+
+class PlanExecutor(AsyncScheduler):
+    """
+    AsyncScheduler that plays back the events of its metric from a plan instead of drawing them
+    """
+
+    def __init__(self, metric, events, origin=None, arbiter=None):
+        super().__init__(metric, arbiter)
+        self.events = events
+        self.origin = origin
+
+    async def start(self):
+        await play_events(self, self.events, self.origin)
@@ -1,17 +1,15 @@
 import random
 
-import yaml
 
-from core.toolkit.tools import get_available_processes_num
-
-with open('config/processes_config.yaml', 'r') as file:
-    config = yaml.safe_load(file)
-
-shell_gen = config['settings']['shell_gen']
+from core.toolkit.config import get_config
+from core.toolkit.tools import host_share
 
 
 class ProcessesGenerator:
     def __init__(self):
+        # Read on creation, the scheduler creates a new generator when config/processes_config.yaml is reloaded
+        shell_gen = get_config('processes')['settings']['shell_gen']
+        self._time_scale = shell_gen['time_scale']
         self._cmd_prefix = shell_gen['command_prefix']
         self.sudden_load_scale = shell_gen['sudden_thread_variation_range_percentage'][0]
         self.blip_load_scale = shell_gen['blip_thread_variation_range_percentage'][0]
@@ -77,16 +75,15 @@ class ProcessesGenerator:
         """
         Generate commands for Sudden type drift.
         This function generates commands for the Sudden type drift.
-        It calculates the memory load based on the available processes and the configured scale.
+        The number of fork workers is a share, within the configured scale, of the processes available
+        when the command starts.
         :return:
             list: A list containing the generated commands for the Sudden type drift.
             None: None (duration is not applicable for Sudden type drift).
-            int: The total memory load for the Sudden type drift.
+            str: The number of fork workers for the Sudden type drift, as a host share.
         """
-        available_process = get_available_processes_num()
-        upper = int(available_process * self.sudden_load_scale['higher'])
-        lower = int(available_process * self.sudden_load_scale['lower'])
-        fork_num = str(random.randint(lower, upper))
+        fork_num = host_share('processes_available', random.uniform(self.sudden_load_scale['lower'],
+                                                                    self.sudden_load_scale['higher']))
         command = self._cmd_prefix.copy()
         command.extend([fork_num])
         return [command], None, fork_num
@@ -95,20 +92,17 @@ class ProcessesGenerator:
         """
         Generate commands for Blip type drift.
         This function generates commands for the Blip type drift.
-        It calculates the memory load based on the available processes and the configured scale.
+        The number of fork workers is at least 5 plus a share, up to the configured scale, of the processes
+        available when the command starts; a sub-drift starts 15 more.
         :param timeout (int): The timeout duration for the Blip type drift.
         :param mode (str): The mode of the drift, either 'sub' for sub-drift or None for main drift.
         :return:
             list: A list containing the generated commands for the Blip type drift.
             None: None (duration is not applicable for Blip type drift).
-            int: The total memory load for the Blip type drift.
+            str: The number of fork workers for the Blip type drift, as a host share.
         """
-        available_processes_num = get_available_processes_num()
-        if mode is None:
-            upper = int(available_processes_num * self.blip_load_scale['higher'])
-        else:
-            upper = int(available_processes_num * self.blip_load_scale['higher']) + 20
-        fork_num = str(random.randint(5, upper))
+        share = random.uniform(0, self.blip_load_scale['higher'])
+        fork_num = host_share('processes_available', share, 5 if mode is None else 20)
         command = self._cmd_prefix.copy()
         command.extend([fork_num, "--timeout", str(timeout)])
         return [command], None, fork_num
@@ -117,17 +111,66 @@ class ProcessesGenerator:
         """
         Generate commands for Recurrent type drift.
         This function generates commands for the Recurrent type drift.
-        It calculates the memory load based on the available processes and the configured scale.
+        The number of fork workers is a share, within the configured scale, of the processes available
+        when the command starts; a sub-drift starts 30 more.
         :param timeout (int): The timeout duration for the Recurrent type drift.
         :param mode (str): The mode of the drift, either 'sub' for sub-drift or None for main drift.
         :return:
             list: A list containing the generated commands for the Recurrent type drift.
             None: None (duration is not applicable for Recurrent type drift).
-            int: The total memory load for the Recurrent type drift.
+            str: The number of fork workers for the Recurrent type drift, as a host share.
         """
-        available_processes_num = get_available_processes_num()
-        if mode is None:
-            upper = int(available_processes_num * self.recurrent_load_scale['higher'])
-            lower = int(available_processes_num * self.recurrent_load_scale['lower'])
-        else:
-            upper = int(available_processes_num * self.recurrent_load_scale['higher']) + 40
+        share = random.uniform(self.recurrent_load_scale['lower'], self.recurrent_load_scale['higher'])
+        fork_num = host_share('processes_available', share, 0 if mode is None else 30)
+        command = self._cmd_prefix.copy()
+        command.extend([fork_num, "--timeout", str(timeout)])
+        return [command], None, fork_num
+
+    def _generate_incremental_script(self, shape):
+        """
+        Generate commands for Incremental type drift.
+        This function generates commands for the Incremental type drift.
+        The total number of fork workers is split evenly over the transitions, so that stacking
+        the commands one after another raises the number of processes step by step.
+        :param shape (tuple): A tuple containing the number of transitions and their durations.
+        :return:
+            list: A list containing the generated commands for the Incremental type drift.
+            int: The duration of each transition.
+            str: The total number of fork workers for the Incremental type drift, as a host share.
+        """
+        share = random.uniform(self.incremental_load_scale['lower'], self.incremental_load_scale['higher'])
+        num_transition = shape[0]
+        duration_transition = shape[1]
+        average_fork = host_share('processes_available', share / num_transition)
+        commands = []
+        for i in range(num_transition):
+            command = self._cmd_prefix.copy()
+            command.extend([average_fork])
+            commands.append(command)
+        return commands, duration_transition, host_share('processes_available', share)
+
+    def _generate_gradual_script(self, shape):
+        """
+        Generate commands for Gradual type drift.
+        This function generates commands for the Gradual type drift.
+        The same number of fork workers is switched on and off with growing timeouts and shrinking pauses,
+        the last command has no timeout and keeps the new distribution.
+        :param shape (tuple): A tuple containing the duration for each stage and the sleep times.
+        :return:
+            list: A list containing the generated commands for the Gradual type drift.
+            list: A list containing the sleep times for each stage.
+            str: The number of fork workers for the Gradual type drift, as a host share.
+        """
+        fork_num = host_share('processes_available', random.uniform(self.gradual_load_scale['lower'],
+                                                                    self.gradual_load_scale['higher']))
+        scale = random.choice(self._time_scale)
+        timeout_list = [i * scale for i in shape[0]]
+        sleep_list = [i * scale for i in shape[1]]
+        commands = []
+        for i in range(len(timeout_list)):
+            command = self._cmd_prefix.copy()
+            command.extend([fork_num])
+            if i != len(timeout_list) - 1:
+                command.extend(["--timeout", str(timeout_list[i]) + "s"])
+            commands.append(command)
+        return commands, sleep_list, fork_num
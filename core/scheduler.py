@@ -1,30 +1,98 @@
-import concurrent.futures
+import asyncio
+import contextvars
 import datetime
-import os
 import random
-import signal
-import subprocess
+import threading
 import time
-import yaml
 
+from core.arbiter import ResourceArbiter, estimate_demand, scale_cmd
 from core.cpu.cmd_factory import CpuCmdGenerator
+from core.cpu.load_engine import get_engine, is_engine_cmd
 from core.generator import DriftGenerator
 from core.mem.cmd_factory import MemCmdGenerator
 from core.processes.cmd_factory import ProcessesGenerator
+from core.timeline import EventTimeline, composite_label
+from core.toolkit.collector import MetricCollector, config_collector
+from core.toolkit.config import get_config, registry
+from core.toolkit.controller import LoadController, config_controller, create_driver
+from core.toolkit.detector import SteadyStateDetector
 from core.toolkit.logger import setup_logger
-from core.toolkit.pools import perform_insert
-from core.toolkit.tools import (get_timeout_from_cmd, get_current_cpu_utilization,
-                                get_current_memory_utilization, get_current_processes_num)
+from core.toolkit.sinks import perform_insert
+from core.toolkit.supervisor import get_supervisor, run_supervised
+from core.toolkit.waveform import WaveformLoad, config_waveform, gradual_waveform, incremental_waveform
+from core.toolkit.tools import (get_timeout_from_cmd, get_current_cpu_utilization, get_sampler,
+                                get_current_memory_utilization, get_current_processes_num, parse_stress_duration,
+                                resolve_cmd, resolve_host_share)
 
-# Load configuration information
-with open('config/scheduler_config.yaml', 'r') as file:
-    config = yaml.safe_load(file)
+config = get_config('scheduler')
 
 config_scheduler = config['settings']['scheduler']
+config_steady_state = config['settings']['steady_state']
+config_reload = get_config('toolkit')['settings']['config_reload']
 
+METRICS = ('cpu', 'mem', 'processes')
+# (scheduler, settings) of the event running in the current task, captured when the event starts
+_event_settings = contextvars.ContextVar('event_settings', default=None)
+# Sampler column followed by the end time detection of each metric
+METRIC_COLUMNS = {'cpu': 'cpu', 'mem': 'mem_used', 'processes': 'processes'}
 
-class Scheduler:
-    def __init__(self, metric):
+
+def create_cmd_generator(metric):
+    """
+    Initialize the appropriate command generator based on the metric
+    """
+    if metric == 'cpu':
+        return CpuCmdGenerator()
+    elif metric == 'mem':
+        return MemCmdGenerator()
+    elif metric == 'processes':
+        return ProcessesGenerator()
+    else:
+        raise ValueError("Unknown metric")
+
+
+class _Setting:
+    """
+    Scheduler setting of the running event, or the current one outside of an event
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        captured = _event_settings.get()
+        settings = captured[1] if captured is not None and captured[0] is instance else instance._settings
+        return settings[self.name]
+
+
+class AsyncScheduler:
+    """
+    Asyncio-native scheduler core.
+    Every wait (timers, child processes, label writes and metric polls) is awaited on the event loop,
+    so a single process can drive several drift timelines concurrently.
+    The events of a metric are started from an EventTimeline, so short drifts can overlay a settled
+    base drift as its compatibility rules allow.
+    """
+    # Main drift interval
+    interval = _Setting()
+    # Sub-drift isolation interval
+    sub_interval = _Setting()
+    # Number of sub-drifts
+    sub_drift = _Setting()
+    # Interval between main and sub-drifts
+    father_sub_interval = _Setting()
+    # Duration of independent drift events
+    new_time_span = _Setting()
+    # Interval between overlays on a settled base drift
+    overlay_interval = _Setting()
+    # Delay before an incompatible event is tried again
+    retry_seconds = _Setting()
+    # End time detection
+    steady_state = _Setting()
+
+    def __init__(self, metric, arbiter=None):
         # Ensure sufficient randomness by using the current time in nanoseconds as seed
         current_time_ns = int(time.time_ns())
         random.seed(current_time_ns)
@@ -32,287 +100,591 @@ class Scheduler:
         # Metric and initialization
         self.metric = metric
         self.sum_event = 0
-        self.logger = setup_logger("scheduler")
-
-        # Main drift interval
-        self.interval = config_scheduler['event_interval'][0]
-        # Sub-drift isolation interval
-        self.sub_interval = config_scheduler['sub_event_interval'][0]
-        # Number of sub-drifts
-        self.sub_drift = config_scheduler['sub_drift'][0]
-        # Interval between main and sub-drifts
-        self.father_sub_interval = config_scheduler['father_sub_interval']
-        # Duration of independent drift events
-        self.new_time_span = config_scheduler['new_distribution_time_span'][0]
+        self.logger = setup_logger(f"scheduler_{metric}")
+        # Shared load budget when several metrics run in one process
+        self.arbiter = arbiter
 
-    def start(self):
-        datetime.datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        dg = DriftGenerator()
+        self.apply_config(get_config('scheduler'))
+        # Configuration snapshots reloaded while running, applied at the next event boundary
+        self._pending_config = {}
+        self._pending_lock = threading.Lock()
 
-        # Initialize the appropriate command generator based on the metric
-        if self.metric == 'cpu':
-            sg = CpuCmdGenerator()
-        elif self.metric == 'mem':
-            sg = MemCmdGenerator()
-        elif self.metric == 'processes':
-            sg = ProcessesGenerator()
-        else:
-            raise ValueError("Unknown metric")
+        self.timeline = EventTimeline()
+        # Closed-loop load: drift commands set the target of a LoadController instead of running open loop
+        self.controlled = metric in config_controller['metrics']
+        self.controller = None
+        # (drift type, tracking report) of every main event run under the controller
+        self.control_reports = []
+        # Long-lived driver of the Incremental and Gradual drifts played as waveforms
+        self.waveform_driver = None
+        # MetricCollector that records the drift labels inline with the samples, when enabled
+        self.collector = None
+        # Loop time the offsets of a plan refer to
+        self.origin = None
+        # Generators of the live timeline, None when events are played back from a plan
+        self._dg = None
+        self._sg = None
 
-        while True:
-            # Generate drift parameters
-            drift_parameters = dg.generate_drift_parameters()
-            drift_type = drift_parameters['type']
-            cmds, duration, load = sg.generate_script(drift_parameters)
-            if drift_type in ["Sudden", "Incremental", "Gradual"]:
-                mode = drift_parameters['mode']
-                if mode == 'transmitted drift':
-                    start_time = self._handle_transmitted_drift(drift_type, cmds, duration, load, sg)
-                else:
-                    span = random.uniform(self.new_time_span['lower'], self.new_time_span['higher'])
-                    start_time = self._handle_independent_drift(drift_type, cmds, duration, load, span)
-                self._handle_final_sudden_drift(start_time)
+    def create_cmd_generator(self):
+        """
+        Initialize the appropriate command generator based on the metric
+        """
+        return create_cmd_generator(self.metric)
+
+    def apply_config(self, snapshot):
+        """
+        Take the intervals and the end time detection settings from a scheduler configuration snapshot.
+        The settings are replaced as a whole, the events already running keep the ones they started with.
+        """
+        settings = snapshot['settings']
+        self._settings = {
+            'interval': settings['scheduler']['event_interval'][0],
+            'sub_interval': settings['scheduler']['sub_event_interval'][0],
+            'sub_drift': settings['scheduler']['sub_drift'][0],
+            'father_sub_interval': settings['scheduler']['father_sub_interval'],
+            'new_time_span': settings['scheduler']['new_distribution_time_span'][0],
+            'overlay_interval': settings['timeline']['overlay_interval'][0],
+            'retry_seconds': settings['timeline']['retry_seconds'],
+            'steady_state': settings['steady_state'],
+        }
+
+    def _on_scheduler_config(self, snapshot):
+        # Called from the configuration watcher thread
+        with self._pending_lock:
+            self._pending_config['scheduler'] = snapshot
+
+    def _on_generator_config(self, snapshot):
+        with self._pending_lock:
+            self._pending_config['generator'] = snapshot
+
+    def _on_metric_config(self, snapshot):
+        with self._pending_lock:
+            self._pending_config[self.metric] = snapshot
+
+    def _apply_pending_config(self):
+        """
+        Apply the configuration reloaded since the last event boundary to the events that start from now on.
+        The events still running keep the settings they captured when they started, see run_event
+        """
+        if not self._pending_config:
+            return
+        with self._pending_lock:
+            pending, self._pending_config = self._pending_config, {}
+        if 'scheduler' in pending:
+            self.apply_config(pending['scheduler'])
+        if 'generator' in pending and self._dg is not None:
+            self._dg = DriftGenerator()
+        if self.metric in pending and self._sg is not None:
+            self._sg = self.create_cmd_generator()
+        self.logger.info(f"Applied the reloaded {' and '.join(sorted(pending))} configuration")
+
+    async def start(self):
+        self._dg = DriftGenerator()
+        self._sg = self.create_cmd_generator()
+        self.timeline.push(asyncio.get_event_loop().time(), self.draw_event(self._dg, self._sg))
+        await self.run_timeline()
+
+    async def run_timeline(self):
+        """
+        Start the events of the timeline at their time, until no event is left or running.
+        An event that is not compatible with the running drifts is put back retry_seconds later, and an
+        overlay whose base drift has ended is dropped.
+        """
+        loop = asyncio.get_event_loop()
+        running = set()
+
+        def finished(task):
+            running.discard(task)
+            self.timeline.notify()
+
+        registry.subscribe('scheduler', self._on_scheduler_config)
+        registry.subscribe('generator', self._on_generator_config)
+        registry.subscribe(self.metric, self._on_metric_config)
+        try:
+            await self._run_timeline(loop, running, finished)
+        finally:
+            registry.unsubscribe('scheduler', self._on_scheduler_config)
+            registry.unsubscribe('generator', self._on_generator_config)
+            registry.unsubscribe(self.metric, self._on_metric_config)
+
+    async def _run_timeline(self, loop, running, finished):
+        while len(self.timeline) or running:
+            if not len(self.timeline):
+                await self.timeline.wait()
+                continue
+            delay = self.timeline.next_time() - loop.time()
+            if delay > 0:
+                await self.timeline.wait(delay)
+                continue
+            self._apply_pending_config()
+            _, event = self.timeline.pop()
+            if event['mode'] == 'overlay' and not self.timeline.bases():
+                self.logger.info(f"{event['type']} overlay dropped, its base drift has ended")
+                continue
+            if not self.timeline.compatible(event['type']):
+                self.logger.info(f"{event['type']} event deferred, running drifts: "
+                                 f"{[slot.drift_type for slot in self.timeline.active]}")
+                self.timeline.push(loop.time() + self.retry_seconds, event)
+                continue
+            task = asyncio.ensure_future(self._run_timeline_event(event))
+            running.add(task)
+            task.add_done_callback(finished)
+            # Let the event register on the timeline before the next one is checked
+            await asyncio.sleep(0)
+
+    async def _run_timeline_event(self, event):
+        """
+        Run an event of the timeline and, on the live timeline, schedule the one that follows it
+        """
+        loop = asyncio.get_event_loop()
+        begin = self._now().timestamp()
+        try:
+            await self.run_event(event, self._sg)
+        except Exception as e:
+            self.logger.error(f"An unexpected error occurred during {event['type']} event: {e}")
+        if self.controller is not None and event['mode'] != 'overlay':
+            report = self.controller.report(begin, self._now().timestamp())
+            self.control_reports.append((event['type'], report))
+            self.logger.info(f"{event['type']} drift tracking: {report['converged']} of {report['setpoints']} setpoints "
+                             f"converged, convergence {report['convergence_seconds']}s, "
+                             f"steady-state error {report['steady_state_error']}")
+        if event['mode'] == 'overlay':
+            if self._sg is not None:
+                self._push_overlay()
+            return
+        self.sum_event += 1
+        self.logger.info("Generated {} drift events, {} stress processes running".format(
+            self.sum_event, self._get_supervisor().worker_count()))
+        if self._dg is not None:
+            self._apply_pending_config()
+            self.timeline.push(loop.time() + self.draw_event_interval(), self.draw_event(self._dg, self._sg))
+
+    def _push_overlay(self):
+        """
+        Schedule the next overlay of the live timeline while a base drift accepts overlays
+        """
+        if not self.timeline.bases():
+            return
+        cmds, sub_events = self._sg.generate_sub_script(1)
+        overlay = {'type': sub_events[0], 'mode': 'overlay', 'cmds': cmds, 'duration': None, 'load': None}
+        self.timeline.push(asyncio.get_event_loop().time() + self.draw_overlay_interval(), overlay)
+
+    def _schedule_overlays(self, event):
+        """
+        Schedule the overlays of a base drift that just settled, from the plan or drawn live
+        """
+        if 'overlays' in event:
+            for overlay in event['overlays']:
+                self.timeline.push(self.origin + overlay['offset'], dict(overlay, mode='overlay'))
+        elif self._sg is not None:
+            self._push_overlay()
+
+    @staticmethod
+    def draw_event(dg, sg):
+        """
+        Draw the drift parameters of the next main event and generate its commands
+        """
+        drift_parameters = dg.generate_drift_parameters()
+        cmds, duration, load = sg.generate_script(drift_parameters)
+        return {
+            'type': drift_parameters['type'],
+            'mode': drift_parameters['mode'],
+            'cmds': cmds,
+            'duration': duration,
+            'load': load,
+        }
+
+    def draw_event_interval(self):
+        return random.uniform(self.interval['lower'], self.interval['higher'])
+
+    def draw_span(self):
+        return random.uniform(self.new_time_span['lower'], self.new_time_span['higher'])
+
+    def draw_sub_interval(self):
+        return random.uniform(self.sub_interval['lower'], self.sub_interval['higher'])
+
+    def draw_num_sub_events(self):
+        return random.randint(self.sub_drift['lower'], self.sub_drift['higher'])
+
+    def draw_overlay_interval(self):
+        return random.uniform(self.overlay_interval['lower'], self.overlay_interval['higher'])
+
+    async def run_event(self, event, sg=None, settings=None):
+        """
+        Run one main drift event, including its sub-drifts and the final sudden drift.
+        The event holds the drift type, mode, commands, duration and load; when it comes from a plan it also
+        holds the span, the sub-drifts, the overlays and the waits, which are drawn at run time otherwise.
+        An overlay is labeled together with the base drifts it runs on, e.g. 'Incremental+Blip'.
+        The host shares of its commands and load are resolved against this host when it starts, those of its
+        sub-drifts when they start.
+        The event runs to its end with the scheduler settings of its start, or settings when given, even if the
+        configuration is reloaded meanwhile.
+        """
+        token = _event_settings.set((self, settings if settings is not None else self._settings))
+        try:
+            await self._run_event(event, sg)
+        finally:
+            _event_settings.reset(token)
+
+    async def _run_event(self, event, sg):
+        event = dict(event, cmds=[resolve_cmd(cmd) for cmd in event['cmds']],
+                     load=resolve_host_share(event.get('load')))
+        drift_type = event['type']
+        if drift_type in ["Sudden", "Incremental", "Gradual"]:
+            if event['mode'] == 'transmitted drift':
+                start_time = await self._handle_transmitted_drift(event, sg)
             else:
-                self._handler_short_drift(drift_type, cmds)
-            self.sum_event += 1
-            event_interval = random.uniform(self.interval['lower'], self.interval['higher'])
-            self.logger.info("Generated {} drift events".format(self.sum_event))
-            time.sleep(event_interval)
+                start_time = await self._handle_independent_drift(event)
+            await self._handle_final_sudden_drift(start_time)
+        else:
+            label = drift_type
+            if event['mode'] == 'overlay':
+                label = composite_label(self.timeline.bases(), drift_type)
+            with self.timeline.occupy(drift_type):
+                await self._handler_short_drift(drift_type, event['cmds'], label)
+
+    def _now(self):
+        """
+        Current time of the scheduler, used for all drift labels
+        """
+        return datetime.datetime.now()
+
+    def _create_driver(self):
+        return create_driver(self.metric)
+
+    def _get_supervisor(self):
+        return get_supervisor()
 
-    def _start_incremental(self, cmds, duration, load):
+    def _get_controller(self):
+        # Created on the first controlled command, with the driver of the metric
+        if self.controller is None:
+            driver = self._create_driver()
+            self.controller = LoadController(self.metric, driver, getattr(driver, 'cpu_count', None))
+        return self.controller
+
+    async def _exec(self, cmd):
+        """
+        Start a command in its own process group without blocking the event loop.
+        Commands of the CPU load engine retarget its worker pool instead of starting a process, and under
+        closed-loop control a command only adds its demand to the LoadController.
+        """
+        if self.controlled:
+            return self._get_controller().lease(cmd)
+        if is_engine_cmd(cmd):
+            return get_engine().lease(cmd)
+        return await self._get_supervisor().spawn(cmd)
+
+    async def _spawn(self, cmd):
+        """
+        Start a drift command, reserving its load from the arbiter when there is one
+        """
+        cmd = resolve_cmd(cmd)
+        if self.arbiter is None:
+            return await self._exec(cmd)
+        cmd, demand = await self.arbiter.acquire(cmd)
+        try:
+            process = await self._exec(cmd)
+        except Exception:
+            await self.arbiter.release(demand)
+            raise
+        asyncio.ensure_future(self._release_on_exit(process, demand))
+        return process
+
+    async def _release_on_exit(self, process, demand):
+        """
+        Hand the demand of a command back to the arbiter once it exits
+        """
+        try:
+            await process.wait()
+        finally:
+            await self.arbiter.release(demand)
+
+    async def _insert(self, drift_type, drift_info_time):
+        """
+        Hand a drift label to the label writer, which journals it and writes it in the background
+        """
+        perform_insert([drift_type, drift_info_time], self.metric)
+        if self.collector is not None:
+            self.collector.label(self.metric, drift_type, *drift_info_time)
+
+    def _stop(self, processes, cmds):
+        """
+        Terminate the father processes of a drift together with their workers
+        """
+        for process in processes:
+            if process is None or process.returncode is not None:
+                continue
+            try:
+                self._get_supervisor().terminate(process)
+            except ProcessLookupError as e:
+                # Only real processes raise it, the load leases have a lease_id and no pid
+                self.logger.warning(f"Error: {e}. Process with PID {process.pid} does not exist "
+                                    f"when handle cmds{cmds}")
+
+    async def _start_incremental(self, cmds, duration, load):
         """
         Create Incremental type drifts
         """
-        start_time = datetime.datetime.now()
+        start_time = self._now()
         processes = []
         self.logger.info(f"Incremental command: {cmds}")
-        for cmd in cmds:
-            try:
-                process = subprocess.Popen(cmd)
-                processes.append(process)
-                time.sleep(duration)
-            except subprocess.CalledProcessError as e:
-                self.logger.error(f"Error occurred during subprocess command {cmd} execution: {e}")
-            except Exception as e:
-                self.logger.error(f"An unexpected error occurred during subprocess command {cmd} execution: {e}")
-        end_time = self._get_end_time(load)
+        try:
+            for cmd in cmds:
+                try:
+                    process = await self._spawn(cmd)
+                    processes.append(process)
+                    await asyncio.sleep(duration)
+                except Exception as e:
+                    self.logger.error(f"An unexpected error occurred during subprocess command {cmd} execution: {e}")
+            end_time, _ = await self._get_end_time(load, start_time)
+        except BaseException:
+            # The steps started so far are not handed back, stop them here
+            self._stop(processes, cmds)
+            raise
         return processes, (start_time, end_time)
 
-    def _start_sudden(self, cmds, load):
+    async def _start_sudden(self, cmds, load):
         """
         Create Sudden type drifts
         """
-        start_time = datetime.datetime.now()
+        start_time = self._now()
         cmd = cmds[0]
         process = None
         try:
             self.logger.info(f"Sudden commands: {cmd}")
-            process = subprocess.Popen(cmd)
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Error occurred during subprocess command {cmd} execution: {e}")
+            process = await self._spawn(cmd)
         except Exception as e:
             self.logger.error(f"An unexpected error occurred during subprocess command {cmd} execution: {e}")
-        finally:
-            end_time = self._get_end_time(load)
+        end_time, _ = await self._get_end_time(load, start_time)
         return process, (start_time, end_time)
 
-    def _start_gradual(self, cmds, duration, load):
+    async def _start_gradual(self, cmds, duration, load):
         """
         Create Gradual type drifts
         """
-        start_time = datetime.datetime.now()
+        start_time = self._now()
         self.logger.info(f"Gradual command: {cmds}")
         for i, cmd in enumerate(cmds):
             try:
-                process = subprocess.Popen(cmd)
+                process = await self._spawn(cmd)
                 if i == len(cmds) - 1:
-                    end_time = self._get_end_time(load)
+                    end_time, _ = await self._get_end_time(load, start_time)
+                    await asyncio.sleep(duration[i])
                     return process, (start_time, end_time)
                 else:
-                    process.wait()
-            except subprocess.CalledProcessError as e:
-                self.logger.error(f"Error occurred during subprocess sub command {cmd} execution: {e}")
+                    await process.wait()
             except Exception as e:
                 self.logger.error(f"An unexpected error occurred during subprocess sub command {cmd} execution: {e}")
-            finally:
-                time.sleep(duration[i])
+            await asyncio.sleep(duration[i])
+        return None, (start_time, self._now())
+
+    def _get_waveform_driver(self):
+        if self.waveform_driver is None:
+            self.waveform_driver = self._create_driver()
+        return self.waveform_driver
 
-    def _sub_drift(self, cmds, sub_events):
+    async def _start_waveform(self, drift_type, cmds, duration, load):
+        """
+        Create Incremental and Gradual drifts as one smooth waveform on a long-lived driver.
+        The peak of the curve is the load the commands would reach together, so the arbiter reserves it once.
+        """
+        start_time = self._now()
+        peak = scale_cmd(cmds[0], len(cmds)) if drift_type == "Incremental" else cmds[-1]
+        reserved = None
+        if self.arbiter is not None:
+            peak, reserved = await self.arbiter.acquire(peak)
+        driver = self._get_waveform_driver()
+        level = estimate_demand(peak, getattr(driver, 'cpu_count', None))[self.metric]
+        if drift_type == "Incremental":
+            waveform = incremental_waveform(level, len(cmds) * duration)
+        else:
+            on_seconds = [parse_stress_duration(cmd[cmd.index('--timeout') + 1]) for cmd in cmds[:-1]]
+            waveform = gradual_waveform(level, on_seconds, duration[:-1])
+        self.logger.info(f"{drift_type} waveform to {level:.2f} over {waveform.duration:.0f}s")
+        process = WaveformLoad(driver, waveform)
+        if reserved is not None:
+            asyncio.ensure_future(self._release_on_exit(process, reserved))
+        try:
+            await asyncio.sleep(waveform.duration)
+            end_time, _ = await self._get_end_time(load, start_time)
+            if drift_type == "Gradual":
+                await asyncio.sleep(duration[-1])
+        except BaseException:
+            self._stop([process], cmds)
+            raise
+        return [process], (start_time, end_time)
+
+    async def _start_father(self, drift_type, cmds, duration, load):
+        """
+        Start the father drift of a long drift event and record its label
+        """
+        if drift_type in config_waveform['drift_types'] and drift_type in ["Incremental", "Gradual"]:
+            father_processes, drift_info_time = await self._start_waveform(drift_type, cmds, duration, load)
+        elif drift_type == "Sudden":
+            father_process, drift_info_time = await self._start_sudden(cmds, load)
+            father_processes = [father_process] if father_process is not None else []
+        elif drift_type == "Incremental":
+            father_processes, drift_info_time = await self._start_incremental(cmds, duration, load)
+        else:
+            father_process, drift_info_time = await self._start_gradual(cmds, duration, load)
+            father_processes = [father_process] if father_process is not None else []
+        if len(father_processes) > 0:
+            await self._insert(drift_type, drift_info_time)
+        return father_processes
+
+    async def _sub_drift(self, cmds, sub_events, sub_intervals=None):
         """
         Execute sub-drift commands
         """
         for i, cmd in enumerate(cmds):
+            # Sub-drifts follow the compatibility rules as well, an overlay still running delays them
+            while not self.timeline.compatible(sub_events[i], ignore_bases=True):
+                await self.timeline.wait(self.retry_seconds)
             try:
                 self.logger.info(f"Sub {sub_events[i]} commands: {cmd}")
-                start_time = datetime.datetime.now()
-                process = subprocess.Popen(cmd)
-                process.wait()
-                span_time = get_timeout_from_cmd(cmds[0])
+                with self.timeline.occupy(sub_events[i]):
+                    start_time = self._now()
+                    process = await self._spawn(cmd)
+                    await process.wait()
+                span_time = get_timeout_from_cmd(cmd)
                 end_time = start_time + datetime.timedelta(seconds=span_time)
                 drift_info_time = (start_time, end_time)
-                perform_insert([sub_events[i], drift_info_time], self.metric)
+                await self._insert(sub_events[i], drift_info_time)
                 self.sum_event += 1
-            except subprocess.CalledProcessError as e:
-                self.logger.error(f"Error occurred during subprocess sub command {cmd} execution: {e}")
             except Exception as e:
                 self.logger.error(f"An unexpected error occurred during subprocess sub command {cmd} execution: {e}")
-            finally:
-                time.sleep(random.uniform(self.sub_interval['lower'], self.sub_interval['higher']))
+            await asyncio.sleep(sub_intervals[i] if sub_intervals else self.draw_sub_interval())
 
-    def _handle_transmitted_drift(self, drift_type, cmds, duration, load, sg):
+    async def _handle_transmitted_drift(self, event, sg):
         """
         Handle transmitted drift events
         """
-        if drift_type == "Sudden":
-            father_process, drift_info_time = self._start_sudden(cmds, load)
-            if father_process is not None:
-                perform_insert([drift_type, drift_info_time], self.metric)
-            time.sleep(self.father_sub_interval)
-            num_sub_events = random.randint(self.sub_drift['lower'], self.sub_drift['higher'])
-            sub_cmds, sub_events = sg.generate_sub_script(num_sub_events)
-            self._sub_drift(sub_cmds, sub_events)
-            start_time = datetime.datetime.now()
-            if father_process is not None:
-                pid = father_process.pid
-                try:
-                    os.kill(pid, signal.SIGTERM)
-                except ProcessLookupError as e:
-                    print(f"Error: {e}. Process with PID {pid} does not exist when handle cmds{cmds}")
-        elif drift_type == "Incremental":
-            father_processes, drift_info_time = self._start_incremental(cmds, duration, load)
-            if len(father_processes) > 0:
-                perform_insert([drift_type, drift_info_time], self.metric)
-            time.sleep(self.father_sub_interval + 400)
-            num_sub_events = random.randint(self.sub_drift['lower'], self.sub_drift['higher'])
-            sub_cmds, sub_events = sg.generate_sub_script(num_sub_events)
-            self._sub_drift(sub_cmds, sub_events)
-            start_time = datetime.datetime.now()
-            for f_process in father_processes:
-                if father_processes is None:
-                    continue
-                pid = f_process.pid
-                try:
-                    os.kill(pid, signal.SIGTERM)
-                except ProcessLookupError as e:
-                    print(f"Error: {e}. Process with PID {pid} does not exist when handle cmds{cmds}")
-        else:
-            father_process, drift_info_time = self._start_gradual(cmds, duration, load)
-            if father_process is not None:
-                perform_insert([drift_type, drift_info_time], self.metric)
-            time.sleep(self.father_sub_interval)
-            num_sub_events = random.randint(self.sub_drift['lower'], self.sub_drift['higher'])
-            sub_cmds, sub_events = sg.generate_sub_script(num_sub_events)
-            self._sub_drift(sub_cmds, sub_events)
-            start_time = datetime.datetime.now()
-            if father_process is not None:
-                pid = father_process.pid
-                try:
-                    os.kill(pid, signal.SIGTERM)
-                except ProcessLookupError as e:
-                    print(f"Error: {e}. Process with PID {pid} does not exist when handle cmds{cmds}")
+        drift_type, cmds = event['type'], event['cmds']
+        with self.timeline.occupy(drift_type, is_open=False) as slot:
+            father_processes = await self._start_father(drift_type, cmds, event['duration'], event['load'])
+            try:
+                slot.open()
+                self._schedule_overlays(event)
+                await asyncio.sleep(event.get('father_sub_interval', self.father_sub_interval))
+                if 'sub_cmds' in event:
+                    sub_cmds, sub_events = event['sub_cmds'], event['sub_events']
+                else:
+                    sub_cmds, sub_events = sg.generate_sub_script(self.draw_num_sub_events())
+                await self._sub_drift(sub_cmds, sub_events, event.get('sub_intervals'))
+                start_time = self._now()
+            finally:
+                self._stop(father_processes, cmds)
+        self.timeline.discard_overlays()
         return start_time
 
-    def _handle_independent_drift(self, drift_type, cmds, duration, load, time_span):
+    async def _handle_independent_drift(self, event):
         """
         Handle independent drift events
         """
-        if drift_type == "Sudden":
-            father_process, drift_info_time = self._start_sudden(cmds, load)
-            if father_process is not None:
-                perform_insert([drift_type, drift_info_time], self.metric)
-            time.sleep(time_span)
-            start_time = datetime.datetime.now()
-            if father_process is not None:
-                pid = father_process.pid
-                try:
-                    os.kill(pid, signal.SIGTERM)
-                except ProcessLookupError as e:
-                    print(f"Error: {e}. Process with PID {pid} does not exist when handle cmds{cmds}")
-        elif drift_type == "Incremental":
-            father_processes, drift_info_time = self._start_incremental(cmds, duration, load)
-            if len(father_processes) > 0:
-                perform_insert([drift_type, drift_info_time], self.metric)
-            time.sleep(time_span)
-            start_time = datetime.datetime.now()
-            for f_process in father_processes:
-                if father_processes is None:
-                    continue
-                pid = f_process.pid
-                try:
-                    os.kill(pid, signal.SIGTERM)
-                except ProcessLookupError as e:
-                    print(f"Error: {e}. Process with PID {pid} does not exist when handle cmds{cmds}")
-        else:
-            father_process, drift_info_time = self._start_gradual(cmds, duration, load)
-            if father_process is not None:
-                perform_insert([drift_type, drift_info_time], self.metric)
-            time.sleep(time_span)
-            start_time = datetime.datetime.now()
-            if father_process is not None:
-                pid = father_process.pid
-                try:
-                    os.kill(pid, signal.SIGTERM)
-                except ProcessLookupError as e:
-                    print(f"Error: {e}. Process with PID {pid} does not exist when handle cmds{cmds}")
+        drift_type, cmds = event['type'], event['cmds']
+        with self.timeline.occupy(drift_type, is_open=False) as slot:
+            father_processes = await self._start_father(drift_type, cmds, event['duration'], event['load'])
+            try:
+                slot.open()
+                self._schedule_overlays(event)
+                await asyncio.sleep(event['span'] if 'span' in event else self.draw_span())
+                start_time = self._now()
+            finally:
+                self._stop(father_processes, cmds)
+        self.timeline.discard_overlays()
         return start_time
 
-    def _handler_short_drift(self, drift_type, cmds):
+    async def _handler_short_drift(self, drift_type, cmds, label=None):
         """
-        Handle short-term drift commands
+        Handle short-term drift commands, labeled as label when given
         """
-        start_time = datetime.datetime.now()
+        start_time = self._now()
         cmd = cmds[0]
         try:
             self.logger.info(f"{drift_type} command: {cmd}")
-            process = subprocess.Popen(cmd)
-            process.wait()
-        except subprocess.CalledProcessError as e:
-            self.logger.error(f"Error occurred during subprocess sub command {cmd} execution: {e}")
+            process = await self._spawn(cmd)
+            await process.wait()
         except Exception as e:
             self.logger.error(f"An unexpected error occurred during subprocess sub command {cmd} execution: {e}")
         finally:
             span_time = get_timeout_from_cmd(cmd)
             end_time = start_time + datetime.timedelta(seconds=span_time)
             drift_info_time = (start_time, end_time)
-            perform_insert([drift_type, drift_info_time], self.metric)
+            await self._insert(label or drift_type, drift_info_time)
 
-    def _handle_final_sudden_drift(self, start_time):
+    async def _handle_final_sudden_drift(self, start_time):
         """
         Handle final sudden drift at the end of longer drifts
         """
-        end_time = datetime.datetime.now()
+        end_time = self._now()
         drift_info_time = (start_time, end_time)
-        perform_insert(["Sudden", drift_info_time], self.metric)
+        await self._insert("Sudden", drift_info_time)
 
-    def _get_end_time(self, target):
+    async def _get_end_time(self, target, since=None):
         """
-        Get the end time of the command execution based on the specified target metric
-        """
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            count = 0
-            max_count = 50  # Set the maximum number of attempts
-            wait_time = 5  # Set the wait time in seconds
-            while count < max_count:
-                if self.metric == 'cpu':
-                    future = executor.submit(Scheduler._check_cpu_utilization, target)
-                elif self.metric == 'mem':
-                    future = executor.submit(Scheduler._check_memory_utilization, target)
-                elif self.metric == 'processes':
-                    future = executor.submit(Scheduler._check_processes_utilization, target)
+        Get the end time of the command execution based on the specified target metric.
+        The metric is followed at the sampler rate until a SteadyStateDetector finds a plateau that
+        either reaches the target or moved away from the level before the drift. The confidence of the
+        detector is halved when only the shift, and not the target, confirms the drift.
+        :param target: The target of the drift, compared by the _check_*_utilization functions.
+        :param since (datetime): Start of the drift, the level before it is the baseline.
+        :return:
+            datetime: The moment the metric settled.
+            float: The confidence of the detection, 0 when the maximum wait was reached.
+        """
+        if self.metric == 'cpu':
+            check = self._check_cpu_utilization
+        elif self.metric == 'mem':
+            check = self._check_memory_utilization
+        elif self.metric == 'processes':
+            check = self._check_processes_utilization
+        else:
+            raise ValueError("Unknown metric")
+        column = METRIC_COLUMNS[self.metric]
+        steady_state = self.steady_state
+        settings = steady_state[self.metric]
+        detector = SteadyStateDetector(steady_state['window_seconds'], settings['slope_tolerance'],
+                                       settings['std_tolerance'], steady_state['ewma_alpha'])
+        sampler = get_sampler()
+        baseline = self._get_baseline(sampler, column, since, steady_state['window_seconds'])
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + steady_state['max_wait_seconds']
+        seen = sampler.buffer.count
+        while loop.time() < deadline:
+            await asyncio.sleep(sampler.interval)
+            new_samples = sampler.buffer.count - seen
+            seen = sampler.buffer.count
+            for row in sampler.buffer.tail(new_samples):
+                state = detector.update(row[0], row[sampler.buffer.columns[column]])
+                if state is None:
+                    continue
                 try:
-                    result = future.result()
-                    if result:
-                        return datetime.datetime.now()
-                except concurrent.futures.TimeoutError:
-                    self.logger.warning('Timeout occurred in _get_end_time function.')
-                except FileNotFoundError as e:
-                    self.logger.warning(f'FileNotFoundError occurred: {e}.')
+                    reached = check(target)
                 except Exception as e:
                     self.logger.error(f'An unexpected error occurred: {e}.')
-                count += 1
-                time.sleep(wait_time)
-            self.logger.warning('Maximum attempts reached in _get_end_time function.')
-            return datetime.datetime.now()
+                    reached = False
+                if reached or abs(state.level - baseline) >= settings['min_shift']:
+                    confidence = state.confidence if reached else state.confidence / 2
+                    end_time = datetime.datetime.fromtimestamp(state.timestamp)
+                    self.logger.info(f"Metric {self.metric} settled at {state.level:.2f} "
+                                     f"(baseline {baseline:.2f}) on {end_time}, confidence {confidence:.2f}")
+                    return end_time, confidence
+        self.logger.warning('Maximum wait reached in _get_end_time function.')
+        return self._now(), 0.0
+
+    @staticmethod
+    def _get_baseline(sampler, column, since, window=None):
+        """
+        Mean level of a metric over the detection window before the drift started
+        """
+        if window is None:
+            window = config_steady_state['window_seconds']
+        samples = sampler.buffer.snapshot()
+        before = since.timestamp() if since is not None else samples[-1, 0] + 1
+        values = samples[(samples[:, 0] < before) & (samples[:, 0] >= before - window),
+                         sampler.buffer.columns[column]]
+        return float(values.mean()) if len(values) else sampler.latest(column)
 
     @staticmethod
     def _check_cpu_utilization(target):
@@ -337,3 +709,61 @@ class Scheduler:
         """
         processes_count = get_current_processes_num()
         return processes_count >= float(target)
+
+
+async def run_concurrently(schedulers):
+    """
+    Drive several drift timelines on the same event loop
+    """
+    await asyncio.gather(*(s.start() for s in schedulers))
+
+
+def parse_metrics(metric):
+    """
+    Split a metric option such as 'cpu,mem,processes' into a list of metrics
+    """
+    metrics = metric if isinstance(metric, (list, tuple)) else str(metric).split(',')
+    metrics = [m.strip() for m in metrics if m.strip()]
+    for m in metrics:
+        if m not in METRICS:
+            raise ValueError(f"Unknown metric {m}")
+    return list(dict.fromkeys(metrics))
+
+
+class Scheduler:
+    """
+    Blocking compatibility wrapper around AsyncScheduler, kept for main.py and existing callers.
+    Several comma separated metrics run as concurrent timelines sharing one ResourceArbiter.
+    With a compiled plan the events are played back from it instead of drawn at run time.
+    """
+
+    def __init__(self, metric, plan=None):
+        metrics = parse_metrics(metric)
+        arbiter = ResourceArbiter.from_config() if len(metrics) > 1 else None
+        if plan is None:
+            self._cores = [AsyncScheduler(m, arbiter) for m in metrics]
+        else:
+            from core.planner import PlanExecutor
+            self._cores = [PlanExecutor(m, plan['events'], arbiter=arbiter) for m in metrics]
+        self._core = self._cores[0]
+
+    def __getattr__(self, name):
+        return getattr(self._core, name)
+
+    def start(self):
+        collector = None
+        if config_collector['enabled']:
+            collector = MetricCollector().start(get_sampler())
+            for core in self._cores:
+                core.collector = collector
+        if config_reload['enabled']:
+            registry.watch(config_reload['interval_seconds'])
+        try:
+            asyncio.run(run_supervised(run_concurrently(self._cores)))
+        finally:
+            registry.stop()
+            if collector is not None:
+                collector.close()
+
+    def _get_end_time(self, target):
+        return asyncio.run(self._core._get_end_time(target))
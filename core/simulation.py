@@ -0,0 +1,387 @@
+import asyncio
+import collections
+import datetime
+import logging
+import os
+import random
+import selectors
+import signal
+import time
+
+import numpy as np
+
+from core.arbiter import RESOURCES, ResourceArbiter, estimate_demand
+from core.planner import play_events
+from core.scheduler import AsyncScheduler, run_concurrently
+from core.toolkit.config import get_config
+from core.toolkit.sampler import COLUMNS, RingBuffer, config_sampler
+from core.toolkit.supervisor import ProcessSupervisor
+from core.toolkit.tools import parse_stress_duration, set_sampler
+
+config = get_config('scheduler')
+
+config_simulation = config['settings']['simulation']
+
+
+class VirtualClock:
+    """
+    Clock of the simulation, it only moves when the event loop has nothing left to do
+    """
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.time()
+        # Kept apart from the epoch start so that timer arithmetic stays precise
+        self.elapsed = 0.0
+
+    def time(self):
+        return self.start + self.elapsed
+
+    def advance(self, seconds):
+        self.elapsed += seconds
+
+    def datetime(self):
+        return datetime.datetime.fromtimestamp(self.time())
+
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    """
+    Selector that jumps the virtual clock to the next timer instead of sleeping
+    """
+
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready:
+            return ready
+        if timeout is None:
+            # No timer pending, only real I/O can wake the loop up
+            return super().select(None)
+        if timeout > 0:
+            self._clock.advance(timeout)
+        return []
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop running on a VirtualClock: asyncio.sleep and every other timer complete instantly
+    """
+
+    def __init__(self, clock):
+        super().__init__(selector=_VirtualTimeSelector(clock))
+        self._virtual_clock = clock
+
+    def time(self):
+        return self._virtual_clock.elapsed
+
+
+class SimulatedHost:
+    """
+    Modeled host standing in for the MetricSampler.
+    Every metric approaches the baseline plus the load of the running commands with a first-order lag,
+    samples are filled in lazily and vectorized whenever the buffer is read.
+    """
+
+    def __init__(self, clock, seed=None):
+        self.clock = clock
+        self.interval = config_simulation['sample_interval_seconds']
+        self.cpu_count = config_simulation['cpu_count']
+        self.memory_mb = config_simulation['memory_mb']
+        self._tau = config_simulation['response_seconds']
+        self._baseline = np.array([config_simulation['baseline_cpu_percentage'],
+                                   config_simulation['baseline_mem_mb'],
+                                   config_simulation['baseline_processes']], dtype=float)
+        self._noise = np.array([config_simulation['noise'][key] for key in RESOURCES], dtype=float)
+        self._upper = np.array([100, self.memory_mb, np.inf])
+        self._rng = np.random.default_rng(seed)
+        self._buffer = RingBuffer(config_sampler['capacity'], COLUMNS)
+        self._demand = np.zeros(len(RESOURCES))
+        self._level = self._baseline.copy()
+        self._level_time = clock.time()
+        self._next_sample = clock.time()
+
+    def _target(self):
+        return np.clip(self._baseline + self._demand, 0, self._upper)
+
+    def _level_at(self, times):
+        decay = np.exp(-(np.asarray(times)[:, None] - self._level_time) / self._tau)
+        target = self._target()
+        return target + (self._level - target) * decay
+
+    def sync(self):
+        """
+        Record the samples due up to the current virtual time
+        """
+        now = self.clock.time()
+        if now < self._next_sample:
+            return
+        count = int((now - self._next_sample) // self.interval) + 1
+        keep = min(count, self._buffer.capacity)
+        times = self._next_sample + self.interval * np.arange(count - keep, count)
+        levels = self._level_at(times) + self._rng.normal(0, self._noise, (keep, len(RESOURCES)))
+        levels = np.clip(levels, 0, self._upper)
+        cpu, mem_used, processes = levels[:, 0], levels[:, 1], np.round(levels[:, 2])
+        rows = np.column_stack([times, cpu, mem_used, mem_used / self.memory_mb * 100,
+                                self.memory_mb - mem_used, processes])
+        self._buffer.extend(rows)
+        self._next_sample += count * self.interval
+
+    def apply(self, demand, sign):
+        """
+        Add (sign 1) or remove (sign -1) the load of a command
+        """
+        self.sync()
+        now = self.clock.time()
+        self._level = self._level_at([now])[0]
+        self._level_time = now
+        self._demand = np.maximum(self._demand + sign * np.array([demand[key] for key in RESOURCES]), 0)
+
+    @property
+    def buffer(self):
+        self.sync()
+        return self._buffer
+
+    def latest(self, column):
+        return self.buffer.latest(column)
+
+    def mean(self, column, window):
+        return self.buffer.mean(column, max(window / self.interval, 1))
+
+    def wait_ready(self, timeout=None):
+        self.sync()
+        return True
+
+
+class SimulatedDriver:
+    """
+    Load driver of a LoadController acting on the modeled host
+    """
+
+    def __init__(self, host, metric):
+        self.host = host
+        self.metric = metric
+        self.cpu_count = host.cpu_count
+        self.limit = {'cpu': 100.0, 'mem': float(host.memory_mb), 'processes': float('inf')}[metric]
+        self._applied = 0.0
+
+    def apply(self, value):
+        demand = dict.fromkeys(RESOURCES, 0.0)
+        demand[self.metric] = value - self._applied
+        self.host.apply(demand, 1)
+        self._applied = value
+
+    def close(self):
+        self.apply(0.0)
+
+
+class SimulatedProcess:
+    """
+    Stand-in for an asyncio subprocess: it holds its load on the modeled host until its stress-ng
+    timeout expires or it is terminated
+    """
+    _next_id = 0
+
+    def __init__(self, cmd, host):
+        SimulatedProcess._next_id += 1
+        self.lease_id = SimulatedProcess._next_id
+        self.returncode = None
+        self._host = host
+        self._demand = estimate_demand(cmd, host.cpu_count)
+        self._done = asyncio.Event()
+        self._timer = None
+        host.apply(self._demand, 1)
+        if '--timeout' in cmd:
+            timeout = parse_stress_duration(cmd[cmd.index('--timeout') + 1])
+            self._timer = asyncio.get_event_loop().call_later(timeout, self._finish, 0)
+
+    def _finish(self, returncode):
+        if self.returncode is not None:
+            return
+        self.returncode = returncode
+        self._host.apply(self._demand, -1)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._done.set()
+
+    async def wait(self):
+        await self._done.wait()
+        return self.returncode
+
+    def send_signal(self, sig):
+        self._finish(-sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class LocalLabelSink:
+    """
+    Collects drift labels in memory, with the same call signature as perform_insert
+    """
+
+    def __init__(self):
+        self.labels = []
+
+    def __call__(self, data, metric):
+        drift_label, (drift_start, drift_end) = data[0], data[1]
+        self.labels.append((metric, drift_label, drift_start, drift_end))
+
+    def counts(self):
+        return collections.Counter((metric, label) for metric, label, _, _ in self.labels)
+
+    def save_csv(self, directory, metric, start, end):
+        """
+        Write the labels of a metric in the layout of the label export read by DataProcessor
+        """
+        os.makedirs(directory, exist_ok=True)
+        file_name = "{}_{}_to_{}.csv".format(metric, start.strftime('%Y-%m-%d_%H-%M-%S'),
+                                             end.strftime('%Y-%m-%d_%H-%M-%S'))
+        file_path = os.path.join(directory, file_name)
+        with open(file_path, 'w') as file:
+            file.write("id,drift_label,drift_start,drift_end\n")
+            rows = [label for label in self.labels if label[0] == metric]
+            for i, (_, label, drift_start, drift_end) in enumerate(rows):
+                file.write("{},{},{},{}\n".format(i + 1, label, drift_start.strftime('%d/%m/%Y %H:%M:%S'),
+                                                  drift_end.strftime('%d/%m/%Y %H:%M:%S')))
+        return file_path
+
+
+class SimulatedScheduler(AsyncScheduler):
+    """
+    AsyncScheduler running against the virtual clock and the modeled host
+    """
+
+    def __init__(self, metric, clock, host, arbiter=None, label_writer=None):
+        super().__init__(metric, arbiter)
+        self.clock = clock
+        self.host = host
+        self.label_writer = label_writer
+        # Never spawns and keeps no registry, the process groups of the real supervisor are out of reach
+        self.supervisor = ProcessSupervisor(registry_dir='')
+        # A month of events would flood the log, only keep problems
+        self.logger.setLevel(logging.WARNING)
+
+    def _now(self):
+        return self.clock.datetime()
+
+    def _create_driver(self):
+        return SimulatedDriver(self.host, self.metric)
+
+    def _get_supervisor(self):
+        return self.supervisor
+
+    async def _exec(self, cmd):
+        if self.controlled:
+            return self._get_controller().lease(cmd)
+        return SimulatedProcess(cmd, self.host)
+
+    async def _insert(self, drift_type, drift_info_time):
+        self.label_writer([drift_type, drift_info_time], self.metric)
+
+
+def run_simulation(metrics, days, seed=None, label_writer=None, storage_dir='storage', plan=None, controlled=None):
+    """
+    Run the scheduler for the given number of simulated days.
+    :param metrics (list): The metrics to simulate, several metrics share one arbiter.
+    :param days (float): Simulated duration in days.
+    :param seed (int or None): Seed of the drift generation and of the host noise.
+    :param label_writer (callable or None): Label writer such as perform_insert, labels are kept
+        locally and saved under storage_dir when omitted.
+    :param plan (dict or None): A compiled plan to play back instead of drawing the events at run time.
+    :param controlled (list or None): Metrics run under closed-loop control, the configured ones by default.
+    :return:
+        dict: The report of the simulation.
+    """
+    clock = VirtualClock()
+    loop = VirtualEventLoop(clock)
+    host = SimulatedHost(clock, seed)
+    sink = LocalLabelSink()
+    set_sampler(host)
+    begin_wall, begin = time.perf_counter(), clock.datetime()
+    try:
+        asyncio.set_event_loop(loop)
+        arbiter = None
+        if len(metrics) > 1:
+            arbiter = ResourceArbiter.from_config(host.cpu_count, host.memory_mb)
+
+        def write_label(data, metric):
+            sink(data, metric)
+            if label_writer is not None:
+                label_writer(data, metric)
+
+        schedulers = [SimulatedScheduler(m, clock, host, arbiter, write_label) for m in metrics]
+        if controlled is not None:
+            for scheduler in schedulers:
+                scheduler.controlled = scheduler.metric in controlled
+        if seed is not None:
+            random.seed(seed)
+        if plan is None:
+            timelines = run_concurrently(schedulers)
+        else:
+            timelines = asyncio.gather(*(play_events(s, plan['events'], 0.0) for s in schedulers))
+        try:
+            loop.run_until_complete(asyncio.wait_for(timelines, timeout=days * 86400))
+        except asyncio.TimeoutError:
+            pass
+    finally:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+        asyncio.set_event_loop(None)
+        set_sampler(None)
+
+    end = clock.datetime()
+    hours = (end - begin).total_seconds() / 3600
+    counts = sink.counts()
+    report = {
+        'simulated_hours': hours,
+        'wall_seconds': time.perf_counter() - begin_wall,
+        'labels': len(sink.labels),
+        'events_per_hour': len(sink.labels) / hours if hours else 0.0,
+        'labels_per_type': {f"{metric}/{label}": count for (metric, label), count in sorted(counts.items())},
+        'files': [],
+        'control': {s.metric: _summarize_control(s.control_reports) for s in schedulers if s.controlled},
+    }
+    if label_writer is None:
+        report['files'] = [sink.save_csv(storage_dir, m, begin, end) for m in metrics]
+    return report
+
+
+def _summarize_control(reports):
+    """
+    Aggregate the tracking reports of the drifts of one metric
+    """
+    converged = [report for _, report in reports if report['convergence_seconds'] is not None]
+    return {
+        'drifts': len(reports),
+        'converged_drifts': len(converged),
+        'mean_convergence_seconds': float(np.mean([r['convergence_seconds'] for r in converged])) if converged else None,
+        'mean_steady_state_error': float(np.mean([r['steady_state_error'] for r in converged])) if converged else None,
+    }
+
+
+def format_report(report):
+    lines = ["Simulated {:.1f} h in {:.2f} s of wall-clock time".format(report['simulated_hours'],
+                                                                       report['wall_seconds']),
+             "Labels: {} ({:.2f} events/hour)".format(report['labels'], report['events_per_hour'])]
+    for key, count in report['labels_per_type'].items():
+        lines.append("  {}: {}".format(key, count))
+    for metric, control in report.get('control', {}).items():
+        lines.append("Closed loop {}: {} of {} drifts converged, mean convergence {} s, "
+                     "mean steady-state error {}".format(metric, control['converged_drifts'], control['drifts'],
+                                                         _format_number(control['mean_convergence_seconds']),
+                                                         _format_number(control['mean_steady_state_error'])))
+    for file_path in report['files']:
+        lines.append("Labels saved to {}".format(file_path))
+    return "\n".join(lines)
+
+
+def _format_number(value):
+    return "-" if value is None else "{:.2f}".format(value)
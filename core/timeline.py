@@ -0,0 +1,136 @@
+import asyncio
+import heapq
+import itertools
+
+from core.toolkit.config import get_config
+
+config = get_config('scheduler')
+
+config_timeline = config['settings']['timeline']
+
+# Drift types that hold their load long enough to carry overlays
+BASE_TYPES = ("Sudden", "Incremental", "Gradual")
+
+
+class Slot:
+    """
+    A drift that is currently running on the timeline.
+    A base drift only accepts overlays once it is open, i.e. after its father drift settled.
+    """
+
+    def __init__(self, drift_type, is_open=True):
+        self.drift_type = drift_type
+        self.is_open = is_open
+
+    def open(self):
+        self.is_open = True
+
+
+class EventTimeline:
+    """
+    Heap of drift events ordered by their start time on the event loop clock.
+    Next to the heap it keeps the drifts currently running, and an event may only start when every
+    running drift declares it compatible in the timeline rules, e.g. a Blip on top of an Incremental.
+    """
+
+    def __init__(self, rules=None, max_active=None):
+        """
+        :param rules (dict): For every drift type, the drift types allowed to start on top of it.
+        :param max_active (int): Largest number of drifts running at once.
+        """
+        self.rules = rules if rules is not None else config_timeline['compatible']
+        self.max_active = max_active if max_active is not None else config_timeline['max_active']
+        self.active = []
+        self._heap = []
+        self._counter = itertools.count()
+        self._changed = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _get_changed(self):
+        # Created lazily so that it binds to the running event loop
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def notify(self):
+        self._get_changed().set()
+
+    async def wait(self, timeout=None):
+        """
+        Wait until the timeline changes or the timeout expires
+        """
+        changed = self._get_changed()
+        try:
+            await asyncio.wait_for(changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        changed.clear()
+
+    def push(self, at, event):
+        """
+        Schedule an event at the given loop time
+        """
+        heapq.heappush(self._heap, (at, next(self._counter), event))
+        self.notify()
+
+    def next_time(self):
+        return self._heap[0][0]
+
+    def pop(self):
+        at, _, event = heapq.heappop(self._heap)
+        return at, event
+
+    def discard_overlays(self):
+        """
+        Drop the overlays still waiting in the heap, once their base drift has ended
+        """
+        self._heap = [entry for entry in self._heap if entry[2]['mode'] != 'overlay']
+        heapq.heapify(self._heap)
+        self.notify()
+
+    def compatible(self, drift_type, ignore_bases=False):
+        """
+        Check whether a drift of the given type may start on top of the running drifts.
+        With ignore_bases the base drifts are left out, as for the sub-drifts a base drift runs itself.
+        """
+        if len(self.active) >= self.max_active:
+            return False
+        return all(slot.is_open and drift_type in (self.rules.get(slot.drift_type) or [])
+                   for slot in self.active if not (ignore_bases and slot.drift_type in BASE_TYPES))
+
+    def bases(self):
+        """
+        Types of the running base drifts that accept overlays
+        """
+        return [slot.drift_type for slot in self.active if slot.is_open and slot.drift_type in BASE_TYPES]
+
+    def occupy(self, drift_type, is_open=True):
+        return _Occupation(self, Slot(drift_type, is_open))
+
+
+class _Occupation:
+    """
+    Context manager registering a running drift on the timeline
+    """
+
+    def __init__(self, timeline, slot):
+        self.timeline = timeline
+        self.slot = slot
+
+    def __enter__(self):
+        self.timeline.active.append(self.slot)
+        return self.slot
+
+    def __exit__(self, *exc_info):
+        self.timeline.active.remove(self.slot)
+        self.timeline.notify()
+        return False
+
+
+def composite_label(bases, drift_type):
+    """
+    Label of a drift running on top of base drifts, such as 'Incremental+Blip'
+    """
+    return "+".join(list(bases) + [drift_type])
@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from core.toolkit.config import get_config
+from core.toolkit.sampler import COLUMNS
+
+config = get_config('toolkit')
+
+config_collector = config['settings']['collector']
+
+# Category written in the label columns, 0 when no drift is active, same codes as DataProcessor
+EVENT_TYPES = {'Sudden': 1, 'Blip': 2, 'Recurrent': 3, 'Incremental': 4, 'Gradual': 5}
+LABEL_COLUMNS = ('label_cpu', 'label_mem', 'label_processes')
+META_FILE = 'meta.json'
+
+
+def category_of(drift_label):
+    # Composite labels such as 'Incremental+Blip' take the category of the overlay on top
+    return EVENT_TYPES[drift_label.split('+')[-1]]
+
+
+class MetricCollector:
+    """
+    In-process recorder of the sampler series into memory-mapped columnar files, with the drift labels inline.
+    Every column is a NumPy .npy file per segment of segment_rows samples, opened as a memmap and filled as
+    the samples arrive; meta.json lists the segments and how many rows of each are written. When the scheduler
+    records a drift label, the category of the drift is written into the label column of its metric for every
+    sample of the drift, so the files are a labeled dataset without joining them with the label export.
+    """
+
+    def __init__(self, directory=None, segment_rows=None, flush_rows=None):
+        """
+        :param directory (str): Directory of the column files, created if needed.
+        :param segment_rows (int): Number of samples per segment file.
+        :param flush_rows (int): The memmaps and meta.json are flushed every flush_rows samples.
+        """
+        self.directory = directory or config_collector['directory']
+        self.segment_rows = segment_rows or config_collector['segment_rows']
+        self.flush_rows = flush_rows or config_collector['flush_rows']
+        self.dtypes = {name: np.float64 for name in COLUMNS}
+        self.dtypes.update({name: np.int8 for name in LABEL_COLUMNS})
+        self._lock = threading.Lock()
+        self._segments = []
+        self._arrays = None
+        self._rows = 0
+        self._sampler = None
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = os.path.join(self.directory, META_FILE)
+        if os.path.exists(meta_path):
+            # Resume a previous collection, new samples go to new segments
+            with open(meta_path, 'r') as file:
+                self._segments = json.load(file)['segments']
+
+    def _path(self, column, index):
+        return os.path.join(self.directory, f"{column}-{index:05d}.npy")
+
+    def _open_segment(self):
+        index = len(self._segments)
+        self._segments.append({'index': index, 'rows': 0, 'start': None, 'end': None})
+        self._arrays = {column: np.lib.format.open_memmap(self._path(column, index), mode='w+', dtype=dtype,
+                                                          shape=(self.segment_rows,))
+                        for column, dtype in self.dtypes.items()}
+        self._rows = 0
+
+    def start(self, sampler):
+        """
+        Record every sample of a MetricSampler from now on
+        """
+        self._sampler = sampler
+        sampler.add_listener(self.append)
+        return self
+
+    def append(self, row):
+        with self._lock:
+            if self._arrays is None or self._rows == self.segment_rows:
+                if self._arrays is not None:
+                    self._flush()
+                self._open_segment()
+            for column, value in zip(COLUMNS, row):
+                self._arrays[column][self._rows] = value
+            self._rows += 1
+            segment = self._segments[-1]
+            segment['rows'] = self._rows
+            if segment['start'] is None:
+                segment['start'] = row[0]
+            segment['end'] = row[0]
+            if self._rows % self.flush_rows == 0:
+                self._flush()
+
+    def label(self, metric, drift_label, drift_start, drift_end):
+        """
+        Write the category of a drift into the label column of its metric for the samples in [drift_start, drift_end).
+        Samples already labeled keep their label, like the first matching label in DataProcessor.
+        :param drift_start (datetime): Start of the drift, as recorded by the scheduler.
+        :param drift_end (datetime): End of the drift.
+        """
+        column = f"label_{metric}"
+        start, end = drift_start.timestamp(), drift_end.timestamp()
+        category = category_of(drift_label)
+        with self._lock:
+            for segment in self._segments:
+                if segment['start'] is None or segment['end'] < start or segment['start'] >= end:
+                    continue
+                current = self._arrays is not None and segment is self._segments[-1]
+                if current:
+                    timestamps, labels = self._arrays['timestamp'], self._arrays[column]
+                else:
+                    timestamps = np.load(self._path('timestamp', segment['index']), mmap_mode='r')
+                    labels = np.load(self._path(column, segment['index']), mmap_mode='r+')
+                rows = segment['rows']
+                first, last = np.searchsorted(timestamps[:rows], [start, end], side='left')
+                window = labels[first:last]
+                window[window == 0] = category
+                if not current:
+                    labels.flush()
+
+    def _flush(self):
+        for array in self._arrays.values():
+            array.flush()
+        tmp_path = os.path.join(self.directory, META_FILE + '.tmp')
+        with open(tmp_path, 'w') as file:
+            json.dump({'columns': {name: np.dtype(dtype).name for name, dtype in self.dtypes.items()},
+                       'event_types': EVENT_TYPES, 'segments': self._segments}, file)
+        os.replace(tmp_path, os.path.join(self.directory, META_FILE))
+
+    def close(self):
+        if self._sampler is not None:
+            self._sampler.remove_listener(self.append)
+        with self._lock:
+            if self._arrays is not None:
+                self._flush()
+                self._arrays = None
+
+
+def load_collected(directory, columns=None):
+    """
+    Read the columns recorded by a MetricCollector
+    :param directory (str): Directory of the collection.
+    :param columns (list or None): Columns to read, all of them by default.
+    :return:
+        dict: Column name -> NumPy array of every written sample in chronological order.
+    """
+    with open(os.path.join(directory, META_FILE), 'r') as file:
+        meta = json.load(file)
+    columns = columns or list(meta['columns'])
+    data = {}
+    for column in columns:
+        parts = [np.load(os.path.join(directory, f"{column}-{segment['index']:05d}.npy"), mmap_mode='r')
+                 [:segment['rows']] for segment in meta['segments']]
+        data[column] = np.concatenate(parts) if parts else np.empty(0, dtype=meta['columns'][column])
+    return data
@@ -0,0 +1,230 @@
+import os
+import threading
+from numbers import Number
+
+import yaml
+
+from core.toolkit.logger import setup_logger
+
+# Configuration files live in the config directory of the repository, whatever the working directory
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'config')
+
+_BOUNDS = [{'lower': Number, 'higher': Number}]
+_STEADY_STATE = {'slope_tolerance': Number, 'std_tolerance': Number, 'min_shift': Number}
+_SHELL_GEN = {'settings': {'shell_gen': {'command_prefix': list, 'time_scale': list}}}
+
+# Keys every configuration file must hold and their types, checked whenever a file is loaded.
+# A dict is a mapping with at least these keys, a list of one schema a non-empty list of items matching it
+SCHEMAS = {
+    'scheduler': {'settings': {
+        'scheduler': {'new_distribution_time_span': _BOUNDS, 'father_sub_interval': Number, 'sub_drift': _BOUNDS,
+                      'event_interval': _BOUNDS, 'sub_event_interval': _BOUNDS},
+        'timeline': {'overlay_interval': _BOUNDS, 'retry_seconds': Number, 'max_active': int, 'compatible': dict},
+        'steady_state': {'window_seconds': Number, 'ewma_alpha': Number, 'max_wait_seconds': Number,
+                         'cpu': _STEADY_STATE, 'mem': _STEADY_STATE, 'processes': _STEADY_STATE},
+    }},
+    'generator': {'settings': {'drift_gen': {'drift_category': list, 'drift_mode': list}}},
+    'toolkit': {'settings': {'postgresql': dict, 'sampler': dict, 'collector': dict, 'supervisor': dict,
+                             'label_writer': dict, 'label_sink': dict,
+                             'config_reload': {'enabled': bool, 'interval_seconds': Number}}},
+    'cpu': _SHELL_GEN,
+    'mem': _SHELL_GEN,
+    'processes': _SHELL_GEN,
+}
+
+
+class ConfigError(ValueError):
+    pass
+
+
+class FrozenDict(dict):
+    """
+    Read-only dict of a configuration snapshot. copy() returns a plain dict that can be changed.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Configuration snapshots are read-only, copy() them to change them")
+
+    __setitem__ = __delitem__ = __ior__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+class FrozenList(list):
+    """
+    Read-only list of a configuration snapshot. copy() and + return plain lists.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Configuration snapshots are read-only, copy() them to change them")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __reduce__(self):
+        return FrozenList, (list(self),)
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+def validate(value, schema, path='settings'):
+    """
+    Check a parsed configuration against a schema of SCHEMAS, and that every lower bound is not above its higher
+    bound
+    :raise ConfigError: Naming the first key that does not match.
+    """
+    if isinstance(schema, dict):
+        if not isinstance(value, dict):
+            raise ConfigError(f"{path} must be a mapping")
+        for key, item in schema.items():
+            if key not in value:
+                raise ConfigError(f"{path}.{key} is missing")
+            validate(value[key], item, f"{path}.{key}")
+        if 'lower' in value and 'higher' in value and value['lower'] > value['higher']:
+            raise ConfigError(f"{path}.lower is above {path}.higher")
+    elif isinstance(schema, list):
+        if not isinstance(value, list) or not value:
+            raise ConfigError(f"{path} must be a non-empty list")
+        for i, item in enumerate(value):
+            validate(item, schema[0], f"{path}[{i}]")
+    elif not isinstance(value, schema) or (isinstance(value, bool) and schema is not bool):
+        raise ConfigError(f"{path} must be of type {schema.__name__}, got {value!r}")
+
+
+class ConfigRegistry:
+    """
+    Parses every configuration file once and shares it as an immutable snapshot.
+    reload() parses again the files whose modification time changed; a valid new version replaces the snapshot
+    atomically and is passed to the subscribers of the file, an invalid one is logged and the previous snapshot
+    stays in use. watch() reloads in a background thread.
+    """
+
+    def __init__(self, directory=CONFIG_DIR):
+        self.directory = directory
+        # name -> (modification time, snapshot)
+        self._snapshots = {}
+        self._subscribers = {}
+        self._lock = threading.RLock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._logger = None
+
+    @property
+    def logger(self):
+        # Created on first use, importing the registry does not open a log file
+        if self._logger is None:
+            self._logger = setup_logger("config")
+        return self._logger
+
+    def path(self, name):
+        return os.path.join(self.directory, f'{name}_config.yaml')
+
+    def _load(self, name):
+        mtime = os.stat(self.path(name)).st_mtime_ns
+        with open(self.path(name), 'r') as file:
+            # The libyaml parser when PyYAML was built with it, several times faster than the pure Python one
+            config = yaml.load(file, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+        validate(config, SCHEMAS.get(name, {'settings': dict}), name)
+        return mtime, freeze(config)
+
+    def get(self, name):
+        """
+        Current snapshot of config/<name>_config.yaml, parsed on first use
+        :param name (str): scheduler, generator, toolkit, cpu, mem or processes.
+        :return:
+            FrozenDict: The parsed file.
+        """
+        entry = self._snapshots.get(name)
+        if entry is None:
+            with self._lock:
+                entry = self._snapshots.get(name)
+                if entry is None:
+                    entry = self._snapshots[name] = self._load(name)
+        return entry[1]
+
+    def subscribe(self, name, callback):
+        """
+        Call callback(snapshot) with every new snapshot of the file, from the thread that reloads it
+        """
+        with self._lock:
+            self._subscribers.setdefault(name, []).append(callback)
+
+    def unsubscribe(self, name, callback):
+        with self._lock:
+            if callback in self._subscribers.get(name, []):
+                self._subscribers[name].remove(callback)
+
+    def reload(self):
+        """
+        Parse again the loaded files that changed on disk
+        :return:
+            list: Names of the files whose snapshot was replaced.
+        """
+        changed = []
+        with self._lock:
+            for name, (mtime, snapshot) in list(self._snapshots.items()):
+                try:
+                    current = os.stat(self.path(name)).st_mtime_ns
+                except OSError:
+                    # Being replaced, e.g. by an editor saving through a rename
+                    continue
+                if current == mtime:
+                    continue
+                try:
+                    entry = self._load(name)
+                except (OSError, yaml.YAMLError, ConfigError) as e:
+                    self.logger.error(f"Keeping the current {name} configuration, the new one is invalid: {e}")
+                    # Do not report the same broken version again
+                    self._snapshots[name] = (current, snapshot)
+                    continue
+                self._snapshots[name] = entry
+                changed.append(name)
+                self.logger.info(f"Reloaded the {name} configuration")
+            callbacks = [(callback, self._snapshots[name][1]) for name in changed
+                         for callback in self._subscribers.get(name, [])]
+        for callback, snapshot in callbacks:
+            try:
+                callback(snapshot)
+            except Exception as e:
+                self.logger.error(f"A configuration subscriber failed: {e}")
+        return changed
+
+    def watch(self, interval_seconds=2):
+        """
+        Reload the changed files every interval_seconds in a daemon thread, until stop()
+        """
+        with self._lock:
+            if self._watcher is not None:
+                return
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, args=(interval_seconds,), name="config-watcher",
+                                             daemon=True)
+            self._watcher.start()
+
+    def _watch(self, interval_seconds):
+        while not self._stop.wait(interval_seconds):
+            self.reload()
+
+    def stop(self):
+        with self._lock:
+            watcher, self._watcher = self._watcher, None
+        if watcher is not None:
+            self._stop.set()
+            watcher.join()
+
+
+registry = ConfigRegistry()
+
+
+def get_config(name):
+    """
+    Shared snapshot of config/<name>_config.yaml, see ConfigRegistry.get
+    """
+    return registry.get(name)
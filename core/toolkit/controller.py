@@ -0,0 +1,344 @@
+import asyncio
+import collections
+import itertools
+import multiprocessing
+import os
+import signal
+
+import numpy as np
+
+from core.arbiter import estimate_demand
+from core.cpu.load_engine import CpuLoadEngine
+from core.toolkit.config import get_config
+from core.toolkit.supervisor import IDLE_CMD, get_supervisor
+from core.toolkit.tools import get_sampler, get_total_memory, parse_stress_duration
+
+config = get_config('scheduler')
+
+config_controller = config['settings']['controller']
+
+# Sampler column followed by the controller of each metric
+CONTROLLED_COLUMNS = {'cpu': 'cpu', 'mem': 'mem_used', 'processes': 'processes'}
+
+
+class PIDController:
+    """
+    Discrete PID controller with a clamped integral, so the integral cannot wind up while the output
+    is saturated
+    """
+
+    def __init__(self, kp, ki, kd, limit=None):
+        """
+        :param kp (float): Proportional gain.
+        :param ki (float): Integral gain, per second.
+        :param kd (float): Derivative gain, in seconds.
+        :param limit (float or None): Largest absolute correction.
+        """
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.limit = limit
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.last_error = None
+
+    def update(self, error, dt):
+        """
+        Return the correction for the current error
+        """
+        self.integral += error * dt
+        if self.limit is not None and self.ki:
+            bound = self.limit / self.ki
+            self.integral = min(max(self.integral, -bound), bound)
+        derivative = 0.0 if self.last_error is None or dt <= 0 else (error - self.last_error) / dt
+        self.last_error = error
+        output = self.kp * error + self.ki * self.integral + self.kd * derivative
+        if self.limit is not None:
+            output = min(max(output, -self.limit), self.limit)
+        return output
+
+
+def _memory_worker(conn, chunk_mb):
+    """
+    Worker process holding the requested amount of memory in written chunks of chunk_mb
+    """
+    chunks = []
+    while True:
+        target = conn.recv()
+        if target is None:
+            return
+        count = max(int(round(target / chunk_mb)), 0)
+        while len(chunks) < count:
+            # Written on creation, so the pages are really committed
+            chunks.append(bytearray(b'\x01') * (chunk_mb * 1024 * 1024))
+        del chunks[count:]
+
+
+class CpuDriver:
+    """
+    Applies a CPU load in percent of the host through a dedicated CpuLoadEngine
+    """
+
+    def __init__(self, cpu_count=None):
+        self.cpu_count = cpu_count or os.cpu_count()
+        self.limit = 100.0
+        self.engine = CpuLoadEngine(workers=self.cpu_count).start()
+
+    def apply(self, value):
+        # Every worker takes the same share of the host load
+        self.engine.set_load(value * self.cpu_count / self.engine.workers)
+
+    def close(self):
+        self.engine.stop()
+
+
+class MemoryDriver:
+    """
+    Holds an amount of memory in MB in a worker process
+    """
+
+    def __init__(self, chunk_mb=None):
+        self.chunk_mb = chunk_mb or config_controller['memory_chunk_mb']
+        self.limit = get_total_memory() * config_controller['memory_limit_percentage'] / 100
+        self._conn, child_conn = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_memory_worker, name="memory-driver", daemon=True,
+                                                args=(child_conn, self.chunk_mb))
+        self._process.start()
+
+    def apply(self, value):
+        self._conn.send(value)
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self._process.join(timeout=1)
+        if self._process.is_alive():
+            self._process.kill()
+
+
+class ProcessCountDriver:
+    """
+    Keeps a number of idle processes alive.
+    The processes are started and reaped by the process supervisor in a task of the event loop, so a large
+    count never stalls the loop, and a run killed before it could clean up has them removed by the next one.
+    """
+
+    def __init__(self, supervisor=None):
+        self.limit = float(config_controller['processes_limit'])
+        self.target = 0
+        self._supervisor = supervisor
+        self._processes = []
+        self._task = None
+
+    def apply(self, value):
+        self.target = max(int(round(value)), 0)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._converge())
+
+    async def _converge(self):
+        supervisor = self._supervisor or get_supervisor()
+        while len(self._processes) != self.target:
+            missing = self.target - len(self._processes)
+            if missing > 0:
+                # A batch at a time, the target may change while they start
+                self._processes += await asyncio.gather(*(supervisor.spawn(IDLE_CMD)
+                                                          for _ in range(min(missing, 100))))
+            else:
+                # Reaped in the background by the supervisor
+                for process in self._processes[self.target:]:
+                    supervisor.terminate(process)
+                del self._processes[self.target:]
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        supervisor = self._supervisor or get_supervisor()
+        for process in self._processes:
+            supervisor.terminate(process)
+        self._processes = []
+        self.target = 0
+
+
+def create_driver(metric, cpu_count=None):
+    """
+    Create the load driver of a metric
+    """
+    if metric == 'cpu':
+        return CpuDriver(cpu_count)
+    elif metric == 'mem':
+        return MemoryDriver()
+    elif metric == 'processes':
+        return ProcessCountDriver()
+    else:
+        raise ValueError("Unknown metric")
+
+
+class LoadController:
+    """
+    Closed-loop load of one metric.
+    Every running drift command adds its estimated demand to the setpoint, the baseline measured before the
+    first command plus the sum of the demands, and the load applied by the driver is the demand corrected
+    by a PID controller so that the sampled metric follows the setpoint within the tolerance band.
+    """
+
+    def __init__(self, metric, driver, cpu_count=None, sampler=None):
+        self.metric = metric
+        self.driver = driver
+        self.cpu_count = cpu_count
+        self.sampler = sampler
+        self.column = CONTROLLED_COLUMNS[metric]
+        gains = config_controller['gains'][metric]
+        self.pid = PIDController(gains['kp'], gains['ki'], gains['kd'], driver.limit)
+        self.tolerance = config_controller['tolerance'][metric]
+        self.interval = config_controller['interval_seconds']
+        self.settle_seconds = config_controller['settle_seconds']
+        self.demand = 0.0
+        self.baseline = None
+        # (timestamp, setpoint, measured) of every control step
+        self.history = collections.deque(maxlen=config_controller['history'])
+        self._lease_ids = itertools.count(1)
+        self._task = None
+        self._wakeup = None
+
+    def _get_sampler(self):
+        return self.sampler or get_sampler()
+
+    def lease(self, cmd):
+        """
+        Add the demand of a drift command until its timeout expires or it is terminated
+        """
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self.run())
+        demand = estimate_demand(cmd, self.cpu_count)[self.metric]
+        timeout = parse_stress_duration(cmd[cmd.index('--timeout') + 1]) if '--timeout' in cmd else None
+        return ControlledLoad(self, next(self._lease_ids), demand, timeout)
+
+    def add_demand(self, demand):
+        if self.baseline is None:
+            # Level of the metric before the first drift command
+            sampler = self._get_sampler()
+            self.baseline = sampler.mean(self.column, self.settle_seconds)
+        self.demand = max(self.demand + demand, 0.0)
+        if self.demand <= 1e-9:
+            self.demand = 0.0
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def step(self, timestamp, measured, dt):
+        """
+        One control step: return the load to apply for the given measurement
+        """
+        if self.demand == 0.0:
+            self.baseline = None
+            self.pid.reset()
+            return 0.0
+        setpoint = self.baseline + self.demand
+        self.history.append((timestamp, setpoint, measured))
+        correction = self.pid.update(setpoint - measured, dt)
+        return min(max(self.demand + correction, 0.0), self.driver.limit)
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        last = loop.time()
+        applied = None
+        while True:
+            if self.demand == 0.0 and applied == 0.0:
+                # Nothing to hold, sleep until the next command
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                last = loop.time()
+            await asyncio.sleep(self.interval)
+            now = loop.time()
+            sampler = self._get_sampler()
+            value = self.step(sampler.latest('timestamp'), sampler.latest(self.column), now - last)
+            last = now
+            if value != applied:
+                self.driver.apply(value)
+                applied = value
+
+    def report(self, since=None, until=None):
+        """
+        Tracking quality of the control steps between two moments.
+        For every setpoint change, the convergence time is the delay until the metric stays inside the tolerance
+        band for settle_seconds, and the steady-state error is the mean absolute error once converged.
+        :param since (float or None): Timestamp of the first step to consider.
+        :param until (float or None): Timestamp of the last step to consider.
+        :return:
+            dict: Number of setpoints, how many converged, the longest convergence time and the
+            steady-state error, None when nothing converged.
+        """
+        rows = np.array([row for row in self.history
+                         if (since is None or row[0] >= since) and (until is None or row[0] <= until)])
+        report = {'setpoints': 0, 'converged': 0, 'convergence_seconds': None, 'steady_state_error': None}
+        if len(rows) == 0:
+            return report
+        changes = np.flatnonzero(np.abs(np.diff(rows[:, 1])) > 1e-9) + 1
+        convergence, settled_errors = [], []
+        for segment in np.split(rows, changes):
+            report['setpoints'] += 1
+            errors = np.abs(segment[:, 1] - segment[:, 2])
+            run_start = None
+            for i, (timestamp, error) in enumerate(zip(segment[:, 0], errors)):
+                if error > self.tolerance:
+                    run_start = None
+                    continue
+                if run_start is None:
+                    run_start = i
+                if timestamp - segment[run_start, 0] >= self.settle_seconds:
+                    convergence.append(segment[run_start, 0] - segment[0, 0])
+                    settled_errors.extend(errors[run_start:])
+                    break
+        report['converged'] = len(convergence)
+        if convergence:
+            report['convergence_seconds'] = float(max(convergence))
+            report['steady_state_error'] = float(np.mean(settled_errors))
+        return report
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        self.driver.close()
+
+
+class ControlledLoad:
+    """
+    Handle of the demand one drift command adds to a LoadController, with the interface of an asyncio subprocess
+    """
+
+    def __init__(self, controller, lease_id, demand, timeout=None):
+        self.lease_id = lease_id
+        self.returncode = None
+        self._controller = controller
+        self._demand = demand
+        self._done = asyncio.Event()
+        self._timer = None
+        controller.add_demand(demand)
+        if timeout is not None:
+            self._timer = asyncio.get_event_loop().call_later(timeout, self._finish, 0)
+
+    def _finish(self, returncode):
+        if self.returncode is not None:
+            return
+        self.returncode = returncode
+        self._controller.add_demand(-self._demand)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._done.set()
+
+    async def wait(self):
+        await self._done.wait()
+        return self.returncode
+
+    def send_signal(self, sig):
+        self._finish(-sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
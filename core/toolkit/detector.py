@@ -0,0 +1,56 @@
+import collections
+
+import numpy as np
+
+# Result of a detection: the moment the series settled, the settled level and the confidence in [0, 1]
+SteadyState = collections.namedtuple('SteadyState', ['timestamp', 'level', 'confidence'])
+
+
+class SteadyStateDetector:
+    """
+    Plateau detector for a metric series sampled at high frequency.
+    The series is smoothed with an EWMA, and a sliding window of the last window_seconds is tested:
+    the series has settled when the fitted slope moves the level by less than slope_tolerance over the
+    window and the standard deviation of the raw samples stays below std_tolerance.
+    """
+
+    def __init__(self, window_seconds, slope_tolerance, std_tolerance, alpha=0.3):
+        """
+        :param window_seconds (float): Length of the sliding window.
+        :param slope_tolerance (float): Largest change of the level over one window, in metric units.
+        :param std_tolerance (float): Largest standard deviation inside the window, in metric units.
+        :param alpha (float): Smoothing factor of the EWMA.
+        """
+        self.window_seconds = window_seconds
+        self.slope_tolerance = slope_tolerance
+        self.std_tolerance = std_tolerance
+        self.alpha = alpha
+        self.ewma = None
+        self._samples = collections.deque()
+
+    def update(self, timestamp, value):
+        """
+        Add a sample and test the window.
+        :param timestamp (float): Time of the sample in seconds since the epoch.
+        :param value (float): The sampled metric.
+        :return:
+            SteadyState: When the window is stable, the start of the stable window and its confidence.
+            None: The series has not settled yet.
+        """
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+        self._samples.append((timestamp, value, self.ewma))
+        while timestamp - self._samples[0][0] > self.window_seconds:
+            self._samples.popleft()
+        # Wait for a full window before judging
+        if len(self._samples) < 3 or timestamp - self._samples[0][0] < self.window_seconds * 0.9:
+            return None
+
+        window = np.array(self._samples)
+        times = window[:, 0] - window[0, 0]
+        slope = np.polyfit(times, window[:, 2], 1)[0]
+        slope_ratio = abs(slope) * self.window_seconds / self.slope_tolerance
+        std_ratio = float(np.std(window[:, 1])) / self.std_tolerance
+        if slope_ratio >= 1 or std_ratio >= 1:
+            return None
+        confidence = float(1 - max(slope_ratio, std_ratio))
+        return SteadyState(float(window[0, 0]), float(self.ewma), confidence)
@@ -0,0 +1,226 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+from core.toolkit.config import get_config
+from core.toolkit.logger import setup_logger
+
+config = get_config('toolkit')
+
+config_label_writer = config['settings']['label_writer']
+
+# Errors of a sink that is unreachable for now, by class name so the database drivers are not imported here:
+# psycopg2 and sqlite3 raise OperationalError for a lost connection or a locked database
+TRANSIENT_ERRORS = ('OperationalError', 'InterfaceError', 'PoolError')
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def is_transient(error):
+    """
+    Whether a sink error is worth retrying, as opposed to a batch the sink rejects for its data
+    """
+    return isinstance(error, OSError) or any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__)
+
+
+class LabelWriter:
+    """
+    Background writer of drift labels.
+    Every label is first appended to an append-only spool file and then queued; a writer thread sends the
+    queue to the sink in batches and records in offset_file how far the spool has been written. A batch the
+    sink can not reach is retried until it goes through, and the labels a previous run could not write are
+    replayed from the spool on start, so no label is lost and the caller never waits for the database.
+    Labels the sink rejects for their data are moved to dead_letter_file instead of holding back the others.
+    """
+
+    def __init__(self, sink, spool_file=None, batch_size=None, flush_seconds=None, retry_seconds=None):
+        """
+        :param sink (callable): Writes a list of (metric, drift_label, drift_start, drift_end) rows, raises on failure.
+        :param spool_file (str): Path of the spool, the offset is kept next to it in spool_file + '.offset' and
+            the rejected labels in spool_file + '.rejected'.
+        :param batch_size (int): Largest number of labels per write.
+        :param flush_seconds (float): Longest time a label waits for its batch to fill up.
+        :param retry_seconds (float): Delay before retrying a failed batch.
+        """
+        self.sink = sink
+        self.spool_file = spool_file or config_label_writer['spool_file']
+        self.offset_file = self.spool_file + '.offset'
+        self.dead_letter_file = self.spool_file + '.rejected'
+        self.batch_size = batch_size or config_label_writer['batch_size']
+        self.flush_seconds = flush_seconds if flush_seconds is not None else config_label_writer['flush_seconds']
+        self.retry_seconds = retry_seconds if retry_seconds is not None else config_label_writer['retry_seconds']
+        self.written = 0
+        self.failures = 0
+        self.rejected = 0
+        self.logger = setup_logger("label_writer")
+        # (row, end offset of the row in the spool)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        os.makedirs(os.path.dirname(self.spool_file) or '.', exist_ok=True)
+        self._offset = self._read_offset()
+        self._replay()
+
+    def _read_offset(self):
+        try:
+            with open(self.offset_file, 'r') as file:
+                return int(file.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _save_offset(self, offset):
+        tmp_file = self.offset_file + '.tmp'
+        with open(tmp_file, 'w') as file:
+            file.write(str(offset))
+        os.replace(tmp_file, self.offset_file)
+
+    def _replay(self):
+        """
+        Queue the labels of the spool that were not written yet
+        """
+        if not os.path.exists(self.spool_file):
+            return
+        replayed = 0
+        if self._offset > os.path.getsize(self.spool_file):
+            # Stale offset of a spool emptied by a crashed older version, the labels appended since start at 0
+            self._offset = 0
+            self._save_offset(0)
+        with open(self.spool_file, 'rb+') as file:
+            file.seek(self._offset)
+            end = self._offset
+            for line in iter(file.readline, b''):
+                if not line.endswith(b'\n'):
+                    # Torn last line of a crashed run, the label was never acknowledged
+                    file.truncate(end)
+                    break
+                end = file.tell()
+                self._queue.put((tuple(json.loads(line)), end))
+                replayed += 1
+        if replayed:
+            self.logger.info(f"Replaying {replayed} labels from {self.spool_file}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="label-writer", daemon=True)
+        self._thread.start()
+        return self
+
+    def write(self, metric, drift_label, drift_start, drift_end):
+        """
+        Journal a label to the spool and queue it, without waiting for the sink
+        """
+        row = (metric, drift_label, drift_start, drift_end)
+        line = (json.dumps(row) + '\n').encode()
+        with self._lock:
+            with open(self.spool_file, 'ab') as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+                end = file.tell()
+            self._queue.put((row, end))
+
+    def _next_batch(self):
+        """
+        Wait for a first label, then collect more until the batch is full or flush_seconds have passed
+        """
+        try:
+            batch = [self._queue.get(timeout=self.flush_seconds)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if self._stopping.is_set() or timeout <= 0:
+                timeout = 0
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch and not self._write_batch(batch):
+                # Later labels must not be committed past the ones that failed
+                return
+
+    def _write_batch(self, batch):
+        while True:
+            try:
+                self._send([row for row, _ in batch])
+                break
+            except Exception as e:
+                self.failures += 1
+                self.logger.warning(f"Could not write {len(batch)} labels, retrying in {self.retry_seconds}s: {e}")
+                if self._stopping.wait(self.retry_seconds):
+                    # Leave them in the spool for the next run
+                    return False
+        self.written += len(batch)
+        self._commit(batch[-1][1])
+        return True
+
+    def _send(self, rows):
+        """
+        Write rows to the sink. When the sink rejects them for their data, write them one by one and quarantine
+        the rows it still rejects; transient errors are raised so the batch is retried
+        """
+        try:
+            self.sink(rows)
+            return
+        except Exception as e:
+            if is_transient(e):
+                raise
+            if len(rows) == 1:
+                self._quarantine(rows[0], e)
+                return
+        for row in rows:
+            self._send([row])
+
+    def _quarantine(self, row, error):
+        with open(self.dead_letter_file, 'a') as file:
+            file.write(json.dumps({'row': row, 'error': f"{type(error).__name__}: {error}"}) + '\n')
+        self.rejected += 1
+        self.logger.error(f"The sink rejected the label {row}, moved it to {self.dead_letter_file}: {error}")
+
+    def _commit(self, offset):
+        """
+        Record that the spool is written up to offset, and empty it once everything is written
+        """
+        with self._lock:
+            self._offset = offset
+            if self._queue.empty() and os.path.getsize(self.spool_file) == offset:
+                # The offset is reset before the spool is emptied: a crash in between replays the written
+                # labels again on the next start instead of skipping the next ones
+                self._offset = 0
+                self._save_offset(0)
+                os.truncate(self.spool_file, 0)
+            else:
+                self._save_offset(self._offset)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self, timeout=None):
+        """
+        Flush the queued labels, waiting at most timeout seconds; unwritten labels stay in the spool
+        """
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout if timeout is not None else config_label_writer['close_timeout_seconds'])
+        if os.path.exists(self.spool_file) and os.path.getsize(self.spool_file) > self._offset:
+            self.logger.warning(f"Unwritten labels left in {self.spool_file} for the next run")
+
+
+def get_label_writer(sink):
+    # Start the shared label writer on first use, it flushes what it can when the interpreter exits
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LabelWriter(sink).start()
+            atexit.register(_writer.close)
+    return _writer
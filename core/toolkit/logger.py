@@ -1,12 +1,17 @@
 import logging
 import datetime
+import os
 
 def setup_logger(logger_name, log_level=logging.INFO):
     logger = logging.getLogger(logger_name)
     logger.setLevel(log_level)
+    # Loggers are shared per name, do not attach the handlers twice
+    if logger.handlers:
+        return logger
     # Create a formatter
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    # Create a file handler
+    # Create a file handler, in the logs directory created on first use
+    os.makedirs("logs", exist_ok=True)
     log_file_path = "logs/{}_{}.log".format(logger_name, datetime.datetime.now().strftime("%Y-%m-%d_%H"))
     # For output to file
     file_handler = logging.FileHandler(log_file_path)
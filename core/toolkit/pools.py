@@ -1,26 +1,45 @@
-import datetime
+import contextlib
+import threading
+import time
 
 import psycopg2
-import yaml
-from psycopg2.pool import ThreadedConnectionPool
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from psycopg2.pool import PoolError, ThreadedConnectionPool
 
-# 加载配置文件
-with open('config/toolkit_config.yaml', 'r') as file:
-    config = yaml.safe_load(file)
+from core.toolkit.config import get_config
+# perform_insert now writes through the configured label sink, kept importable from here
+from core.toolkit.sinks import METRICS, perform_insert  # noqa: F401
+
+config = get_config('toolkit')
 
 config_sql = config['settings']['postgresql']
 
 
 class PostgreSQLConnectionPool:
+    """
+    Thread-safe connection pool created on first use, so importing this module never touches the network.
+    Checkouts wait for a free connection instead of failing, connections idle for longer than
+    health_check_seconds are validated before they are handed out, and broken ones are recycled.
+    """
     _instance = None
 
-    def __init__(self, min_conn=1, max_conn=20, **kwargs):
+    def __init__(self, min_conn=1, max_conn=20, health_check_seconds=None, checkout_timeout_seconds=None,
+                 **kwargs):
         if self._instance is None:
-            self.pool = ThreadedConnectionPool(
-                minconn=min_conn,
-                maxconn=max_conn,
-                **kwargs
-            )
+            self.min_conn = min_conn
+            self.max_conn = max_conn
+            self.health_check_seconds = health_check_seconds if health_check_seconds is not None \
+                else config_sql['health_check_seconds']
+            self.checkout_timeout_seconds = checkout_timeout_seconds if checkout_timeout_seconds is not None \
+                else config_sql['checkout_timeout_seconds']
+            self.connect_kwargs = kwargs
+            self.pool = None
+            self._lock = threading.Lock()
+            self._slots = threading.BoundedSemaphore(max_conn)
+            # id(connection) -> time it was last known to work
+            self._last_used = {}
+            self._stats = {'checkouts': 0, 'failures': 0, 'recycled': 0, 'wait_seconds': 0.0}
             self._instance = self
         else:
             raise Exception("Trying to create a new instance but one already exists")
@@ -31,24 +50,121 @@ class PostgreSQLConnectionPool:
             cls._instance = cls(min_conn, max_conn, **kwargs)
         return cls._instance
 
-    def get_connection(self):
-        return self.pool.getconn()
+    def _get_pool(self):
+        with self._lock:
+            if self.pool is None:
+                self.pool = ThreadedConnectionPool(
+                    minconn=self.min_conn,
+                    maxconn=self.max_conn,
+                    **self.connect_kwargs
+                )
+            return self.pool
+
+    def _is_alive(self, conn):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.health_check_seconds:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _discard(self, conn):
+        self._last_used.pop(id(conn), None)
+        self._count('recycled')
+        self.pool.putconn(conn, close=True)
 
-    def return_connection(self, connection):
-        self.pool.putconn(connection)
+    def get_connection(self):
+        """
+        Check out a validated connection, waiting at most checkout_timeout_seconds for a free one.
+        Prefer connection(), which always gives it back.
+        """
+        begin = time.monotonic()
+        if not self._slots.acquire(timeout=self.checkout_timeout_seconds):
+            self._count('failures')
+            raise PoolError(f"No free connection after {self.checkout_timeout_seconds}s")
+        try:
+            pool = self._get_pool()
+            # Every connection of the pool may have died with the server, try each once plus a new one
+            for _ in range(self.max_conn + 1):
+                conn = pool.getconn()
+                if self._is_alive(conn):
+                    break
+                self._discard(conn)
+            else:
+                raise psycopg2.OperationalError("No working connection to the database")
+        except Exception:
+            self._slots.release()
+            self._count('failures')
+            raise
+        self._count('checkouts')
+        self._count('wait_seconds', time.monotonic() - begin)
+        return conn
+
+    def return_connection(self, connection, broken=False):
+        try:
+            if broken or connection.closed:
+                self._discard(connection)
+            else:
+                self._last_used[id(connection)] = time.monotonic()
+                self.pool.putconn(connection)
+        finally:
+            self._slots.release()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """
+        Check out a connection for the duration of a with block.
+        It is rolled back if the block raises, and recycled if the error broke it.
+        """
+        conn = self.get_connection()
+        broken = False
+        try:
+            yield conn
+        except BaseException as e:
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)) or conn.closed
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    broken = True
+            raise
+        finally:
+            self.return_connection(conn, broken)
+
+    def stats(self):
+        """
+        :return:
+            dict: Number of checkouts, failed checkouts, recycled connections, total and mean wait in seconds.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['mean_wait_seconds'] = stats['wait_seconds'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
 
     def close_all(self):
-        self.pool.closeall()
+        with self._lock:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+            self._last_used.clear()
 
     def execute(self, sql, params=None):
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(sql, params)
-        conn.commit()
-        self.return_connection(conn)
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, params)
+            conn.commit()
 
 
-# 设置连接池为模块的变量
+# 设置连接池为模块的变量，首次使用时才建立连接
 pool = PostgreSQLConnectionPool(
     min_conn=config_sql['minconn'],
     max_conn=config_sql['maxconn'],
@@ -60,32 +176,21 @@ pool = PostgreSQLConnectionPool(
 )
 
 
-def perform_insert(data, metric):
-    # 基本的数据处理
-    drift_label, drift_start, drift_end = data[0], data[1][0], data[1][1]
-    drift_start = drift_start.strftime('%Y-%m-%d %H:%M:%S')
-    drift_end = drift_end.strftime('%Y-%m-%d %H:%M:%S')
-
-    # 确定sql语句
-    if metric in ['cpu', 'mem', 'processes']:
-        sql = f'INSERT INTO {metric} (drift_label, drift_start, drift_end) VALUES (%s, %s, %s)'
-    else:
-        raise Exception(f"This {metric} type is not currently supported.")
-    # 执行参数
-    params = (drift_label, drift_start, drift_end)
+def insert_labels(rows):
+    """
+    Write a batch of labels in one transaction, raising on a database error so the batch can be retried
+    :param rows (list): (metric, drift_label, drift_start, drift_end) tuples.
+    """
+    by_metric = {}
+    for metric, drift_label, drift_start, drift_end in rows:
+        if metric not in METRICS:
+            raise Exception(f"This {metric} type is not currently supported.")
+        by_metric.setdefault(metric, []).append((drift_label, drift_start, drift_end))
 
-    # 从连接池中获取连接
-    conn = pool.get_connection()
-    try:
+    with pool.connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute(sql, params)
-            conn.commit()
-            print("Data successfully inserted into the database.")
-    except (psycopg2.DatabaseError, psycopg2.OperationalError) as e:
-        print(f"Error: {e}")
-        conn.rollback()
-    except Exception as e:
-        print(f"Unhandled exception: {e}")
-        conn.rollback()
-    finally:
-        pool.return_connection(conn)
\ No newline at end of file
+            for metric, params in by_metric.items():
+                query = sql.SQL('INSERT INTO {} (drift_label, drift_start, drift_end) VALUES %s').format(
+                    sql.Identifier(metric))
+                execute_values(cursor, query, params)
+        conn.commit()
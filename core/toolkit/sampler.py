@@ -0,0 +1,204 @@
+import threading
+import time
+
+import numpy as np
+import psutil
+
+from core.toolkit.config import get_config
+from core.toolkit.logger import setup_logger
+
+config = get_config('toolkit')
+
+config_sampler = config['settings']['sampler']
+
+# Columns recorded for every sample
+COLUMNS = ('timestamp', 'cpu', 'mem_used', 'mem_percent', 'mem_available', 'processes')
+
+
+class RingBuffer:
+    """
+    Fixed-size NumPy ring buffer of metric samples.
+    Next to the samples it keeps running sums, so both the latest value and the mean of the
+    last n samples are read in O(1).
+    """
+
+    def __init__(self, capacity, columns=COLUMNS):
+        self.capacity = capacity
+        self.columns = {name: i for i, name in enumerate(columns)}
+        self._data = np.zeros((capacity, len(columns)))
+        self._sums = np.zeros((capacity, len(columns)))
+        self._total = np.zeros(len(columns))
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def count(self):
+        # Number of samples appended since creation
+        return self._count
+
+    def append(self, row):
+        with self._lock:
+            index = self._count % self.capacity
+            self._total += row
+            self._data[index] = row
+            self._sums[index] = self._total
+            self._count += 1
+
+    def extend(self, rows):
+        """
+        Append several samples at once
+        """
+        rows = np.asarray(rows, dtype=float)[-self.capacity:]
+        if len(rows) == 0:
+            return
+        with self._lock:
+            sums = self._total + np.cumsum(rows, axis=0)
+            index = (self._count + np.arange(len(rows))) % self.capacity
+            self._data[index] = rows
+            self._sums[index] = sums
+            self._total = sums[-1]
+            self._count += len(rows)
+
+    def latest(self, column):
+        """
+        Return the most recent value of a column
+        """
+        with self._lock:
+            if self._count == 0:
+                raise LookupError("No samples recorded yet")
+            return float(self._data[(self._count - 1) % self.capacity, self.columns[column]])
+
+    def mean(self, column, n):
+        """
+        Return the mean of the last n values of a column
+        """
+        with self._lock:
+            if self._count == 0:
+                raise LookupError("No samples recorded yet")
+            col = self.columns[column]
+            last = (self._count - 1) % self.capacity
+            # The running sum just before the window must still be in the buffer
+            n = max(1, min(int(n), self._count, self.capacity - 1))
+            if n == self._count:
+                return float(self._sums[last, col] / n)
+            before = (self._count - 1 - n) % self.capacity
+            return float((self._sums[last, col] - self._sums[before, col]) / n)
+
+    def tail(self, n):
+        """
+        Return a copy of the last n samples in chronological order
+        """
+        with self._lock:
+            n = min(n, self._count, self.capacity)
+            order = np.arange(self._count - n, self._count) % self.capacity
+            return self._data[order].copy()
+
+    def snapshot(self, column=None):
+        """
+        Return a copy of the buffered samples in chronological order
+        """
+        with self._lock:
+            size = min(self._count, self.capacity)
+            start = self._count - size
+            order = np.arange(start, self._count) % self.capacity
+            data = self._data[order].copy()
+        return data if column is None else data[:, self.columns[column]]
+
+
+class MetricSampler(threading.Thread):
+    """
+    Background thread that records CPU, memory and process count at a fixed rate into a RingBuffer.
+    The time spent probing is accounted, and the sampler backs off when probing would take more than
+    max_overhead of one core.
+    """
+
+    def __init__(self, interval=None, capacity=None, max_overhead=None):
+        super().__init__(name="metric-sampler", daemon=True)
+        self.interval = interval if interval is not None else config_sampler['interval_seconds']
+        self.max_overhead = max_overhead if max_overhead is not None else config_sampler['max_overhead']
+        self.buffer = RingBuffer(capacity if capacity is not None else config_sampler['capacity'])
+        self.busy_seconds = 0.0
+        self.started_at = None
+        self._listeners = []
+        self._ready = threading.Event()
+        self._stopped = threading.Event()
+        self.logger = setup_logger("sampler")
+
+    def _probe(self):
+        cpu = psutil.cpu_percent(interval=None)
+        memory = psutil.virtual_memory()
+        try:
+            processes = len(psutil.pids())
+        except Exception as e:
+            self.logger.warning(f"Could not count the processes: {e}. Check if the required files are accessible.")
+            processes = self.buffer.latest('processes') if self.buffer.count else 20
+        return (time.time(), cpu, memory.used / (1024 * 1024), memory.percent,
+                memory.available / (1024 * 1024), processes)
+
+    def add_listener(self, listener):
+        """
+        Register a callable invoked with every new sample row
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def run(self):
+        self.started_at = time.perf_counter()
+        # The first cpu_percent call only sets the reference point for the next one
+        psutil.cpu_percent(interval=None)
+        if self._stopped.wait(self.interval):
+            return
+        while True:
+            begin = time.perf_counter()
+            row = self._probe()
+            self.buffer.append(row)
+            for listener in self._listeners:
+                try:
+                    listener(row)
+                except Exception as e:
+                    self.logger.error(f"Sample listener {listener} failed: {e}")
+            self._ready.set()
+            elapsed = time.perf_counter() - begin
+            self.busy_seconds += elapsed
+            if self._stopped.wait(self._next_wait(elapsed)):
+                break
+
+    def _next_wait(self, elapsed):
+        # Keep the busy share of the sampler below max_overhead
+        return max(self.interval - elapsed, elapsed * (1 / self.max_overhead - 1))
+
+    def wait_ready(self, timeout=None):
+        """
+        Block until the first sample has been recorded
+        """
+        return self._ready.wait(timeout)
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self):
+        """
+        Return the number of samples and the measured overhead of the sampler
+        """
+        wall = time.perf_counter() - self.started_at if self.started_at else 0.0
+        count = self.buffer.count
+        return {
+            'samples': count,
+            'mean_probe_seconds': self.busy_seconds / count if count else 0.0,
+            'overhead': self.busy_seconds / wall if wall else 0.0,
+        }
+
+    def latest(self, column):
+        return self.buffer.latest(column)
+
+    def mean(self, column, window):
+        """
+        Return the mean of a column over the last window seconds
+        """
+        return self.buffer.mean(column, max(window / self.interval, 1))
@@ -0,0 +1,336 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+from core.toolkit.config import get_config
+from core.toolkit.label_writer import get_label_writer
+
+config = get_config('toolkit')
+
+config_sink = config['settings']['label_sink']
+
+# Tables of the drift labels, one per metric in PostgreSQL
+METRICS = ['cpu', 'mem', 'processes']
+COLUMNS = ['metric', 'drift_label', 'drift_start', 'drift_end']
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+class LabelSink:
+    """
+    Destination of the drift labels written by the label writer.
+    write receives a batch of (metric, drift_label, drift_start, drift_end) rows and raises when the batch
+    could not be stored, so the label writer retries it. Local sinks also hand their labels over to another
+    sink with sync_labels, batch by batch through unsynced and mark_synced.
+    """
+
+    def write(self, rows):
+        raise NotImplementedError
+
+    def unsynced(self, batch_size):
+        """
+        Yield (key, rows) for every batch not synced yet, key is passed to mark_synced once it is stored elsewhere
+        """
+        raise NotImplementedError(f"{type(self).__name__} can not be synced")
+
+    def mark_synced(self, key):
+        raise NotImplementedError(f"{type(self).__name__} can not be synced")
+
+    def close(self):
+        pass
+
+
+class PostgreSQLSink(LabelSink):
+    """
+    Labels inserted into the per-metric tables of the PostgreSQL database
+    """
+
+    def write(self, rows):
+        # Imported on use, so local sinks never need the database configuration
+        from core.toolkit.pools import insert_labels
+        insert_labels(rows)
+
+
+class SQLiteSink(LabelSink):
+    """
+    Labels kept in a local SQLite database in WAL mode, appending never blocks the readers of the file
+    """
+
+    def __init__(self, path=None):
+        self.path = path or config_sink['sqlite_path']
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        # Imported on use like the other sinks, the scheduler only pays for the sink it writes to
+        import sqlite3
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS labels (id INTEGER PRIMARY KEY, metric TEXT, '
+                           'drift_label TEXT, drift_start TEXT, drift_end TEXT, synced INTEGER DEFAULT 0)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS labels_synced ON labels (synced, id)')
+        self._conn.commit()
+
+    def write(self, rows):
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT INTO labels (metric, drift_label, drift_start, drift_end) '
+                                   'VALUES (?, ?, ?, ?)', [tuple(row) for row in rows])
+
+    def read(self, metric=None):
+        with self._lock:
+            if metric is None:
+                cursor = self._conn.execute('SELECT metric, drift_label, drift_start, drift_end FROM labels '
+                                            'ORDER BY id')
+            else:
+                cursor = self._conn.execute('SELECT metric, drift_label, drift_start, drift_end FROM labels '
+                                            'WHERE metric = ? ORDER BY id', (metric,))
+            return cursor.fetchall()
+
+    def unsynced(self, batch_size):
+        while True:
+            with self._lock:
+                batch = self._conn.execute('SELECT id, metric, drift_label, drift_start, drift_end FROM labels '
+                                           'WHERE synced = 0 ORDER BY id LIMIT ?', (batch_size,)).fetchall()
+            if not batch:
+                return
+            yield batch[-1][0], [tuple(row[1:]) for row in batch]
+
+    def mark_synced(self, key):
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE labels SET synced = 1 WHERE synced = 0 AND id <= ?', (key,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class ParquetSink(LabelSink):
+    """
+    Labels appended to a directory of Parquet files, rolled into one part per period of roll_seconds.
+    Every batch is first written as a small immutable segment of its period, the segments are compacted into
+    the part of the period once the period is over, once compact_segments of them piled up, and on close.
+    A part keeps the segments it absorbed and the rows synced at that time in its metadata, so an interrupted
+    compaction neither loses nor repeats labels. The rows synced of every file are kept in a ledger next to
+    it, a batch marked synced only ever rewrites the ledger of its own file.
+    """
+    LEDGER = '.synced'
+
+    def __init__(self, directory=None, roll_seconds=None, compact_segments=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("The parquet label sink needs pyarrow, install it with pip install pyarrow")
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        self.directory = directory or config_sink['parquet_directory']
+        self.roll_seconds = roll_seconds or config_sink['parquet_roll_seconds']
+        self.compact_segments = compact_segments or config_sink['parquet_compact_segments']
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._sequence = 0
+
+    def _period(self, timestamp):
+        start = int(timestamp // self.roll_seconds) * self.roll_seconds
+        return time.strftime('%Y%m%dT%H%M%S', time.gmtime(start))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _metadata(self, name):
+        # (absorbed segment -> its first row in the part, rows synced when the part was written)
+        metadata = self._pq.read_schema(self._path(name)).metadata or {}
+        return json.loads(metadata.get(b'segments', b'{}')), int(metadata.get(b'synced', b'0'))
+
+    def _files(self):
+        """
+        Parts and segments in the order of their labels, without the segments a part already absorbed
+        """
+        names = [name for name in os.listdir(self.directory) if name.endswith('.parquet')]
+        parts = [name for name in names if name.startswith('part-')]
+        absorbed = set()
+        for name in parts:
+            absorbed.update(self._metadata(name)[0])
+        files = parts + [name for name in names if name.startswith('segment-') and name not in absorbed]
+        # part-<period>.parquet holds older labels than segment-<period>-<time>-<sequence>.parquet
+        return sorted(files, key=lambda name: (name.split('-')[1].split('.')[0], name.startswith('segment-'), name))
+
+    def _write_file(self, name, table):
+        path = self._path(name)
+        # Written aside and renamed, a reader never sees a partial file
+        self._pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def write(self, rows):
+        columns = list(zip(*rows)) if rows else [[] for _ in COLUMNS]
+        table = self._pa.table({name: self._pa.array(values, type=self._pa.string())
+                                for name, values in zip(COLUMNS, columns)})
+        period = self._period(time.time())
+        with self._lock:
+            self._sequence += 1
+            self._write_file(f"segment-{period}-{time.time_ns()}-{self._sequence:06d}.parquet", table)
+            self._roll(period)
+
+    def _roll(self, period=None):
+        """
+        Compact the segments of the periods that are over, and of the current one once there are
+        compact_segments of them; every period when period is None
+        """
+        segments = {}
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith('segment-') and name.endswith('.parquet'):
+                segments.setdefault(name.split('-')[1], []).append(name)
+        for segment_period, names in segments.items():
+            if period is None or segment_period != period or len(names) >= self.compact_segments:
+                self._compact(segment_period, names)
+
+    def _compact(self, period, segments):
+        """
+        Rewrite the part of a period together with its new segments, then remove the segments
+        """
+        part = f"part-{period}.parquet"
+        names = segments
+        if os.path.exists(self._path(part)):
+            # Left behind by a compaction interrupted after the part was written
+            absorbed = self._metadata(part)[0]
+            for name in absorbed:
+                self._remove(name)
+            segments = [name for name in segments if name not in absorbed]
+            if not segments:
+                return
+            names = [part] + segments
+        tables = [self._pq.read_table(self._path(name), columns=COLUMNS) for name in names]
+        offsets, synced, row = {}, 0, 0
+        # The synced rows are always a prefix, they stay one in the part
+        prefix = True
+        for name, table in zip(names, tables):
+            offsets[name] = row
+            done = self._synced(name)
+            if prefix:
+                synced += done
+                prefix = done >= table.num_rows
+            row += table.num_rows
+        offsets.pop(part, None)
+        metadata = {b'segments': json.dumps(offsets).encode(), b'synced': str(synced).encode()}
+        self._write_file(part, self._pa.concat_tables(tables).replace_schema_metadata(metadata))
+        for name in segments:
+            self._remove(name)
+
+    def _remove(self, name):
+        for path in (self._path(name), self._path(name) + self.LEDGER):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _read_part(self, name):
+        table = self._pq.read_table(self._path(name), columns=COLUMNS)
+        return list(zip(*(table.column(column).to_pylist() for column in COLUMNS)))
+
+    def read(self, metric=None):
+        with self._lock:
+            rows = [row for name in self._files() for row in self._read_part(name)]
+        return rows if metric is None else [row for row in rows if row[0] == metric]
+
+    def _synced(self, name):
+        # Rows of a file synced so far, from its ledger or, for a part, from the time it was written
+        synced = self._metadata(name)[1] if name.startswith('part-') else 0
+        ledger = self._path(name) + self.LEDGER
+        if os.path.exists(ledger):
+            with open(ledger, 'r') as file:
+                synced = max(synced, int(file.read().strip() or 0))
+        return synced
+
+    def unsynced(self, batch_size):
+        with self._lock:
+            files = [(name, self._synced(name)) for name in self._files()]
+        for name, synced in files:
+            with self._lock:
+                if not os.path.exists(self._path(name)):
+                    # Compacted meanwhile, the next sync continues from its part
+                    return
+                rows = self._read_part(name)
+            for start in range(synced, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                yield (name, start + len(batch)), batch
+
+    def mark_synced(self, key):
+        name, synced = key
+        with self._lock:
+            if not os.path.exists(self._path(name)):
+                # Compacted while it was synced, its rows moved into the part of its period
+                part = f"part-{name.split('-')[1]}.parquet"
+                offset = self._metadata(part)[0].get(name) if os.path.exists(self._path(part)) else None
+                if offset is None:
+                    # Compacted twice since, the rows are synced again next time
+                    return
+                synced += offset
+                name = part
+            if synced <= self._synced(name):
+                return
+            ledger = self._path(name) + self.LEDGER
+            with open(ledger + '.tmp', 'w') as file:
+                file.write(f"{synced}\n")
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(ledger + '.tmp', ledger)
+
+    def close(self):
+        with self._lock:
+            self._roll()
+
+
+def create_sink(backend=None):
+    """
+    Create the label sink of a backend, by default the one configured in label_sink.backend
+    """
+    backend = backend or config_sink['backend']
+    if backend == 'postgresql':
+        return PostgreSQLSink()
+    elif backend == 'sqlite':
+        return SQLiteSink()
+    elif backend == 'parquet':
+        return ParquetSink()
+    else:
+        raise ValueError(f"Unknown label sink {backend}")
+
+
+def get_sink():
+    # Create the configured label sink on first use
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = create_sink()
+            # Registered before the label writer, so it runs after the writer flushed its last labels
+            atexit.register(_sink.close)
+    return _sink
+
+
+def sync_labels(source, target, batch_size=None):
+    """
+    Copy the labels a local sink has not synced yet to another sink, typically PostgreSQL once the
+    collection box is back online. A batch is marked synced only after the target stored it.
+    :return:
+        int: The number of synced labels.
+    """
+    batch_size = batch_size or config_sink['sync_batch_size']
+    synced = 0
+    for key, rows in source.unsynced(batch_size):
+        target.write(rows)
+        source.mark_synced(key)
+        synced += len(rows)
+    return synced
+
+
+def perform_insert(data, metric):
+    """
+    Queue a drift label for the background label writer, which stores it in the configured label sink.
+    The label is journaled to the spool before this returns.
+    """
+    # 基本的数据处理
+    drift_label, drift_start, drift_end = data[0], data[1][0], data[1][1]
+    drift_start = drift_start.strftime('%Y-%m-%d %H:%M:%S.%f')
+    drift_end = drift_end.strftime('%Y-%m-%d %H:%M:%S.%f')
+
+    if metric not in METRICS:
+        raise Exception(f"This {metric} type is not currently supported.")
+    get_label_writer(get_sink().write).write(metric, drift_label, drift_start, drift_end)
@@ -0,0 +1,251 @@
+import asyncio
+import atexit
+import os
+import signal
+import threading
+import time
+
+import psutil
+
+from core.toolkit.config import get_config
+from core.toolkit.logger import setup_logger
+
+config = get_config('toolkit')
+
+config_supervisor = config['settings']['supervisor']
+
+# Command of the idle processes held by the process count driver
+IDLE_CMD = ['sleep', '86400']
+# Reaped groups a registry file may hold before it is rewritten, on top of one per live group
+REGISTRY_SLACK = 100
+
+_supervisor = None
+_supervisor_lock = threading.Lock()
+
+
+class ProcessSupervisor:
+    """
+    Owner of every drift command started by the scheduler.
+    Each command runs in its own process group and is kept in a registry until it has been reaped,
+    so a drift end, a crash or a signal always takes down the command together with all its workers.
+    The process groups are also appended to a registry file of the owning process under registry_dir, named
+    after its pid; a run killed before it could clean up has its leftovers removed by the next one, while the
+    groups of runs that are still alive are left alone.
+    """
+
+    def __init__(self, grace_seconds=None, registry_dir=None):
+        self.grace_seconds = grace_seconds if grace_seconds is not None else config_supervisor['grace_seconds']
+        self.registry_dir = registry_dir if registry_dir is not None else config_supervisor['registry_dir']
+        self.registry_file = os.path.join(self.registry_dir, f"{os.getpid()}.txt") if self.registry_dir else None
+        # pid -> (process, cmd)
+        self.children = {}
+        # Lines in registry_file, the reaped groups stay there until it is compacted
+        self._registered = 0
+        self.logger = setup_logger("supervisor")
+
+    async def spawn(self, cmd):
+        """
+        Start a command in a new process group and reap it in the background once it exits
+        """
+        process = await asyncio.create_subprocess_exec(*cmd, start_new_session=True)
+        self.children[process.pid] = (process, cmd)
+        self._register(process.pid)
+        asyncio.ensure_future(self._reap(process))
+        return process
+
+    async def _reap(self, process):
+        """
+        Wait for a command and drop it from the registry
+        """
+        try:
+            returncode = await process.wait()
+            if returncode not in (0, -signal.SIGTERM, -signal.SIGKILL):
+                self.logger.warning(f"Command {self.children[process.pid][1]} exited with code {returncode}")
+        finally:
+            self.children.pop(process.pid, None)
+            self._compact_registry()
+
+    def terminate(self, process, sig=signal.SIGTERM):
+        """
+        Send a signal to the whole process group of a command.
+        Processes the supervisor did not start, and the in-process load leases, are signalled directly.
+        """
+        if process.returncode is not None:
+            return
+        # By identity, a process that only shares the pid of a registered one is not its group leader
+        entry = self.children.get(getattr(process, 'pid', None))
+        if entry is None or entry[0] is not process:
+            process.send_signal(sig)
+            return
+        try:
+            os.killpg(process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    async def kill_tree(self, process):
+        """
+        Terminate the process group of a command, and kill it after grace_seconds
+        """
+        self.terminate(process)
+        try:
+            await asyncio.wait_for(process.wait(), self.grace_seconds)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Process group {process.pid} ignored SIGTERM, killing it")
+            self.terminate(process, signal.SIGKILL)
+            await process.wait()
+
+    async def shutdown(self):
+        """
+        Take down every registered process group
+        """
+        processes = [process for process, _ in list(self.children.values())]
+        if processes:
+            self.logger.info(f"Stopping {len(processes)} process groups")
+            await asyncio.gather(*(self.kill_tree(process) for process in processes), return_exceptions=True)
+        self.kill_all(signal.SIGKILL)
+
+    def kill_all(self, sig=signal.SIGKILL):
+        """
+        Signal every registered process group without waiting, usable outside of the event loop,
+        and remove the registry file
+        """
+        for pid in list(self.children):
+            try:
+                os.killpg(pid, sig)
+            except ProcessLookupError:
+                pass
+        self.children.clear()
+        self._compact_registry(force=True)
+
+    def worker_count(self):
+        """
+        Number of live processes in the registered process groups, stress-ng parents and workers
+        """
+        count = 0
+        for pid in list(self.children):
+            try:
+                parent = psutil.Process(pid)
+                count += 1 + len(parent.children(recursive=True))
+            except psutil.NoSuchProcess:
+                continue
+        return count
+
+    def stats(self):
+        return {'groups': len(self.children), 'workers': self.worker_count()}
+
+    def _register(self, pid):
+        # Append a new process group, the file is only rewritten by _compact_registry
+        if not self.registry_file:
+            return
+        try:
+            os.makedirs(self.registry_dir, exist_ok=True)
+            with open(self.registry_file, 'a') as file:
+                file.write(f"{pid}\n")
+            self._registered += 1
+        except OSError as e:
+            self.logger.warning(f"Could not save the process registry: {e}")
+
+    def _compact_registry(self, force=False):
+        """
+        Rewrite registry_file with the live process groups once the reaped ones outnumber them,
+        so that spawning and reaping stay constant time on average. A registry without groups is removed.
+        """
+        if not self.registry_file:
+            return
+        if not force and self._registered - len(self.children) < max(len(self.children), REGISTRY_SLACK):
+            return
+        try:
+            if self.children:
+                with open(self.registry_file, 'w') as file:
+                    file.write("".join(f"{pid}\n" for pid in self.children))
+            elif os.path.exists(self.registry_file):
+                os.remove(self.registry_file)
+            self._registered = len(self.children)
+        except OSError as e:
+            self.logger.warning(f"Could not save the process registry: {e}")
+
+    @staticmethod
+    def _owner_alive(owner, file_path):
+        # The owner of a registry file, unless its pid was reused by a process started after the last write
+        try:
+            return psutil.Process(owner).create_time() <= os.path.getmtime(file_path) + 1
+        except psutil.AccessDenied:
+            return True
+        except (psutil.NoSuchProcess, OSError):
+            return False
+
+    def kill_stale(self):
+        """
+        Kill the process groups left under registry_dir by previous runs that did not clean up.
+        The registry files of runs that are still alive are skipped, and only groups whose leader still runs
+        stress-ng or the idle command are touched, in case a pid was reused.
+        :return:
+            int: The number of killed process groups.
+        """
+        if not self.registry_dir or not os.path.isdir(self.registry_dir):
+            return 0
+        killed = 0
+        for name in os.listdir(self.registry_dir):
+            owner, extension = os.path.splitext(name)
+            file_path = os.path.join(self.registry_dir, name)
+            if extension != '.txt' or not owner.isdigit() or file_path == self.registry_file:
+                continue
+            if self._owner_alive(int(owner), file_path):
+                continue
+            try:
+                with open(file_path, 'r') as file:
+                    pids = {int(line) for line in file if line.strip()}
+                os.remove(file_path)
+            except OSError:
+                # Reaped by another run meanwhile
+                continue
+            for pid in pids:
+                try:
+                    cmdline = psutil.Process(pid).cmdline()
+                    if 'stress-ng' not in " ".join(cmdline) and cmdline != IDLE_CMD:
+                        continue
+                    os.killpg(pid, signal.SIGKILL)
+                    killed += 1
+                except (psutil.NoSuchProcess, psutil.AccessDenied, ProcessLookupError):
+                    continue
+        if killed:
+            self.logger.warning(f"Killed {killed} process groups left by previous runs")
+        return killed
+
+
+def get_supervisor():
+    # Create the shared supervisor on first use, its process groups are killed when the interpreter exits
+    global _supervisor
+    with _supervisor_lock:
+        if _supervisor is None:
+            _supervisor = ProcessSupervisor()
+            _supervisor.kill_stale()
+            atexit.register(_supervisor.kill_all)
+    return _supervisor
+
+
+async def run_supervised(coro, supervisor=None):
+    """
+    Run a coroutine until it completes or the process receives SIGINT or SIGTERM,
+    then take down every process group of the supervisor
+    """
+    supervisor = supervisor or get_supervisor()
+    loop = asyncio.get_event_loop()
+    task = asyncio.ensure_future(coro)
+    handled = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+            handled.append(sig)
+        except (NotImplementedError, RuntimeError):
+            # Not available outside of the main thread or on some platforms
+            pass
+    begin = time.time()
+    try:
+        return await task
+    except asyncio.CancelledError:
+        supervisor.logger.info(f"Stopped by a signal after {time.time() - begin:.0f}s")
+    finally:
+        for sig in handled:
+            loop.remove_signal_handler(sig)
+        await supervisor.shutdown()
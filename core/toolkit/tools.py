@@ -1,22 +1,54 @@
 import pickle
+import threading
+
 import psutil
 import resource
 
+from core.toolkit.sampler import MetricSampler
 
-def get_current_memory_utilization():
-    memory = psutil.virtual_memory()
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    # Start the shared background sampler on first use
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = MetricSampler()
+            _sampler.start()
+    return _sampler
+
+
+def set_sampler(sampler):
+    # Replace the metric source, e.g. by the modeled host of the simulation
+    global _sampler
+    with _sampler_lock:
+        _sampler = sampler
+
+
+def _read_metric(column, window=None):
+    # Latest sampled value, or its mean over the last window seconds
+    sampler = get_sampler()
+    sampler.wait_ready(timeout=max(10 * sampler.interval, 5))
+    if window is None:
+        return sampler.latest(column)
+    return sampler.mean(column, window)
+
+
+def get_current_memory_utilization(window=None):
     # Return used memory in MB
-    return memory.used / (1024 * 1024)
+    return _read_metric('mem_used', window)
 
 
-def get_current_cpu_utilization():
+def get_current_cpu_utilization(window=None):
     # Return CPU utilization
-    return psutil.cpu_percent(interval=1)
+    return _read_metric('cpu', window)
 
 
-def get_current_cpu_available():
+def get_current_cpu_available(window=None):
     # Return CPU availability
-    return 100 - psutil.cpu_percent(interval=1)
+    return 100 - _read_metric('cpu', window)
 
 
 def save_data_to_file(data, file_path):
@@ -34,30 +66,34 @@ def get_timeout_from_cmd(cmd):
     return timeout
 
 
-def get_current_mem_percent():
+def parse_stress_duration(value):
+    # Convert a stress-ng time such as '30', '20s', '3m' or '1h' into seconds
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    value = str(value).strip().lower()
+    if value and value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def get_current_mem_percent(window=None):
     # Get memory usage
-    mem = psutil.virtual_memory()
-    return mem.percent
+    return _read_metric('mem_percent', window)
 
 
-def get_available_memory():
-    memory = psutil.virtual_memory()
-    bytes_val = memory.available
+def get_available_memory(window=None):
     # Return available memory in MB
-    return bytes_val / (1024 * 1024)
+    return _read_metric('mem_available', window)
 
 
-def get_current_processes_num():
-    try:
-        all_processes = list(psutil.process_iter())
-        return len(all_processes)
-    except FileNotFoundError as e:
-        # Handle FileNotFoundError exception
-        print(f"An error occurred: {e}. Check if the required files are accessible.")
-        return 20
-    except Exception as e:
-        print(f"Unexpected error occurred: {e}.")
-        return 20
+def get_total_memory():
+    memory = psutil.virtual_memory()
+    # Return total memory in MB
+    return memory.total / (1024 * 1024)
+
+
+def get_current_processes_num(window=None):
+    # Return the number of processes
+    return int(_read_metric('processes', window))
 
 
 # def get_available_processes_num():
@@ -88,5 +124,46 @@ def get_available_processes_num():
     return 4096 - get_current_processes_num()  # You need to implement get_current_processes_num() function
 
 
+# Host readings a drift command can be sized by, with the format of the resolved amount
+HOST_READINGS = {
+    'cpu_available': (get_current_cpu_available, str),
+    'mem_available': (get_available_memory, lambda value: f"{max(int(value), 10)}M"),
+    'mem_percent': (get_current_mem_percent, float),
+    'processes_available': (get_available_processes_num, lambda value: str(max(int(value), 1))),
+}
+
+
+def host_share(reading, fraction, offset=0):
+    """
+    Amount of a drift command relative to the host that runs it, e.g. '@mem_available*0.5' stands for half of
+    the memory available when the command starts. Commands hold these instead of the readings of the host
+    they were generated on, so that a plan compiled from a seed is the same everywhere.
+    :param reading (str): A key of HOST_READINGS.
+    :param fraction (float): The share of the reading.
+    :param offset (float): A constant added to the share.
+    :return:
+        str: The host share.
+    """
+    share = f"@{reading}*{fraction!r}"
+    return f"{share}+{offset!r}" if offset else share
+
+
+def resolve_host_share(value):
+    """
+    Convert a host share into the amount it stands for on this host, any other value is returned unchanged
+    """
+    if not (isinstance(value, str) and value.startswith('@')):
+        return value
+    reading, _, share = value[1:].partition('*')
+    fraction, _, offset = share.partition('+')
+    read, fmt = HOST_READINGS[reading]
+    return fmt(read() * float(fraction) + float(offset or 0))
+
+
+def resolve_cmd(cmd):
+    # Command with its host shares converted for this host
+    return [resolve_host_share(arg) for arg in cmd]
+
+
 if __name__ == '__main__':
     print(get_current_cpu_available())
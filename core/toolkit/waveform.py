@@ -0,0 +1,170 @@
+import asyncio
+import itertools
+import signal
+
+import numpy as np
+
+from core.toolkit.config import get_config
+
+config = get_config('scheduler')
+
+config_waveform = config['settings']['waveform']
+
+_lease_ids = itertools.count(1)
+
+
+class Waveform:
+    """
+    Target load curve over time, in the units of the load driver (percent of the host, MB or processes).
+    The curve is defined on [0, duration] and holds its last value afterwards; every constructor returns a
+    curve that can be evaluated on a scalar or on a NumPy array of times.
+    """
+
+    def __init__(self, func, duration):
+        """
+        :param func (callable): Vectorized function of the time in seconds, called on [0, duration].
+        :param duration (float): Length of the curve in seconds.
+        """
+        self._func = func
+        self.duration = float(duration)
+
+    def __call__(self, t):
+        values = self._func(np.clip(np.asarray(t, dtype=float), 0, self.duration))
+        return float(values) if np.ndim(values) == 0 else values
+
+    def sample(self, rate):
+        """
+        Return the times and values of the curve sampled at rate Hz
+        """
+        times = np.linspace(0, self.duration, int(self.duration * rate) + 1)
+        return times, self(times)
+
+    def scaled(self, factor):
+        return Waveform(lambda t: self._func(t) * factor, self.duration)
+
+    @classmethod
+    def ramp(cls, start, end, duration):
+        return cls.piecewise_linear([0, duration], [start, end])
+
+    @classmethod
+    def sigmoid(cls, start, end, duration, steepness=10):
+        """
+        S-shaped transition from start to end, normalized to reach both ends exactly
+        """
+        low, high = 1 / (1 + np.exp(steepness / 2)), 1 / (1 + np.exp(-steepness / 2))
+
+        def func(t):
+            x = 1 / (1 + np.exp(-steepness * (t / duration - 0.5)))
+            return start + (end - start) * (x - low) / (high - low)
+        return cls(func, duration)
+
+    @classmethod
+    def sine(cls, mean, amplitude, period, duration):
+        return cls(lambda t: mean + amplitude * np.sin(2 * np.pi * t / period), duration)
+
+    @classmethod
+    def step(cls, levels, durations):
+        """
+        Piecewise constant curve holding levels[i] for durations[i] seconds
+        """
+        edges = np.cumsum(durations)[:-1]
+        levels = np.asarray(levels, dtype=float)
+        return cls(lambda t: levels[np.searchsorted(edges, t, side='right')], float(np.sum(durations)))
+
+    @classmethod
+    def piecewise_linear(cls, times, values):
+        times, values = np.asarray(times, dtype=float), np.asarray(values, dtype=float)
+        return cls(lambda t: np.interp(t, times, values), times[-1])
+
+    @classmethod
+    def from_array(cls, values, interval):
+        """
+        Custom curve from a NumPy array of values spaced interval seconds apart
+        """
+        values = np.asarray(values, dtype=float)
+        return cls.piecewise_linear(np.arange(len(values)) * interval, values)
+
+
+def incremental_waveform(level, duration, shape=None):
+    """
+    Curve of an Incremental drift: a smooth rise from 0 to level over duration
+    """
+    shape = shape or config_waveform['incremental_shape']
+    if shape == 'ramp':
+        return Waveform.ramp(0, level, duration)
+    elif shape == 'sigmoid':
+        return Waveform.sigmoid(0, level, duration, config_waveform['sigmoid_steepness'])
+    else:
+        raise ValueError(f"Unknown incremental shape {shape}")
+
+
+def gradual_waveform(level, on_seconds, off_seconds, edge_seconds=None):
+    """
+    Curve of a Gradual drift: level switched on for on_seconds[i] and off for off_seconds[i] with linear edges,
+    then held on
+    """
+    edge = config_waveform['gradual_edge_seconds'] if edge_seconds is None else edge_seconds
+    times, values, t = [0.0], [0.0], 0.0
+    for on, off in zip(on_seconds, off_seconds):
+        rise = min(edge, on / 2)
+        fall = min(edge, off / 2)
+        times += [t + rise, t + on, t + on + fall, t + on + off]
+        values += [level, level, 0.0, 0.0]
+        t += on + off
+    times += [t + edge]
+    values += [level]
+    return Waveform.piecewise_linear(times, values)
+
+
+class WaveformLoad:
+    """
+    Drives one long-lived load driver along a waveform at update_hz, with the interface of an asyncio subprocess.
+    With hold the last value is kept until the load is terminated, otherwise it ends with the curve.
+    """
+
+    def __init__(self, driver, waveform, update_hz=None, hold=True):
+        self.lease_id = next(_lease_ids)
+        self.returncode = None
+        self.waveform = waveform
+        self.update_hz = update_hz or config_waveform['update_hz']
+        self.hold = hold
+        self._driver = driver
+        self._done = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        begin = loop.time()
+        interval = 1 / self.update_hz
+        applied = None
+        while self.returncode is None:
+            t = loop.time() - begin
+            value = self.waveform(t)
+            if value != applied:
+                self._driver.apply(value)
+                applied = value
+            if t >= self.waveform.duration:
+                if not self.hold:
+                    self._finish(0)
+                return
+            await asyncio.sleep(min(interval, self.waveform.duration - t))
+
+    def _finish(self, returncode):
+        if self.returncode is not None:
+            return
+        self.returncode = returncode
+        self._driver.apply(0.0)
+        self._done.set()
+
+    async def wait(self):
+        await self._done.wait()
+        return self.returncode
+
+    def send_signal(self, sig):
+        self._finish(-sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
@@ -1,11 +1,78 @@
-from core.scheduler import Scheduler
 import click
 
+# The scheduler and the modules below are imported when a command runs, so --help and option errors return
+# without loading numpy, psutil or the configuration
+
+
+def _validate_metric(ctx, param, value):
+    if value is None:
+        return None
+    from core.scheduler import parse_metrics
+    try:
+        return parse_metrics(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _validate_shard(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise click.BadParameter("expected i/n, for example 0/4")
+    if not 0 <= index < count:
+        raise click.BadParameter("the shard index must be in [0, n)")
+    return index, count
+
 
 @click.command()
-@click.option('--metric', type=click.Choice(['cpu', 'mem','processes']), help='Add a metric (cpu、mem or processes)')
-def _main(metric):
-    s = Scheduler(metric)
+@click.option('--metric', callback=_validate_metric,
+              help='Add metrics, comma separated for one shared run (cpu、mem、processes or cpu,mem,processes)')
+@click.option('--simulate', is_flag=True, help='Run on a virtual clock against a modeled host')
+@click.option('--days', type=float, default=30, show_default=True, help='Simulated or planned duration in days')
+@click.option('--seed', type=int, default=None, help='Seed of the simulation or of the plan')
+@click.option('--sink', type=click.Choice(['local', 'db']), default='local', show_default=True,
+              help='Where the simulation writes its labels: storage/ csv files or the configured label sink')
+@click.option('--plan-out', type=click.Path(dir_okay=False), default=None,
+              help='Compile a plan of --days for --metric into this file and exit')
+@click.option('--plan', 'plan_path', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='Play back a compiled plan instead of drawing the events at run time')
+@click.option('--shard', callback=_validate_shard, default=None,
+              help='Only play the i-th of n shards of the plan, as i/n')
+@click.option('--sync-labels', is_flag=True,
+              help='Copy the labels of the local label sink (sqlite or parquet) to PostgreSQL and exit')
+def _main(metric, simulate, days, seed, sink, plan_out, plan_path, shard, sync_labels):
+    if sync_labels:
+        from core.toolkit.sinks import PostgreSQLSink, get_sink
+        from core.toolkit.sinks import sync_labels as sync
+        click.echo("Synced {} labels".format(sync(get_sink(), PostgreSQLSink())))
+        return
+    if metric is None and plan_path is None:
+        raise click.UsageError("Missing option '--metric'")
+    plan = None
+    if plan_out is not None:
+        from core.planner import Planner, save_plan
+        plan = Planner(metric, seed).compile(days)
+        save_plan(plan, plan_out)
+        click.echo("Planned {} events over {} days into {}".format(len(plan['events']), days, plan_out))
+        return
+    if plan_path is not None:
+        from core.planner import load_plan, shard_plan
+        plan = load_plan(plan_path)
+        if shard is not None:
+            plan = shard_plan(plan, *shard)
+        metric = [m for m in plan['metrics'] if metric is None or m in metric]
+    if simulate:
+        from core.simulation import format_report, run_simulation
+        from core.toolkit.sinks import perform_insert
+        if plan is not None:
+            days = plan['horizon'] / 86400 + 1
+        report = run_simulation(metric, days, seed, perform_insert if sink == 'db' else None, plan=plan)
+        click.echo(format_report(report))
+        return
+    from core.scheduler import Scheduler
+    s = Scheduler(metric, plan)
     s.start()
 
 
@@ -31,8 +31,12 @@ mkdir_if_not_exists "$storage_dir"
 cd "$forge_dir" || { echo "Failed to change directory: $forge_dir"; exit 1; }
 
 # Define cleanup actions when the script exits
+# main.py stops its own stress-ng process groups on SIGTERM
 cleanup() {
-  pkill stress-ng  # Kill stress-ng process
+  if [ -n "$python_pid" ] && kill -0 "$python_pid" 2>/dev/null; then
+    kill -TERM "$python_pid"
+    wait "$python_pid"
+  fi
 }
 
 # Trap EXIT signal to execute cleanup function
@@ -50,9 +54,8 @@ start_python_script() {
       break
     else
       echo "Python script exited with an error. Restarting in 5 minutes..."
-      # Cleanup residual processes
+      # Cleanup residual processes, stress-ng leftovers are killed by the supervisor on the next start
       pkill -f "/root/anaconda3/envs/DL/bin/python3.8 main.py --metric processes"
-      pkill stress-ng
       sleep 300  # Wait 5 minutes before restarting
     fi
   done
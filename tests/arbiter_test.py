@@ -0,0 +1,54 @@
+import asyncio
+import os
+import unittest
+
+from core.arbiter import ResourceArbiter, estimate_demand, scale_cmd
+
+
+class Test_Arbiter(unittest.TestCase):
+
+    def test_estimate_demand(self):
+        cpu = estimate_demand(['stress-ng', '-c', '2', '--cpu-load', '30'])
+        self.assertAlmostEqual(cpu['cpu'], 2 * 30 / os.cpu_count())
+        mem = estimate_demand(['stress-ng', '--vm', '2', '--vm-bytes', '100M', '--timeout', '10'])
+        self.assertAlmostEqual(mem['mem'], 200)
+        processes = estimate_demand(['stress-ng', '--fork', '40'])
+        self.assertEqual(processes['processes'], 40)
+
+    def test_scale_cmd(self):
+        cmd = scale_cmd(['stress-ng', '--vm', '2', '--vm-bytes', '100M'], 0.5)
+        self.assertAlmostEqual(estimate_demand(cmd)['mem'], 100)
+
+    def test_fit(self):
+        arbiter = ResourceArbiter({'cpu': 100, 'mem': 100, 'processes': 10})
+        cmd = arbiter.fit(['stress-ng', '--fork', '40'])
+        self.assertEqual(estimate_demand(cmd)['processes'], 10)
+
+    def test_acquire_waits_for_release(self):
+        arbiter = ResourceArbiter({'cpu': 100, 'mem': 250, 'processes': 10})
+        cmd = ['stress-ng', '--vm', '1', '--vm-bytes', '200M']
+
+        async def run():
+            _, first = await arbiter.acquire(cmd)
+            second = asyncio.ensure_future(arbiter.acquire(cmd))
+            await asyncio.sleep(0.01)
+            self.assertFalse(second.done())
+            await arbiter.release(first)
+            await asyncio.wait_for(second, 1)
+            self.assertAlmostEqual(arbiter.reserved['mem'], 200)
+
+        asyncio.run(run())
+
+    def test_acquire_scales_to_remaining_budget(self):
+        arbiter = ResourceArbiter({'cpu': 100, 'mem': 300, 'processes': 10})
+
+        async def run():
+            await arbiter.acquire(['stress-ng', '--vm', '1', '--vm-bytes', '200M'])
+            cmd, demand = await arbiter.acquire(['stress-ng', '--vm', '1', '--vm-bytes', '150M'])
+            self.assertAlmostEqual(demand['mem'], 100)
+            self.assertAlmostEqual(arbiter.reserved['mem'], 300)
+
+        asyncio.run(run())
+
+if __name__ == '__main__':
+    unittest.main()
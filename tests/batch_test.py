@@ -0,0 +1,111 @@
+import os
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+from click.testing import CliRunner
+
+from utils.batch import _main, discover_pairs, run_batch, write_report
+from utils.procession import DataProcessor, load_segments
+
+
+def write_pair(root, relative, hours=2):
+    # Label file under storage/ and its InfluxDB export under data/, at the same relative path
+    label_path = os.path.join(root, 'storage', relative)
+    export_path = os.path.join(root, 'data', relative)
+    for path in (label_path, export_path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    pd.DataFrame([[1, 'Sudden', '03/11/2023 08:10:00', '03/11/2023 08:20:00'],
+                  [2, 'Blip', '03/11/2023 09:00:00', '03/11/2023 09:00:30']],
+                 columns=['id', 'drift_label', 'drift_start', 'drift_end']).to_csv(label_path, index=False)
+    times = pd.date_range('2023-11-03 00:00:00', periods=hours * 360, freq='10s')
+    pd.DataFrame({'result': '', '_time': times.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                  '_value': np.arange(len(times), dtype=float)}).to_csv(export_path, index=False)
+    return label_path, export_path
+
+
+class Test_Batch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_batch(self):
+        write_pair(self.root, 'host-1/cpu_2023-11-03_08-00-00_to_2023-11-03_10-00-00.csv')
+        write_pair(self.root, 'host-2/mem_2023-11-03_08-00-00_to_2023-11-03_10-00-00.csv')
+        label_path, export_path = write_pair(self.root, 'host-2/processes_2023-11-03_08-00-00_to_2023-11-03_10-00-00.csv')
+        with open(export_path, 'w') as file:
+            file.write('not,an,export\n')
+        missing = os.path.join(self.root, 'storage', 'host-3', 'cpu_2023-11-03_08-00-00_to_2023-11-03_10-00-00.csv')
+        os.makedirs(os.path.dirname(missing))
+        with open(missing, 'w') as file:
+            file.write('id,drift_label,drift_start,drift_end\n')
+
+        pairs, without_export = discover_pairs(os.path.join(self.root, 'storage'), os.path.join(self.root, 'data'),
+                                               os.path.join(self.root, 'processed'))
+        self.assertEqual(without_export, [missing])
+        self.assertEqual([os.path.relpath(output, self.root) for _, _, output in pairs],
+                         [os.path.join('processed', 'host-1')] + [os.path.join('processed', 'host-2')] * 2)
+
+        finished = []
+        rows = run_batch(pairs, jobs=2, progress=finished.append)
+        self.assertEqual(len(finished), 3)
+        self.assertEqual([row['status'] for row in rows], ['done', 'done', 'failed'])
+        self.assertIn('_time', rows[2]['error'])
+        processor = DataProcessor(pairs[0][0], pairs[0][1], output_dir=pairs[0][2])
+        segments = load_segments(processor.processed_segments_path(), mmap=False)
+        self.assertEqual(segments.tolist(), [(60, 120, 1), (360, 363, 2)])
+
+        # Only the failed pair and the pair with a newer input run again
+        later = time.time() + 10
+        os.utime(pairs[0][0], (later, later))
+        rows = run_batch(pairs, jobs=2)
+        self.assertEqual([row['status'] for row in rows], ['done', 'skipped', 'failed'])
+        rows = run_batch(pairs, jobs=1, force=True)
+        self.assertEqual([row['status'] for row in rows], ['done', 'done', 'failed'])
+
+        report = pd.read_csv(write_report(rows, os.path.join(self.root, 'processed', 'batch_report.csv')))
+        self.assertEqual(report['status'].tolist(), ['done', 'done', 'failed'])
+
+        # The label file without an export is a failed row of the report
+        result = CliRunner().invoke(_main, ['--labels', os.path.join(self.root, 'storage'),
+                                            '--exports', os.path.join(self.root, 'data'),
+                                            '--output', os.path.join(self.root, 'processed')])
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertIn('1 done, 1 skipped, 2 failed', result.output)
+        report = pd.read_csv(os.path.join(self.root, 'processed', 'batch_report.csv'), keep_default_na=False)
+        self.assertEqual(report[report['label'] == missing][['status', 'error']].values.tolist(),
+                         [['failed', 'No export']])
+
+    def test_missing_inputs(self):
+        label_path, export_path = write_pair(self.root, 'cpu_2023-11-03_08-00-00_to_2023-11-03_10-00-00.csv')
+        output_dir = os.path.join(self.root, 'processed')
+        pairs = [(label_path, export_path, output_dir),
+                 (os.path.join(self.root, 'missing.csv'), export_path, output_dir),
+                 (label_path, os.path.join(self.root, 'missing.csv'), output_dir)]
+        for force in (False, True):
+            rows = run_batch(pairs, jobs=1, force=force)
+            self.assertEqual([row['status'] for row in rows], ['done', 'failed', 'failed'])
+            self.assertIn('missing.csv', rows[2]['error'])
+
+        # --pairs does not need the default labels directory in the working directory
+        pairs_file = os.path.join(self.root, 'pairs.csv')
+        pd.DataFrame(pairs[:2], columns=['label', 'export', 'output']).to_csv(pairs_file, index=False)
+        cwd = os.getcwd()
+        os.makedirs(os.path.join(self.root, 'empty'))
+        os.chdir(os.path.join(self.root, 'empty'))
+        try:
+            result = CliRunner().invoke(_main, ['--pairs', pairs_file, '--report', 'report.csv'])
+        finally:
+            os.chdir(cwd)
+        self.assertEqual(result.exit_code, 1, result.output)
+        self.assertIn('0 done, 1 skipped, 1 failed', result.output)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import datetime
+import tempfile
+import unittest
+
+import numpy as np
+
+from core.toolkit.collector import MetricCollector, load_collected
+
+
+class FakeSampler:
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def emit(self, row):
+        for listener in self.listeners:
+            listener(row)
+
+
+class Test_Collector(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.begin = datetime.datetime(2024, 1, 1, 12, 0, 0)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _at(self, seconds):
+        return self.begin + datetime.timedelta(seconds=seconds)
+
+    def test_collect(self):
+        sampler = FakeSampler()
+        collector = MetricCollector(self.directory.name, segment_rows=4, flush_rows=2).start(sampler)
+        for i in range(10):
+            sampler.emit((self._at(i).timestamp(), 10.0 + i, 1000.0, 50.0, 1000.0, 200 + i))
+            if i == 6:
+                # An overlay ends first and keeps its category under the base drift written after it
+                collector.label('cpu', 'Incremental+Blip', self._at(3), self._at(5))
+        collector.label('cpu', 'Incremental', self._at(1), self._at(8))
+        collector.label('mem', 'Sudden', self._at(8), self._at(20))
+        collector.close()
+        self.assertEqual(sampler.listeners, [])
+
+        data = load_collected(self.directory.name)
+        np.testing.assert_array_equal(data['cpu'], 10.0 + np.arange(10))
+        np.testing.assert_array_equal(data['processes'], 200 + np.arange(10))
+        self.assertEqual(list(data['label_cpu']), [0, 4, 4, 2, 2, 4, 4, 4, 0, 0])
+        self.assertEqual(list(data['label_mem']), [0] * 8 + [1, 1])
+        self.assertEqual(list(data['label_processes']), [0] * 10)
+
+        # A new collector in the same directory appends new segments
+        collector = MetricCollector(self.directory.name, segment_rows=4, flush_rows=2).start(sampler)
+        sampler.emit((self._at(10).timestamp(), 20.0, 1000.0, 50.0, 1000.0, 210))
+        collector.close()
+        self.assertEqual(len(load_collected(self.directory.name, ['cpu'])['cpu']), 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import yaml
+
+from core.scheduler import AsyncScheduler
+from core.toolkit.config import CONFIG_DIR, ConfigError, ConfigRegistry, freeze, get_config
+
+
+class Test_ConfigRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        shutil.copy(os.path.join(CONFIG_DIR, 'scheduler_config.yaml'), self.directory.name)
+        self.registry = ConfigRegistry(self.directory.name)
+
+    def tearDown(self):
+        self.registry.stop()
+        self.directory.cleanup()
+
+    def _edit(self, change):
+        path = self.registry.path('scheduler')
+        with open(path, 'r') as file:
+            config = yaml.safe_load(file)
+        change(config)
+        with open(path, 'w') as file:
+            yaml.safe_dump(config, file)
+        # A later modification time than the loaded version, whatever the file system granularity
+        later = time.time() + 5
+        os.utime(path, (later, later))
+
+    def test_snapshot(self):
+        snapshot = self.registry.get('scheduler')
+        self.assertIs(self.registry.get('scheduler'), snapshot)
+        interval = snapshot['settings']['scheduler']['event_interval']
+        with self.assertRaises(TypeError):
+            snapshot['settings']['scheduler']['father_sub_interval'] = 1
+        with self.assertRaises(TypeError):
+            interval.append({})
+        with self.assertRaises(TypeError):
+            interval[0].update(lower=1)
+        copied = interval.copy()
+        copied.append({})
+        self.assertEqual(len(interval), 1)
+        self.assertEqual(pickle.loads(pickle.dumps(snapshot)), snapshot)
+        self.assertEqual(self.registry.reload(), [])
+
+    def test_reload(self):
+        snapshot = self.registry.get('scheduler')
+        received = []
+        self.registry.subscribe('scheduler', received.append)
+
+        self._edit(lambda config: config['settings']['scheduler']['event_interval'][0].update(lower=10, higher=20))
+        self.assertEqual(self.registry.reload(), ['scheduler'])
+        self.assertEqual(received, [self.registry.get('scheduler')])
+        self.assertEqual(received[0]['settings']['scheduler']['event_interval'][0], {'lower': 10, 'higher': 20})
+        # The previous snapshot is left as it was
+        self.assertEqual(snapshot['settings']['scheduler']['event_interval'][0]['lower'], 1200)
+
+        # Invalid versions are rejected and the current snapshot stays
+        self._edit(lambda config: config['settings']['scheduler']['event_interval'][0].update(lower=30))
+        self.assertEqual(self.registry.reload(), [])
+        self._edit(lambda config: config['settings']['timeline'].pop('retry_seconds'))
+        self.assertEqual(self.registry.reload(), [])
+        self.assertEqual(len(received), 1)
+        self.assertIs(self.registry.get('scheduler'), received[0])
+
+    def test_watch(self):
+        self.registry.get('scheduler')
+        received = []
+        self.registry.subscribe('scheduler', received.append)
+        self.registry.watch(0.05)
+        self._edit(lambda config: config['settings']['timeline'].update(retry_seconds=7))
+        deadline = time.time() + 5
+        while not received and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(received[0]['settings']['timeline']['retry_seconds'], 7)
+
+    def test_validate(self):
+        path = self.registry.path('scheduler')
+        with open(path, 'r') as file:
+            config = yaml.safe_load(file)
+        config['settings']['steady_state']['cpu']['std_tolerance'] = 'high'
+        with open(path, 'w') as file:
+            yaml.safe_dump(config, file)
+        with self.assertRaisesRegex(ConfigError, 'steady_state.cpu.std_tolerance'):
+            self.registry.get('scheduler')
+
+
+class Test_SchedulerReload(unittest.TestCase):
+
+    def test_applied_between_events(self):
+        scheduler = AsyncScheduler('cpu')
+        with open(os.path.join(CONFIG_DIR, 'scheduler_config.yaml'), 'r') as file:
+            config = yaml.safe_load(file)
+        config['settings']['scheduler']['event_interval'][0] = {'lower': 5, 'higher': 6}
+        config['settings']['steady_state']['window_seconds'] = 20
+        scheduler._on_scheduler_config(freeze(config))
+        self.assertEqual(scheduler.interval, get_config('scheduler')['settings']['scheduler']['event_interval'][0])
+        scheduler._apply_pending_config()
+        self.assertEqual(scheduler.interval, {'lower': 5, 'higher': 6})
+        self.assertEqual(scheduler.steady_state['window_seconds'], 20)
+        self.assertTrue(5 <= scheduler.draw_event_interval() <= 6)
+
+    def test_command_generator_reloaded(self):
+        scheduler = AsyncScheduler('mem')
+        scheduler._sg = scheduler.create_cmd_generator()
+        with open(os.path.join(CONFIG_DIR, 'mem_config.yaml'), 'r') as file:
+            config = yaml.safe_load(file)
+        config['settings']['shell_gen']['blip_mem_variation_range_percentage'][0] = {'lower': 0.1, 'higher': 0.2}
+        snapshot = freeze(config)
+        with mock.patch('core.mem.cmd_factory.get_config', return_value=snapshot):
+            scheduler._on_metric_config(snapshot)
+            self.assertNotEqual(scheduler._sg.blip_load_scale, {'lower': 0.1, 'higher': 0.2})
+            scheduler._apply_pending_config()
+        self.assertEqual(scheduler._sg.blip_load_scale, {'lower': 0.1, 'higher': 0.2})
+
+    def test_running_event_keeps_its_settings(self):
+        class Scheduler(AsyncScheduler):
+            async def _run_event(self, event, sg):
+                seen = [self.retry_seconds]
+                await asyncio.sleep(0.05)
+                seen.append(self.retry_seconds)
+                event['seen'] = seen
+
+        scheduler = Scheduler('cpu')
+        with open(os.path.join(CONFIG_DIR, 'scheduler_config.yaml'), 'r') as file:
+            config = yaml.safe_load(file)
+        before = config['settings']['timeline']['retry_seconds']
+        config['settings']['timeline']['retry_seconds'] = before + 10
+        event = {}
+
+        async def scenario():
+            task = asyncio.ensure_future(scheduler.run_event(event))
+            await asyncio.sleep(0.01)
+            # Reloaded while the event runs
+            scheduler._on_scheduler_config(freeze(config))
+            scheduler._apply_pending_config()
+            await task
+
+        asyncio.run(scenario())
+        self.assertEqual(event['seen'], [before, before])
+        self.assertEqual(scheduler.retry_seconds, before + 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
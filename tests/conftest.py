@@ -0,0 +1,26 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The modules imported lazily by the tests resolve from the repository, not from the working directory
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def work_directory():
+    """
+    Run the tests in a temporary working directory, so the logs/ and storage/ files created by the loggers,
+    the label writer, the collector and the supervisor registry do not end up in the checkout
+    """
+    directory = tempfile.mkdtemp(prefix='tzf-tests-')
+    # Removed at exit, after the atexit handlers of those components have flushed into it
+    atexit.register(shutil.rmtree, directory, True)
+    cwd = os.getcwd()
+    os.chdir(directory)
+    yield directory
+    os.chdir(cwd)
@@ -0,0 +1,80 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from core.simulation import SimulatedDriver, SimulatedHost, VirtualClock, VirtualEventLoop
+from core.toolkit.controller import LoadController, PIDController, ProcessCountDriver
+from core.toolkit.supervisor import ProcessSupervisor
+
+
+class Test_Controller(unittest.TestCase):
+
+    def test_pid_removes_offset(self):
+        # First-order plant that only delivers 70% of the applied load
+        pid = PIDController(0.6, 0.2, 0.0, limit=100)
+        level, setpoint = 0.0, 40.0
+        for _ in range(200):
+            applied = setpoint + pid.update(setpoint - level, 1.0)
+            level += (0.7 * applied - level) * 0.5
+        self.assertAlmostEqual(level, setpoint, delta=0.5)
+
+    def test_tracks_setpoint(self):
+        clock = VirtualClock(start=0)
+        loop = VirtualEventLoop(clock)
+        host = SimulatedHost(clock, seed=1)
+        controller = LoadController('cpu', SimulatedDriver(host, 'cpu'), host.cpu_count, sampler=host)
+
+        async def scenario():
+            await asyncio.sleep(30)
+            load = controller.lease(['stress-ng', '-c', '2', '--cpu-load', '30', '--timeout', '120'])
+            await load.wait()
+            await asyncio.sleep(5)
+            controller.close()
+
+        try:
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(scenario())
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+        report = controller.report()
+        self.assertEqual(report['setpoints'], 1)
+        self.assertEqual(report['converged'], 1)
+        self.assertLess(report['convergence_seconds'], 60)
+        self.assertLess(report['steady_state_error'], controller.tolerance)
+        self.assertEqual(controller.demand, 0.0)
+
+    def test_process_count_driver(self):
+        with tempfile.TemporaryDirectory() as directory:
+            supervisor = ProcessSupervisor(grace_seconds=2, registry_dir=directory)
+            driver = ProcessCountDriver(supervisor)
+
+            async def scenario():
+                driver.apply(5)
+                # The loop keeps running while the processes start
+                await asyncio.sleep(0)
+                started = len(driver._processes)
+                await driver._task
+                with open(supervisor.registry_file) as file:
+                    registered = len(file.read().split())
+                driver.apply(2)
+                await driver._task
+                await asyncio.sleep(0.3)
+                remaining = len(supervisor.children)
+                driver.close()
+                await asyncio.sleep(0.3)
+                return started, registered, remaining
+
+            try:
+                started, registered, remaining = asyncio.run(scenario())
+            finally:
+                supervisor.kill_all()
+        self.assertEqual(started, 0)
+        self.assertEqual(registered, 5)
+        self.assertEqual(remaining, 2)
+        self.assertEqual(supervisor.children, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.dataset import FORMATS, DatasetWriter, read_dataset, read_manifest, write_dataset
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+def make_series(days):
+    timestamps = pd.date_range('2023-11-03', periods=days * 8640, freq='10s')
+    categories = np.zeros(len(timestamps), dtype=np.int8)
+    categories[100:200] = 1
+    categories[9000:9050] = 4
+    return pd.DataFrame({'timestamp': timestamps, 'value': np.arange(len(timestamps), dtype=float),
+                         'category_label': categories, 'drift_label': (categories != 0) * 7})
+
+
+class Test_Dataset(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_formats(self):
+        series = make_series(3)
+        for fmt in FORMATS:
+            if fmt != 'npz' and not HAS_PYARROW:
+                continue
+            with self.subTest(fmt=fmt):
+                directory = os.path.join(self.directory.name, fmt)
+                write_dataset(series, directory, fmt)
+                manifest = read_manifest(directory)
+                self.assertEqual([p['rows'] for p in manifest['partitions']], [8640] * 3)
+                self.assertEqual([p['categories'] for p in manifest['partitions']], [[0, 1], [0, 4], [0]])
+                self.assertEqual(manifest['partitions'][1]['value_min'], 8640.0)
+
+                everything = read_dataset(directory)
+                pd.testing.assert_frame_equal(everything, series.astype({'timestamp': 'datetime64[s]'}),
+                                              check_dtype=False)
+                self.assertEqual(everything['category_label'].dtype, np.int8)
+
+                selected = read_dataset(directory, start='2023-11-04 00:00:00', end='2023-11-04 02:00:00',
+                                        categories=[4], columns=['value'])
+                self.assertEqual(list(selected.columns), ['value'])
+                self.assertEqual(selected['value'].tolist(), list(np.arange(9000.0, 9050.0)))
+                self.assertEqual(len(read_dataset(directory, categories=[5])), 0)
+
+    def test_chunks_in_time_order(self):
+        writer = DatasetWriter(self.directory.name, 'npz', partition_unit='h')
+        series = make_series(1)
+        for begin in range(0, len(series), 1000):
+            writer.write(series.iloc[begin:begin + 1000])
+        writer.close()
+        self.assertEqual(len(read_manifest(self.directory.name)['partitions']), 24)
+        self.assertEqual(len(read_dataset(self.directory.name)), len(series))
+        with self.assertRaises(ValueError):
+            writer.write(series.iloc[:10])
+
+
+if __name__ == '__main__':
+    unittest.main()
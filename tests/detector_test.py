@@ -0,0 +1,36 @@
+import unittest
+
+import numpy as np
+
+from core.toolkit.detector import SteadyStateDetector
+
+
+class Test_SteadyStateDetector(unittest.TestCase):
+
+    def test_detects_plateau_after_ramp(self):
+        detector = SteadyStateDetector(window_seconds=5, slope_tolerance=2, std_tolerance=2)
+        rng = np.random.default_rng(0)
+        times = np.arange(0, 60, 0.25)
+        # Ramp from 10 to 50 over 20 s, then flat with a little noise
+        values = np.clip(10 + 2 * times, None, 50) + rng.normal(0, 0.3, len(times))
+        state = None
+        for t, v in zip(times, values):
+            state = detector.update(t, v)
+            if state is not None:
+                break
+        self.assertIsNotNone(state)
+        self.assertGreaterEqual(state.timestamp, 19)
+        self.assertLess(state.timestamp, 23)
+        self.assertAlmostEqual(state.level, 50, delta=1)
+        self.assertGreater(state.confidence, 0)
+        self.assertLessEqual(state.confidence, 1)
+
+    def test_no_plateau_while_noisy(self):
+        detector = SteadyStateDetector(window_seconds=5, slope_tolerance=2, std_tolerance=2)
+        rng = np.random.default_rng(1)
+        for t in np.arange(0, 30, 0.25):
+            self.assertIsNone(detector.update(t, 50 + rng.normal(0, 10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import unittest
+
+import numpy as np
+
+from core.generator import DRIFT_DTYPE, DriftGenerator
+from core.toolkit.config import CONFIG_DIR
+
+
+class Test_DriftGenerator(unittest.TestCase):
+
+    def setUp(self):
+        self.dg = DriftGenerator(os.path.join(CONFIG_DIR, 'generator_config.yaml'))
+
+    def test_generate_batch(self):
+        batch = self.dg.generate_batch(20000, seed=7)
+        self.assertEqual(batch.dtype, DRIFT_DTYPE)
+        np.testing.assert_array_equal(batch, self.dg.generate_batch(20000, seed=7))
+        # Equal weights by default
+        np.testing.assert_allclose(np.bincount(batch['type'], minlength=5) / len(batch), 0.2, atol=0.02)
+
+        types = np.array(self.dg._drift_types)[batch['type']]
+        blips = batch[types == 'Blip']
+        self.assertTrue(((blips['duration'] >= 20) & (blips['duration'] <= 30)).all())
+        incremental = batch[types == 'Incremental']
+        self.assertEqual((incremental['steps'].min(), incremental['steps'].max()), (15, 20))
+        self.assertEqual((incremental['step_seconds'].min(), incremental['step_seconds'].max()), (10, 15))
+        gradual = batch[types == 'Gradual']
+        self.assertEqual((gradual['sequence_length'].min(), gradual['sequence_length'].max()), (3, 6))
+        sudden = batch[types == 'Sudden']
+        self.assertTrue((sudden['duration'] == -1).all() and (sudden['steps'] == 0).all())
+
+        parameters = self.dg.to_parameters(gradual[0])
+        length = int(gradual[0]['sequence_length'])
+        self.assertEqual(parameters['shape'], [list(range(1, length + 1)), list(range(length, 0, -1))])
+        self.assertEqual(parameters['duration'], -1)
+        self.assertIn(parameters['mode'], self.dg._drift_modes)
+
+    def test_weights_and_transitions(self):
+        batch = self.dg.generate_batch(10000, seed=1, weights=[0, 1, 0, 0, 3])
+        np.testing.assert_allclose(np.bincount(batch['type'], minlength=5) / len(batch), [0, 0.25, 0, 0, 0.75],
+                                   atol=0.02)
+        # A cycle Sudden -> Blip -> Recurrent -> Sudden, starting from Incremental which always goes to Sudden
+        matrix = [[0, 1, 0, 0, 0], [0, 0, 1, 0, 0], [1, 0, 0, 0, 0], [1, 0, 0, 0, 0], [0, 0, 0, 0, 1]]
+        batch = self.dg.generate_batch(7, seed=2, weights=[0, 0, 0, 1, 0], transition_matrix=matrix)
+        self.assertEqual(batch['type'].tolist(), [3, 0, 1, 2, 0, 1, 2])
+        with self.assertRaises(ValueError):
+            self.dg.generate_batch(5, transition_matrix=matrix[:4])
+        with self.assertRaises(ValueError):
+            self.dg.generate_batch(5, weights=[1, -1, 0, 0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from core.toolkit.label_writer import LabelWriter
+
+
+class FlakySink:
+    """
+    Sink that fails while down is set, and records the batches it accepted
+    """
+
+    def __init__(self):
+        self.down = False
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, rows):
+        if self.down:
+            raise ConnectionError("database unavailable")
+        if any(row[0] not in ('cpu', 'mem', 'processes') for row in rows):
+            raise ValueError("unknown metric")
+        with self.lock:
+            self.batches.append(list(rows))
+
+    @property
+    def rows(self):
+        return [row for batch in self.batches for row in batch]
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class Test_LabelWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool_file = os.path.join(self.directory.name, 'labels.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _writer(self, sink):
+        return LabelWriter(sink, spool_file=self.spool_file, batch_size=10, flush_seconds=0.05,
+                           retry_seconds=0.05)
+
+    def _labels(self, count, metric='cpu'):
+        return [(metric, f"Sudden-{i}", f"2024-01-01 00:00:{i:02d}.000000", f"2024-01-01 00:01:{i:02d}.000000")
+                for i in range(count)]
+
+    def test_batches(self):
+        sink = FlakySink()
+        writer = self._writer(sink).start()
+        labels = self._labels(25)
+        for label in labels:
+            writer.write(*label)
+        self.assertTrue(_wait_for(lambda: len(sink.rows) == 25))
+        writer.close(timeout=2)
+        self.assertEqual(sink.rows, labels)
+        self.assertLessEqual(max(len(batch) for batch in sink.batches), 10)
+        # Everything written, the spool is emptied
+        self.assertEqual(os.path.getsize(self.spool_file), 0)
+
+    def test_outage(self):
+        sink = FlakySink()
+        sink.down = True
+        writer = self._writer(sink).start()
+        labels = self._labels(5)
+        for label in labels:
+            writer.write(*label)
+        self.assertTrue(_wait_for(lambda: writer.failures >= 2))
+        sink.down = False
+        self.assertTrue(_wait_for(lambda: len(sink.rows) == 5))
+        writer.close(timeout=2)
+        self.assertEqual(sink.rows, labels)
+
+    def test_replay(self):
+        # The first run never reaches the database
+        down = FlakySink()
+        down.down = True
+        writer = self._writer(down).start()
+        labels = self._labels(3) + self._labels(2, 'mem')
+        for label in labels:
+            writer.write(*label)
+        writer.close(timeout=1)
+        self.assertEqual(down.rows, [])
+
+        # A torn line left by a crash while appending is dropped
+        with open(self.spool_file, 'ab') as file:
+            file.write(b'["cpu", "Sud')
+        sink = FlakySink()
+        writer = self._writer(sink).start()
+        self.assertTrue(_wait_for(lambda: len(sink.rows) == 5))
+        writer.write(*self._labels(1, 'processes')[0])
+        self.assertTrue(_wait_for(lambda: len(sink.rows) == 6))
+        writer.close(timeout=2)
+        self.assertEqual(sink.rows, labels + self._labels(1, 'processes'))
+        self.assertEqual(self._writer(FlakySink()).pending(), 0)
+
+    def test_poison_label(self):
+        sink = FlakySink()
+        writer = self._writer(sink).start()
+        labels = self._labels(3)
+        for label in labels[:1] + self._labels(1, 'disk') + labels[1:]:
+            writer.write(*label)
+        self.assertTrue(_wait_for(lambda: len(sink.rows) == 3))
+        writer.close(timeout=2)
+        # The rejected label is set aside, the others are written in order
+        self.assertEqual(sink.rows, labels)
+        self.assertEqual(writer.rejected, 1)
+        with open(writer.dead_letter_file) as file:
+            rejected = [json.loads(line) for line in file]
+        self.assertEqual([tuple(entry['row']) for entry in rejected], self._labels(1, 'disk'))
+        self.assertEqual(os.path.getsize(self.spool_file), 0)
+
+    def test_crash_while_emptying_spool(self):
+        sink = FlakySink()
+        writer = self._writer(sink)
+        labels = self._labels(3)
+        for label in labels:
+            writer.write(*label)
+        batch = [writer._queue.get_nowait() for _ in labels]
+        # Crash after the sink took the batch, before the spool is emptied
+        with mock.patch('os.truncate', side_effect=RuntimeError("crash")):
+            with self.assertRaises(RuntimeError):
+                writer._write_batch(batch)
+        # The written labels are replayed again rather than the next ones skipped
+        sink = FlakySink()
+        writer = self._writer(sink).start()
+        writer.write(*self._labels(1, 'mem')[0])
+        self.assertTrue(_wait_for(lambda: len(sink.rows) == 4))
+        writer.close(timeout=2)
+        self.assertEqual(sink.rows, labels + self._labels(1, 'mem'))
+
+    def test_offset_past_end_of_spool(self):
+        # Left by a crash of an older version, which emptied the spool before resetting the offset
+        with open(self.spool_file, 'wb'):
+            pass
+        with open(self.spool_file + '.offset', 'w') as file:
+            file.write('500')
+        writer = self._writer(FlakySink())
+        writer.write(*self._labels(1)[0])
+        sink = FlakySink()
+        writer = self._writer(sink).start()
+        self.assertTrue(_wait_for(lambda: len(sink.rows) == 1))
+        writer.close(timeout=2)
+        self.assertEqual(sink.rows, self._labels(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
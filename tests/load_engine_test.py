@@ -0,0 +1,59 @@
+import asyncio
+import time
+import unittest
+
+import psutil
+
+from core.cpu.cmd_factory import CpuCmdGenerator
+from core.cpu.load_engine import CpuLoadEngine, is_engine_cmd
+
+
+class Test_Load_Engine(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = CpuLoadEngine(workers=1, period=0.05).start()
+
+    def tearDown(self):
+        self.engine.stop()
+
+    def _measure(self, seconds):
+        worker = psutil.Process(self.engine.pids[0])
+        before = sum(worker.cpu_times()[:2])
+        time.sleep(seconds)
+        return (sum(worker.cpu_times()[:2]) - before) / seconds * 100
+
+    def test_duty_cycle(self):
+        self.engine.set_load(50)
+        time.sleep(0.2)
+        self.assertGreater(self._measure(1), 25)
+        self.engine.set_load(0)
+        time.sleep(0.2)
+        self.assertLess(self._measure(0.5), 10)
+
+    def test_lease(self):
+        async def scenario():
+            step = self.engine.lease(['cpu-engine', '-c', '1', '--cpu-load', '30'])
+            blip = self.engine.lease(['cpu-engine', '-c', '1', '--cpu-load', '20', '--timeout', '0.1'])
+            stacked = self.engine.load
+            await blip.wait()
+            after_timeout = self.engine.load
+            step.terminate()
+            returncode = await step.wait()
+            return stacked, after_timeout, returncode
+
+        stacked, after_timeout, returncode = asyncio.run(scenario())
+        self.assertAlmostEqual(stacked, 50)
+        self.assertAlmostEqual(after_timeout, 30)
+        self.assertLess(returncode, 0)
+        self.assertAlmostEqual(self.engine.load, 0)
+
+    def test_engine_backend(self):
+        sg = CpuCmdGenerator(backend='engine')
+        cmds, _, _ = sg.generate_script({"type": "Blip", "duration": 7, "shape": None})
+        self.assertTrue(is_engine_cmd(cmds[0]))
+        self.assertFalse(is_engine_cmd(CpuCmdGenerator(backend='stress-ng').generate_script(
+            {"type": "Blip", "duration": 7, "shape": None})[0][0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from core.planner import Planner, load_plan, save_plan, shard_plan
+from core.simulation import run_simulation
+from core.toolkit import tools
+from core.toolkit.tools import set_sampler
+
+
+class DriftingSampler:
+    # Readings that change on every call, like a live host between two compilations
+    interval = 1
+
+    def __init__(self):
+        self.calls = 0
+
+    def wait_ready(self, timeout=None):
+        return True
+
+    def latest(self, column):
+        self.calls += 1
+        return 10.0 + self.calls
+
+    def mean(self, column, window):
+        return self.latest(column)
+
+
+class Test_Planner(unittest.TestCase):
+
+    def test_compile(self):
+        sampler = DriftingSampler()
+        self.addCleanup(set_sampler, tools._sampler)
+        set_sampler(sampler)
+        plan = Planner(['cpu', 'mem', 'processes'], seed=7).compile(1)
+        offsets = [event['offset'] for event in plan['events']]
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertEqual({event['metric'] for event in plan['events']}, {'cpu', 'mem', 'processes'})
+        for event in plan['events']:
+            self.assertGreaterEqual(event['end'], event['offset'])
+            self.assertTrue(event['expected'])
+        again = Planner(['cpu', 'mem', 'processes'], seed=7).compile(1)
+        self.assertEqual(plan['events'], again['events'])
+        # The loads are host shares resolved when the events run, compiling never reads the host
+        self.assertEqual(sampler.calls, 0)
+
+    def test_save_and_shard(self):
+        plan = Planner(['cpu'], seed=1).compile(1)
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = save_plan(plan, os.path.join(directory, 'plan.json.gz'))
+            loaded = load_plan(file_path)
+        self.assertEqual(loaded['events'], plan['events'])
+        shards = [shard_plan(loaded, i, 2)['events'] for i in range(2)]
+        self.assertEqual(len(shards[0]) + len(shards[1]), len(plan['events']))
+
+    def test_play_plan(self):
+        plan = Planner(['cpu'], seed=2).compile(0.5)
+        with tempfile.TemporaryDirectory() as directory:
+            report = run_simulation(['cpu'], days=0.6, seed=2, storage_dir=directory, plan=plan)
+        self.assertGreaterEqual(report['labels'], len(plan['events']))
+
+
+if __name__ == '__main__':
+    unittest.main()
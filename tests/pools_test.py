@@ -0,0 +1,120 @@
+import unittest
+from unittest import mock
+
+import psycopg2
+
+from core.toolkit import pools
+from core.toolkit.pools import PostgreSQLConnectionPool
+
+
+class FakeCursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if self.conn.dead:
+            self.conn.closed = 1
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+        self.conn.executed.append(sql)
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = 0
+        self.dead = False
+        self.executed = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeThreadedPool:
+    """
+    Stand-in for ThreadedConnectionPool that hands out fake connections
+    """
+    created = 0
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        FakeThreadedPool.created += 1
+        self.idle = []
+        self.closed = []
+
+    def getconn(self):
+        return self.idle.pop() if self.idle else FakeConnection()
+
+    def putconn(self, conn, close=False):
+        (self.closed if close else self.idle).append(conn)
+
+    def closeall(self):
+        pass
+
+
+class Test_Pool(unittest.TestCase):
+
+    def setUp(self):
+        FakeThreadedPool.created = 0
+        patcher = mock.patch.object(pools, 'ThreadedConnectionPool', FakeThreadedPool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = PostgreSQLConnectionPool(1, 2, health_check_seconds=0, checkout_timeout_seconds=0.1,
+                                             host='localhost')
+
+    def test_lazy(self):
+        self.assertIsNone(self.pool.pool)
+        self.assertEqual(FakeThreadedPool.created, 0)
+        self.pool.execute('INSERT 1')
+        self.assertEqual(FakeThreadedPool.created, 1)
+        self.assertEqual(self.pool.stats()['checkouts'], 1)
+
+    def test_no_leak(self):
+        for _ in range(3):
+            with self.assertRaises(ValueError):
+                with self.pool.connection():
+                    raise ValueError("bad row")
+        # Both slots are free again
+        with self.pool.connection(), self.pool.connection():
+            pass
+        stats = self.pool.stats()
+        self.assertEqual(stats['checkouts'], 5)
+        self.assertEqual(stats['failures'], 0)
+
+    def test_exhausted(self):
+        with self.pool.connection(), self.pool.connection():
+            with self.assertRaises(pools.PoolError):
+                self.pool.get_connection()
+        self.assertEqual(self.pool.stats()['failures'], 1)
+
+    def test_recycle(self):
+        with self.pool.connection() as conn:
+            pass
+        # The server went away while the connection was idle
+        conn.dead = True
+        with self.pool.connection() as fresh:
+            self.assertIsNot(fresh, conn)
+        self.assertEqual(self.pool.pool.closed, [conn])
+        self.assertEqual(self.pool.stats()['recycled'], 1)
+
+        with self.assertRaises(psycopg2.OperationalError):
+            with self.pool.connection() as conn:
+                conn.dead = True
+                conn.cursor().execute('INSERT 1')
+        self.assertIn(conn, self.pool.pool.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
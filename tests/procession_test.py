@@ -0,0 +1,122 @@
+import datetime
+import os
+import random
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.dataset import read_dataset
+from utils.procession import SEGMENT_DTYPE, DataProcessor, encode_runs, load_segments
+
+
+def make_data(hours, labels, seed=0):
+    """
+    Synthetic label export and resampled drift data over hours, the label times are in local time (UTC+8)
+    like the exports of the scheduler, with overlapping, fractional and boundary-aligned labels
+    """
+    rng = random.Random(seed)
+    begin = datetime.datetime(2023, 11, 3, 8, 0, 0)
+    end = begin + datetime.timedelta(hours=hours)
+    label_path = "storage/cpu_{}_to_{}.csv".format(begin.strftime('%Y-%m-%d_%H-%M-%S'),
+                                                   end.strftime('%Y-%m-%d_%H-%M-%S'))
+    rows = []
+    for i in range(labels):
+        start = begin + datetime.timedelta(seconds=rng.randrange(0, hours * 3600))
+        if rng.random() < 0.5:
+            start += datetime.timedelta(microseconds=rng.randrange(1, 10 ** 6))
+        elif rng.random() < 0.5:
+            # Aligned on a 10 s timestep
+            start = start.replace(second=start.second // 10 * 10)
+        stop = start + datetime.timedelta(seconds=rng.choice([5, 10, 30, 600, 3600]) + rng.random())
+        label = rng.choice(['Sudden', 'Blip', 'Recurrent', 'Incremental', 'Gradual', 'Incremental+Blip'])
+        fmt = '%d/%m/%Y %H:%M:%S.%f' if start.microsecond else '%d/%m/%Y %H:%M:%S'
+        rows.append([i + 1, label, start.strftime(fmt), stop.strftime('%d/%m/%Y %H:%M:%S')])
+    label_data = pd.DataFrame(rows, columns=['id', 'drift_label', 'drift_start', 'drift_end'])
+    index = pd.date_range(begin - datetime.timedelta(hours=8), end - datetime.timedelta(hours=8), freq='1s',
+                          tz='UTC')
+    drift_data = pd.DataFrame({'_value': np.random.default_rng(seed).random(len(index))}, index=index)
+    return label_path, label_data, drift_data
+
+
+class Test_DataProcessor(unittest.TestCase):
+
+    def test_annotated_data_matches_legacy(self):
+        for seed in range(3):
+            label_path, label_data, drift_data = make_data(6, 80, seed)
+            processor = DataProcessor(label_path, None)
+            expected = processor.convert_to_annotated_data_legacy(label_data, drift_data)
+            annotated = processor.convert_to_annotated_data(label_data, drift_data)
+            self.assertEqual(annotated, expected)
+            self.assertTrue(any(category for _, _, category in annotated))
+
+    def test_label_boundaries(self):
+        label_path, _, drift_data = make_data(1, 0)
+        label_data = pd.DataFrame([[1, 'Sudden', '03/11/2023 08:00:10.500000', '03/11/2023 08:00:30'],
+                                   [2, 'Blip', '03/11/2023 08:00:20', '03/11/2023 08:00:40.200000']],
+                                  columns=['id', 'drift_label', 'drift_start', 'drift_end'])
+        processor = DataProcessor(label_path, None)
+        annotated = processor.convert_to_annotated_data(label_data, drift_data)
+        # Start floored and included, end floored and excluded, the first label wins the overlap
+        self.assertEqual([category for _, _, category in annotated[:6]], [0, 1, 1, 2, 0, 0])
+
+    def test_encode_runs(self):
+        categories = [0, 1, 1, 2, 0, 3, 0, 0, 4]
+        segments, lengths = encode_runs(categories, offset=10)
+        self.assertEqual(segments.dtype, SEGMENT_DTYPE)
+        self.assertEqual(segments.tolist(), [(11, 14, 1), (15, 16, 3), (18, 19, 4)])
+        self.assertEqual(lengths.tolist(), [0, 3, 3, 3, 0, 1, 0, 0, 1])
+        self.assertEqual(DataProcessor.process_continuous([(None, None, c) for c in categories]), lengths.tolist())
+        self.assertEqual(encode_runs([])[0].tolist(), [])
+
+    def test_streaming_matches_batch(self):
+        label_path, label_data, _ = make_data(3, 30, seed=4)
+        rng = np.random.default_rng(4)
+        # Telegraf-like export starting late and ending early, with a gap, off-second and missing samples
+        begin = datetime.datetime(2023, 11, 3, 0, 5, 3)
+        times = [begin + datetime.timedelta(seconds=10 * i) for i in range(1000)]
+        times = times[:400] + times[600:]
+        times[50] += datetime.timedelta(microseconds=500000)
+        values = rng.random(len(times)) * 100
+        values[70] = np.nan
+        drift_data = pd.DataFrame({'result': '', '_time': [t.strftime('%Y-%m-%dT%H:%M:%S.%fZ') for t in times],
+                                   '_value': values})
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                os.makedirs('processed')
+                label_data.to_csv(os.path.basename(label_path), index=False)
+                drift_data.to_csv('drift.csv', index=False)
+                processor = DataProcessor(os.path.basename(label_path), 'drift.csv')
+                outputs = []
+                for run in (processor.process_data, lambda: processor.process_data_streaming(chunk_rows=37)):
+                    run()
+                    files = sorted(os.listdir('processed'))
+                    with open(os.path.join('processed', files[0]), 'rb') as file:
+                        csv = file.read()
+                    segments = load_segments(os.path.join('processed', files[1]), mmap=False)
+                    outputs.append((files, csv, segments.tolist()))
+
+                # Same rows as a typed, partitioned dataset
+                processor = DataProcessor(os.path.basename(label_path), 'drift.csv', output_format='npz',
+                                          partition_unit='h')
+                datasets = []
+                for run in (processor.process_data, lambda: processor.process_data_streaming(chunk_rows=37)):
+                    run()
+                    datasets.append(read_dataset(processor.processed_dataset_path()))
+                expected = pd.read_csv(processor.processed_csv_path())
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(outputs[1], outputs[0])
+        self.assertTrue(outputs[0][2])
+        pd.testing.assert_frame_equal(datasets[1], datasets[0])
+        self.assertEqual(np.datetime_as_string(datasets[0]['timestamp'].values, unit='s').tolist(),
+                         [t.rstrip('Z') for t in expected['timestamp']])
+        np.testing.assert_allclose(datasets[0]['value'], expected['value'], rtol=1e-12)
+        np.testing.assert_array_equal(datasets[0]['drift_label'], expected['drift_label'])
+
+
+if __name__ == '__main__':
+    unittest.main()
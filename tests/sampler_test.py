@@ -0,0 +1,44 @@
+import time
+import unittest
+
+import numpy as np
+
+from core.toolkit.sampler import MetricSampler, RingBuffer
+
+
+class Test_RingBuffer(unittest.TestCase):
+
+    def test_latest_and_mean(self):
+        buffer = RingBuffer(4, columns=('value',))
+        for value in range(1, 11):
+            buffer.append([value])
+        self.assertEqual(len(buffer), 4)
+        self.assertEqual(buffer.latest('value'), 10)
+        self.assertAlmostEqual(buffer.mean('value', 2), 9.5)
+        self.assertAlmostEqual(buffer.mean('value', 3), 9)
+        # Windows are capped to what the buffer still holds
+        self.assertAlmostEqual(buffer.mean('value', 100), 9)
+        np.testing.assert_array_equal(buffer.snapshot('value'), [7, 8, 9, 10])
+
+    def test_empty(self):
+        buffer = RingBuffer(4)
+        with self.assertRaises(LookupError):
+            buffer.latest('cpu')
+
+
+class Test_MetricSampler(unittest.TestCase):
+
+    def test_sampling(self):
+        sampler = MetricSampler(interval=0.02, capacity=100)
+        sampler.start()
+        self.assertTrue(sampler.wait_ready(timeout=5))
+        time.sleep(0.2)
+        sampler.stop()
+        sampler.join()
+        self.assertGreater(sampler.latest('processes'), 0)
+        self.assertGreater(sampler.stats()['samples'], 1)
+        self.assertLess(sampler.stats()['overhead'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,79 @@
+import asyncio
+import os
 import unittest
 
-from core.scheduler import Scheduler
+from core.scheduler import AsyncScheduler, Scheduler
+from core.simulation import VirtualClock, VirtualEventLoop
+from core.toolkit.tools import get_timeout_from_cmd
 
+# The Scheduler tests below drive stress-ng on this host and only stop when interrupted
+STRESS_TESTS = os.environ.get('STRESS_TESTS')
 
+
+class FakeProcess:
+    """
+    Command that exits when its stress-ng timeout expires, with the interface of an asyncio subprocess
+    """
+
+    def __init__(self, timeout):
+        self.returncode = None
+        self._done = asyncio.Event()
+        asyncio.get_event_loop().call_later(timeout, self.send_signal, 0)
+
+    def send_signal(self, sig):
+        if self.returncode is None:
+            self.returncode = -sig
+            self._done.set()
+
+    async def wait(self):
+        await self._done.wait()
+        return self.returncode
+
+
+class StubScheduler(AsyncScheduler):
+    """
+    AsyncScheduler on a virtual clock, starting FakeProcess commands and keeping the labels
+    """
+
+    def __init__(self, metric, clock):
+        super().__init__(metric)
+        self.controlled = False
+        self.clock = clock
+        self.labels = []
+
+    def _now(self):
+        return self.clock.datetime()
+
+    async def _exec(self, cmd):
+        return FakeProcess(get_timeout_from_cmd(cmd))
+
+    async def _insert(self, drift_type, drift_info_time):
+        self.labels.append((drift_type, (drift_info_time[1] - drift_info_time[0]).total_seconds()))
+
+
+class Test_AsyncScheduler(unittest.TestCase):
+
+    def test_events_run_concurrently(self):
+        clock = VirtualClock(start=0)
+        loop = VirtualEventLoop(clock)
+        cpu, mem = StubScheduler('cpu', clock), StubScheduler('mem', clock)
+        blip = {'type': 'Blip', 'mode': 'independent drift', 'duration': None, 'load': None,
+                'cmds': [['stress-ng', '-c', '1', '--cpu-load', '50', '--timeout', '30']]}
+        recurrent = {'type': 'Recurrent', 'mode': 'independent drift', 'duration': None, 'load': None,
+                     'cmds': [['stress-ng', '--vm', '1', '--vm-bytes', '100M', '--timeout', '60']]}
+        try:
+            asyncio.set_event_loop(loop)
+            loop.run_until_complete(asyncio.gather(cpu.run_event(blip), mem.run_event(recurrent)))
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+        self.assertEqual(cpu.labels, [('Blip', 30)])
+        self.assertEqual(mem.labels, [('Recurrent', 60)])
+        # Both timelines waited on one loop, not one after the other
+        self.assertAlmostEqual(clock.time(), 60, delta=1)
+
+
+@unittest.skipUnless(STRESS_TESTS, "runs stress-ng until interrupted, set STRESS_TESTS=1 to run it")
 class Test_CPU(unittest.TestCase):
 
     def test_get_recurrent_cpu_utilization(self):
@@ -36,6 +107,7 @@ class Test_CPU(unittest.TestCase):
         s.start()
 
 
+@unittest.skipUnless(STRESS_TESTS, "runs stress-ng until interrupted, set STRESS_TESTS=1 to run it")
 class Test_MEM(unittest.TestCase):
 
     def test_start_recurrent(self):
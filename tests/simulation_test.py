@@ -0,0 +1,36 @@
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+
+from core.simulation import VirtualClock, VirtualEventLoop, run_simulation
+
+
+class Test_Simulation(unittest.TestCase):
+
+    def test_virtual_clock(self):
+        clock = VirtualClock(start=0)
+        loop = VirtualEventLoop(clock)
+        try:
+            loop.run_until_complete(asyncio.sleep(3600))
+        finally:
+            loop.close()
+        self.assertAlmostEqual(clock.time(), 3600)
+
+    def test_run_simulation(self):
+        with tempfile.TemporaryDirectory() as directory:
+            report = run_simulation(['cpu'], days=1, seed=1, storage_dir=directory)
+            self.assertAlmostEqual(report['simulated_hours'], 24)
+            self.assertGreater(report['labels'], 0)
+            self.assertEqual(len(report['files']), 1)
+
+    def test_simulation_leaves_the_supervisor_alone(self):
+        # Creating the shared supervisor would reap the process groups of other runs
+        with tempfile.TemporaryDirectory() as directory, mock.patch('core.scheduler.get_supervisor') as supervisor:
+            report = run_simulation(['cpu', 'processes'], days=0.5, seed=4, storage_dir=directory)
+        self.assertGreater(report['labels'], 0)
+        supervisor.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from core.toolkit.sinks import LabelSink, ParquetSink, SQLiteSink, create_sink, sync_labels
+
+
+class RecordingSink(LabelSink):
+
+    def __init__(self, fail_after=None):
+        self.rows = []
+        self.fail_after = fail_after
+
+    def write(self, rows):
+        if self.fail_after is not None and len(self.rows) >= self.fail_after:
+            raise ConnectionError("database unavailable")
+        self.rows.extend(rows)
+
+
+def _labels(count, metric='cpu'):
+    return [(metric, f"Sudden-{i}", f"2024-01-01 00:00:{i:02d}.000000", f"2024-01-01 00:01:{i:02d}.000000")
+            for i in range(count)]
+
+
+class Test_Sinks(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _check_sync(self, sink):
+        labels = _labels(4) + _labels(3, 'mem')
+        sink.write(labels[:2])
+        sink.write(labels[2:5])
+        sink.write(labels[5:])
+        self.assertEqual(sink.read(), labels)
+        self.assertEqual(sink.read('mem'), labels[4:])
+
+        # The target goes down after the first batch, the rest is synced on the next attempt
+        target = RecordingSink(fail_after=2)
+        with self.assertRaises(ConnectionError):
+            sync_labels(sink, target, batch_size=2)
+        target.fail_after = None
+        sync_labels(sink, target, batch_size=2)
+        self.assertEqual(target.rows, labels)
+        self.assertEqual(sync_labels(sink, target), 0)
+
+    def test_sqlite(self):
+        path = os.path.join(self.directory.name, 'labels.db')
+        sink = SQLiteSink(path)
+        self._check_sync(sink)
+        self.assertEqual(sink._conn.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        sink.close()
+        # Labels survive a restart
+        sink = SQLiteSink(path)
+        self.assertEqual(len(sink.read()), 7)
+        sink.close()
+
+    def test_parquet(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        self._check_sync(ParquetSink(os.path.join(self.directory.name, 'labels')))
+
+    def test_parquet_roll(self):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+        directory = os.path.join(self.directory.name, 'labels')
+        sink = ParquetSink(directory, compact_segments=3)
+        labels = _labels(6)
+        with mock.patch.object(sink, '_period', return_value='20240101T000000'):
+            sink.write(labels[:2])
+            sink.write(labels[2:3])
+            # Half of the labels reach the target before the segments are compacted
+            target = RecordingSink()
+            for key, rows in sink.unsynced(2):
+                target.write(rows)
+                sink.mark_synced(key)
+                break
+            segment = sorted(os.listdir(directory))[0]
+            shutil.copy(os.path.join(directory, segment), self.directory.name)
+            sink.write(labels[3:4])
+        self.assertEqual(os.listdir(directory), ['part-20240101T000000.parquet'])
+        # A segment the part absorbed, as left by an interrupted compaction, is not read twice
+        shutil.copy(os.path.join(self.directory.name, segment), directory)
+        self.assertEqual(sink.read(), labels[:4])
+
+        # The next period rolls the previous one, close compacts the current one
+        with mock.patch.object(sink, '_period', return_value='20240102T000000'):
+            sink.write(labels[4:])
+            sync_labels(sink, target, batch_size=10)
+            sink.close()
+        self.assertEqual(sorted(os.listdir(directory)), ['part-20240101T000000.parquet',
+                                                         'part-20240101T000000.parquet.synced',
+                                                         'part-20240102T000000.parquet'])
+        self.assertEqual(sink.read(), labels)
+        self.assertEqual(target.rows, labels)
+        self.assertEqual(sync_labels(sink, target), 0)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            create_sink('csv')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import subprocess
+import sys
+import unittest
+
+from benchmarks.startup_bench import ENTRY_POINTS, HEAVY_MODULES, ROOT, imported_modules
+
+
+class Test_Startup(unittest.TestCase):
+
+    def test_help_imports_no_heavy_module(self):
+        for name, (args, _) in ENTRY_POINTS.items():
+            with self.subTest(name):
+                modules = imported_modules(args)
+                self.assertIn('click', modules)
+                self.assertEqual([module for module in HEAVY_MODULES if module in modules], [])
+
+    def test_import_has_no_side_effect(self):
+        # Importing the registry neither parses a configuration file nor opens a log file
+        code = "from core.toolkit.config import registry; print(len(registry._snapshots), registry._logger)"
+        result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.split(), ['0', 'None'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+import psutil
+
+from core.toolkit.supervisor import IDLE_CMD, ProcessSupervisor, run_supervised
+
+
+class Test_Supervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.supervisor = ProcessSupervisor(grace_seconds=2, registry_dir=self.directory.name)
+        self.registry_file = self.supervisor.registry_file
+
+    def tearDown(self):
+        self.supervisor.kill_all()
+        self.directory.cleanup()
+
+    def test_kill_tree(self):
+        async def scenario():
+            # A parent with two workers, like stress-ng
+            process = await self.supervisor.spawn(['sh', '-c', 'sleep 30 & sleep 30 & wait'])
+            await asyncio.sleep(0.3)
+            workers = self.supervisor.worker_count()
+            children = psutil.Process(process.pid).children(recursive=True)
+            with open(self.registry_file) as file:
+                registered = file.read().split()
+            await self.supervisor.kill_tree(process)
+            await asyncio.sleep(0.1)
+            return workers, children, registered, process
+
+        workers, children, registered, process = asyncio.run(scenario())
+        self.assertEqual(workers, 3)
+        self.assertEqual(registered, [str(process.pid)])
+        self.assertEqual(self.supervisor.children, {})
+        for child in children:
+            self.assertFalse(child.is_running() and child.status() != psutil.STATUS_ZOMBIE)
+        self.supervisor.kill_all()
+        self.assertFalse(os.path.exists(self.registry_file))
+
+    def test_registry_compaction(self):
+        async def scenario():
+            process = await self.supervisor.spawn(['sleep', '30'])
+            for _ in range(3):
+                done = await self.supervisor.spawn(['true'])
+                await done.wait()
+                # Let the reaper run
+                await asyncio.sleep(0.05)
+            with open(self.registry_file) as file:
+                registered = file.read().split()
+            await self.supervisor.kill_tree(process)
+            return process, done, registered
+
+        with mock.patch('core.toolkit.supervisor.REGISTRY_SLACK', 2):
+            process, done, registered = asyncio.run(scenario())
+        # Appended on spawn, rewritten without the reaped groups once two of them piled up
+        self.assertEqual(registered, [str(process.pid), str(done.pid)])
+
+    def test_kill_stale(self):
+        # Registry files of a run that died and of one that is still alive
+        dead_owner = subprocess.Popen(['true'])
+        dead_owner.wait()
+        groups = {}
+        for owner in (dead_owner.pid, os.getppid()):
+            groups[owner] = subprocess.Popen(IDLE_CMD, start_new_session=True)
+            with open(os.path.join(self.directory.name, f"{owner}.txt"), 'w') as file:
+                file.write(f"{groups[owner].pid}\n")
+        try:
+            killed = self.supervisor.kill_stale()
+            groups[dead_owner.pid].wait(timeout=5)
+            self.assertEqual(killed, 1)
+            self.assertIsNone(groups[os.getppid()].poll())
+            self.assertEqual(os.listdir(self.directory.name), [f"{os.getppid()}.txt"])
+        finally:
+            for process in groups.values():
+                process.kill()
+                process.wait()
+
+    def test_terminate_by_identity(self):
+        class Lease:
+            # Load lease whose id happens to equal the pid of a supervised command
+            returncode = None
+
+            def __init__(self, pid):
+                self.pid = pid
+                self.signals = []
+
+            def send_signal(self, sig):
+                self.signals.append(sig)
+
+        async def scenario():
+            process = await self.supervisor.spawn(['sleep', '30'])
+            lease = Lease(process.pid)
+            self.supervisor.terminate(lease)
+            await asyncio.sleep(0.1)
+            alive = process.returncode is None
+            await self.supervisor.kill_tree(process)
+            return lease, alive
+
+        lease, alive = asyncio.run(scenario())
+        self.assertEqual(lease.signals, [15])
+        self.assertTrue(alive)
+
+    def test_run_supervised(self):
+        async def forever():
+            await self.supervisor.spawn(['sleep', '30'])
+            await asyncio.sleep(30)
+
+        async def scenario():
+            task = asyncio.ensure_future(run_supervised(forever(), self.supervisor))
+            await asyncio.sleep(0.3)
+            os.kill(os.getpid(), 15)
+            await task
+
+        asyncio.run(scenario())
+        self.assertEqual(self.supervisor.children, {})
+        self.assertEqual(self.supervisor.worker_count(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
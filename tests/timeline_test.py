@@ -0,0 +1,48 @@
+import asyncio
+import unittest
+
+from core.timeline import EventTimeline, composite_label
+
+
+class Test_Timeline(unittest.TestCase):
+
+    def setUp(self):
+        rules = {'Incremental': ['Blip', 'Recurrent'], 'Blip': [], 'Recurrent': []}
+        self.timeline = EventTimeline(rules, max_active=3)
+
+    def test_heap_order(self):
+        for at in (30, 10, 20):
+            self.timeline.push(at, {'type': 'Blip', 'mode': 'overlay', 'at': at})
+        self.assertEqual([self.timeline.pop()[0] for _ in range(3)], [10, 20, 30])
+
+    def test_compatibility(self):
+        self.assertTrue(self.timeline.compatible('Incremental'))
+        with self.timeline.occupy('Incremental', is_open=False) as slot:
+            # No overlay while the base drift is still ramping up
+            self.assertFalse(self.timeline.compatible('Blip'))
+            self.assertEqual(self.timeline.bases(), [])
+            slot.open()
+            self.assertTrue(self.timeline.compatible('Blip'))
+            self.assertFalse(self.timeline.compatible('Sudden'))
+            with self.timeline.occupy('Blip'):
+                self.assertFalse(self.timeline.compatible('Recurrent'))
+            self.assertEqual(composite_label(self.timeline.bases(), 'Blip'), 'Incremental+Blip')
+        self.assertEqual(self.timeline.active, [])
+
+    def test_discard_overlays(self):
+        self.timeline.push(5, {'type': 'Sudden', 'mode': 'independent drift'})
+        self.timeline.push(1, {'type': 'Blip', 'mode': 'overlay'})
+        self.timeline.discard_overlays()
+        self.assertEqual(len(self.timeline), 1)
+        self.assertEqual(self.timeline.pop()[1]['type'], 'Sudden')
+
+    def test_wait(self):
+        async def wait_for_push():
+            asyncio.get_event_loop().call_later(0.01, self.timeline.push, 0, {'type': 'Blip', 'mode': 'overlay'})
+            await self.timeline.wait(5)
+            return len(self.timeline)
+        self.assertEqual(asyncio.run(wait_for_push()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,27 @@
 import datetime
 import unittest
 
+from core.toolkit import tools
 from core.toolkit.pools import perform_insert
-from core.toolkit.tools import get_available_processes_num, get_current_mem_percent
+from core.toolkit.tools import (get_available_processes_num, get_current_mem_percent, host_share, resolve_cmd,
+                                resolve_host_share, set_sampler)
+
+
+class StubSampler:
+    # Fixed readings of a modeled host
+    interval = 1
+
+    def __init__(self, readings):
+        self.readings = readings
+
+    def wait_ready(self, timeout=None):
+        return True
+
+    def latest(self, column):
+        return self.readings[column]
+
+    def mean(self, column, window):
+        return self.readings[column]
 
 
 class Test_Tools(unittest.TestCase):
@@ -14,6 +33,16 @@ class Test_Tools(unittest.TestCase):
         per = get_current_mem_percent()
         print(per)
 
+    def test_resolve_host_share(self):
+        self.addCleanup(set_sampler, tools._sampler)
+        set_sampler(StubSampler({'cpu': 40.0, 'mem_available': 1000.0, 'mem_percent': 30.0, 'processes': 96}))
+        cmd = ['stress-ng', '--vm', '2', '--vm-bytes', host_share('mem_available', 0.25), '--timeout', '30']
+        self.assertEqual(resolve_cmd(cmd), ['stress-ng', '--vm', '2', '--vm-bytes', '250M', '--timeout', '30'])
+        self.assertEqual(resolve_host_share(host_share('cpu_available', 0.5)), '30.0')
+        self.assertEqual(resolve_host_share(host_share('processes_available', 0.5, 20)), '2020')
+        self.assertEqual(resolve_host_share(host_share('mem_percent', 1.0)), 30.0)
+        self.assertIsNone(resolve_host_share(None))
+
 
 class Test_Pool(unittest.TestCase):
 
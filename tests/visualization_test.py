@@ -0,0 +1,91 @@
+import datetime
+import os
+import pickle
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.visualization import LabelIndex, Visualization, lttb, parse_rfc3339, to_date_numbers
+
+
+class Test_Visualization(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        times = pd.date_range('2023-11-03 00:00:00', periods=1200, freq='10s')
+        values = np.sin(np.arange(len(times)) / 50)
+        values[300] = np.nan
+        self.csv_path = os.path.join(self.directory.name, 'export.csv')
+        pd.DataFrame({'result': '', '_time': times.strftime('%Y-%m-%dT%H:%M:%SZ'), '_value': values}).to_csv(
+            self.csv_path, index=False)
+        # Label times are local time (UTC+8)
+        begin = datetime.datetime(2023, 11, 3, 8, 0, 0)
+        labels = [['Sudden', (begin + datetime.timedelta(minutes=10), begin + datetime.timedelta(minutes=30))],
+                  ['Incremental+Blip', (begin + datetime.timedelta(minutes=90), begin + datetime.timedelta(hours=5))]]
+        self.pkl_path = os.path.join(self.directory.name, 'labels.pkl')
+        with open(self.pkl_path, 'wb') as file:
+            pickle.dump(labels, file)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_lttb(self):
+        x = np.arange(10000.0)
+        y = np.random.default_rng(0).random(10000)
+        y[4321] = 50
+        sampled_x, sampled_y = lttb(x, y, 100)
+        self.assertEqual(len(sampled_x), 100)
+        self.assertEqual((sampled_x[0], sampled_x[-1]), (0, 9999))
+        self.assertTrue(np.all(np.diff(sampled_x) > 0))
+        self.assertIn(4321, sampled_x)
+        self.assertEqual(lttb(x[:50], y[:50], 100)[0].tolist(), x[:50].tolist())
+
+    def test_render(self):
+        v = Visualization(self.pkl_path, self.csv_path, chunk_rows=500)
+        label_index = LabelIndex(v.read_pkl_file())
+        times, _ = v.load_series()
+        self.assertEqual(len(times), 1199)
+        self.assertEqual(parse_rfc3339(['2023-11-03T08:00:00.5+08:00']).tolist(),
+                         parse_rfc3339(['2023-11-03T00:00:00.5Z']).tolist())
+        spans = label_index.spans(times[0], times[599])
+        self.assertEqual(sorted(spans), ['Blip', 'Sudden'])
+        self.assertAlmostEqual(spans['Sudden'][0][1] * 86400, 1200, places=3)
+        self.assertAlmostEqual(spans['Blip'][0][0] + spans['Blip'][0][1], to_date_numbers(times[599:600])[0])
+        # Sudden covers the samples 60 to 180 (the NaN sample 300 is dropped), Blip starts at sample 539
+        self.assertEqual(label_index.sample_spans(times[:600]), [('Sudden', 60, 180), ('Blip', 539, 599)])
+
+        output = os.path.join(self.directory.name, 'plots')
+        paths = v.render(output, 'png', jobs=2, figsize=(8, 3))
+        self.assertEqual([os.path.basename(path) for path in paths], ['chunk-00001.png', 'chunk-00002.png',
+                                                                      'chunk-00003.png'])
+        self.assertTrue(all(os.path.getsize(path) for path in paths))
+        self.assertTrue(v.render(output, 'svg', jobs=1, figsize=(8, 3))[0].endswith('.svg'))
+        overview = v.overview(os.path.join(output, 'overview.png'))
+        with open(overview, 'rb') as file:
+            self.assertEqual(file.read(8), b'\x89PNG\r\n\x1a\n')
+
+
+class Test_LabelIndex(unittest.TestCase):
+
+    def test_overlapping(self):
+        rng = np.random.default_rng(1)
+        begin = datetime.datetime(2023, 11, 3, 8, 0, 0)
+        starts = rng.uniform(0, 86400, 2000)
+        # Mostly short labels and a few long ones, in file order (unsorted)
+        lengths = np.where(rng.random(2000) < 0.02, 20000, rng.uniform(1, 600, 2000))
+        labels = [['Sudden', (begin + datetime.timedelta(seconds=start),
+                              begin + datetime.timedelta(seconds=start + length))]
+                  for start, length in zip(starts, lengths)]
+        label_index = LabelIndex(labels)
+        self.assertEqual(len(label_index), 2000)
+        for low, high in rng.uniform(-3600, 90000, (200, 2)) * 10 ** 9:
+            low, high = int(min(low, high)) + 1698969600 * 10 ** 9, int(max(low, high)) + 1698969600 * 10 ** 9
+            expected = np.flatnonzero((label_index.starts <= high) & (label_index.ends >= low))
+            self.assertEqual(label_index.overlapping(low, high).tolist(), expected.tolist())
+        self.assertEqual(LabelIndex([]).overlapping(0, 10).tolist(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
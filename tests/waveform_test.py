@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+
+import numpy as np
+
+from core.simulation import VirtualClock, VirtualEventLoop
+from core.toolkit.waveform import Waveform, WaveformLoad, gradual_waveform, incremental_waveform
+
+
+class RecordingDriver:
+
+    def __init__(self):
+        self.values = []
+
+    def apply(self, value):
+        self.values.append(value)
+
+
+class Test_Waveform(unittest.TestCase):
+
+    def test_shapes(self):
+        self.assertAlmostEqual(Waveform.ramp(0, 40, 100)(50), 20)
+        self.assertAlmostEqual(Waveform.ramp(0, 40, 100)(500), 40)
+        sigmoid = Waveform.sigmoid(10, 50, 60)
+        times, values = sigmoid.sample(2)
+        self.assertAlmostEqual(values[0], 10)
+        self.assertAlmostEqual(values[-1], 50)
+        self.assertTrue(np.all(np.diff(values) > 0))
+        self.assertAlmostEqual(Waveform.sine(20, 5, 40, 100)(10), 25)
+        step = Waveform.step([1, 2, 3], [10, 10, 10])
+        self.assertEqual(list(step(np.array([0, 9.9, 10, 25, 40]))), [1, 1, 2, 3, 3])
+        self.assertAlmostEqual(Waveform.from_array([0, 10, 0], 5)(7.5), 5)
+        self.assertAlmostEqual(Waveform.ramp(0, 10, 10).scaled(2)(10), 20)
+
+    def test_drift_waveforms(self):
+        incremental = incremental_waveform(30, 200, 'ramp')
+        self.assertEqual(incremental.duration, 200)
+        gradual = gradual_waveform(30, [20, 40], [60, 30], edge_seconds=5)
+        self.assertAlmostEqual(gradual(10), 30)
+        self.assertAlmostEqual(gradual(50), 0)
+        self.assertAlmostEqual(gradual(gradual.duration), 30)
+
+    def test_load(self):
+        clock = VirtualClock(start=0)
+        loop = VirtualEventLoop(clock)
+        driver = RecordingDriver()
+
+        async def scenario():
+            load = WaveformLoad(driver, Waveform.ramp(0, 10, 10), update_hz=1)
+            await asyncio.sleep(30)
+            held = driver.values[-1]
+            load.terminate()
+            return held, await load.wait()
+
+        try:
+            held, returncode = loop.run_until_complete(scenario())
+        finally:
+            loop.close()
+        self.assertEqual(len(driver.values), 12)
+        self.assertAlmostEqual(held, 10)
+        self.assertEqual(driver.values[-1], 0)
+        self.assertLess(returncode, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
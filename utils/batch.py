@@ -0,0 +1,207 @@
+"""
+Batch processing of many label/metric file pairs.
+Label files follow the storage/ naming convention read by DataProcessor.create_standard_time_bounds,
+<metric>_<YYYY-MM-DD_HH-MM-SS>_to_<YYYY-MM-DD_HH-MM-SS>.csv. The InfluxDB export of a label file has the same
+relative path under the exports directory, e.g. storage/host-1/cpu_..._to_....csv and data/host-1/cpu_..._to_....csv,
+or the pairs are listed in a CSV file with label and export columns.
+Every pair runs in its own worker process, pairs whose outputs are newer than their inputs are skipped, and the
+status and time of every pair are written to the batch report.
+Run from the repository root: python -m utils.batch --labels storage --exports data
+"""
+import csv
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import click
+
+LABEL_FILE_PATTERN = re.compile(r'^[A-Za-z]+_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}_to_\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2}\.csv$')
+REPORT_FILE = 'batch_report.csv'
+REPORT_COLUMNS = ['label', 'export', 'output', 'status', 'seconds', 'error']
+
+
+def discover_pairs(label_dir, export_dir, output_dir):
+    """
+    Find the label files under label_dir and pair them with the export at the same relative path in export_dir
+    :param label_dir (str): Directory searched recursively for label files.
+    :param export_dir (str): Directory of the InfluxDB exports.
+    :param output_dir (str): Root of the outputs, a label file in a subdirectory gets the same subdirectory.
+    :return:
+        list: (label path, export path, output directory) tuples, sorted by label path.
+        list: Label paths without an export.
+    """
+    pairs, missing = [], []
+    for root, _, files in os.walk(label_dir):
+        for name in files:
+            if not LABEL_FILE_PATTERN.match(name):
+                continue
+            relative = os.path.relpath(os.path.join(root, name), label_dir)
+            export = os.path.join(export_dir, relative)
+            if not os.path.isfile(export):
+                missing.append(os.path.join(label_dir, relative))
+                continue
+            pairs.append((os.path.join(label_dir, relative), export,
+                          os.path.normpath(os.path.join(output_dir, os.path.dirname(relative)))))
+    return sorted(pairs), sorted(missing)
+
+
+def no_export_rows(label_paths, label_dir, export_dir, output_dir):
+    """
+    Report rows of the label files discover_pairs found no export for, they count as failed pairs
+    :return:
+        list: One failed REPORT_COLUMNS row per label path.
+    """
+    rows = []
+    for label_path in label_paths:
+        relative = os.path.relpath(label_path, label_dir)
+        rows.append({'label': label_path, 'export': os.path.join(export_dir, relative),
+                     'output': os.path.normpath(os.path.join(output_dir, os.path.dirname(relative))),
+                     'status': 'failed', 'seconds': 0.0, 'error': 'No export'})
+    return rows
+
+
+def read_pairs(pairs_file, output_dir):
+    """
+    Read the pairs listed in a CSV file with label and export columns, and an optional output column
+    """
+    with open(pairs_file, 'r', newline='') as file:
+        return [(row['label'], row['export'], row.get('output') or output_dir) for row in csv.DictReader(file)]
+
+
+def _processor(label_path, export_path, output_dir, output_format='csv', partition_unit='D'):
+    # pandas is imported with utils.procession on first use, so --help returns at once
+    from utils.procession import DataProcessor
+    return DataProcessor(label_path, export_path, output_format, partition_unit, output_dir)
+
+
+def is_up_to_date(processor):
+    # The outputs exist and none of them is older than the label file or the export
+    inputs = max(os.path.getmtime(processor.label_data_path), os.path.getmtime(processor.drift_data_path))
+    outputs = processor.output_paths()
+    return all(os.path.exists(path) for path in outputs) and min(os.path.getmtime(path) for path in outputs) >= inputs
+
+
+def process_pair(label_path, export_path, output_dir, output_format='csv', partition_unit='D', chunk_rows=None):
+    """
+    Process one pair in a worker process, errors are returned instead of raised so one bad pair does not stop
+    the batch
+    :return:
+        dict: One REPORT_COLUMNS row.
+    """
+    begin = time.perf_counter()
+    row = {'label': label_path, 'export': export_path, 'output': output_dir, 'status': 'done', 'error': ''}
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        processor = _processor(label_path, export_path, output_dir, output_format, partition_unit)
+        if chunk_rows:
+            processor.process_data_streaming(chunk_rows)
+        else:
+            processor.process_data()
+    except Exception as e:
+        row['status'] = 'failed'
+        row['error'] = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+    row['seconds'] = round(time.perf_counter() - begin, 3)
+    return row
+
+
+def run_batch(pairs, jobs=None, output_format='csv', partition_unit='D', chunk_rows=None, force=False,
+              progress=None):
+    """
+    Process the pairs on a pool of jobs worker processes
+    :param pairs (list): (label path, export path, output directory) tuples.
+    :param jobs (int or None): Worker processes, the number of CPUs by default.
+    :param force (bool): Process the pairs whose outputs are up to date too.
+    :param progress (callable or None): Called with every report row as its pair finishes.
+    :return:
+        list: The report rows, in the order of pairs.
+    """
+    rows, todo = {}, []
+    for pair in pairs:
+        label_path, export_path, output_dir = pair
+        row = {'label': label_path, 'export': export_path, 'output': output_dir, 'seconds': 0.0, 'error': ''}
+        try:
+            processor = _processor(label_path, export_path, output_dir, output_format, partition_unit)
+            if force or not is_up_to_date(processor):
+                todo.append((os.path.getsize(export_path), pair))
+                continue
+            rows[pair] = dict(row, status='skipped')
+        except OSError as e:
+            # A missing or unreadable input fails its own pair only
+            rows[pair] = dict(row, status='failed', error=f"{type(e).__name__}: {e}")
+        if progress is not None:
+            progress(rows[pair])
+    # Largest exports first, so a big one does not start last and hold up the end of the batch alone
+    todo = [pair for _, pair in sorted(todo, key=lambda item: item[0], reverse=True)]
+    if todo:
+        with ProcessPoolExecutor(max_workers=min(jobs or os.cpu_count() or 1, len(todo))) as executor:
+            futures = {executor.submit(process_pair, *pair, output_format, partition_unit, chunk_rows): pair
+                       for pair in todo}
+            for future in as_completed(futures):
+                pair = futures[future]
+                try:
+                    rows[pair] = future.result()
+                except Exception as e:
+                    # The worker process died, e.g. killed for using too much memory
+                    rows[pair] = {'label': pair[0], 'export': pair[1], 'output': pair[2], 'status': 'failed',
+                                  'seconds': 0.0, 'error': f"{type(e).__name__}: {e}"}
+                if progress is not None:
+                    progress(rows[pair])
+    return [rows[pair] for pair in pairs]
+
+
+def write_report(rows, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=REPORT_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+@click.command()
+@click.option('--labels', 'label_dir', type=click.Path(file_okay=False), default='storage', show_default=True,
+              help='Directory searched recursively for label files')
+@click.option('--exports', 'export_dir', type=click.Path(file_okay=False), default='data', show_default=True,
+              help='Directory of the InfluxDB exports, at the same relative paths as the label files')
+@click.option('--pairs', 'pairs_file', type=click.Path(exists=True, dir_okay=False), default=None,
+              help='CSV file with label and export columns, instead of --labels and --exports')
+@click.option('--output', 'output_dir', type=click.Path(file_okay=False), default='processed', show_default=True,
+              help='Root directory of the processed files')
+@click.option('--jobs', type=click.IntRange(min=1), default=None, help='Worker processes  [default: CPU count]')
+@click.option('--format', 'output_format', type=click.Choice(['csv', 'parquet', 'feather', 'npz']), default='csv',
+              show_default=True, help='Processed CSV or partitioned dataset')
+@click.option('--partition-unit', default='D', show_default=True, help='Time span of a dataset partition')
+@click.option('--chunk-rows', type=click.IntRange(min=1), default=None,
+              help='Read the exports in chunks of this many rows (streaming mode)')
+@click.option('--force', is_flag=True, help='Also process the pairs whose outputs are up to date')
+@click.option('--report', 'report_path', type=click.Path(dir_okay=False), default=None,
+              help=f'Report of the batch  [default: <output>/{REPORT_FILE}]')
+def _main(label_dir, export_dir, pairs_file, output_dir, jobs, output_format, partition_unit, chunk_rows, force,
+          report_path):
+    missing = []
+    if pairs_file is not None:
+        pairs = read_pairs(pairs_file, output_dir)
+    elif not os.path.isdir(label_dir):
+        raise click.BadParameter(f"Directory '{label_dir}' does not exist.", param_hint="'--labels'")
+    else:
+        pairs, without_export = discover_pairs(label_dir, export_dir, output_dir)
+        missing = no_export_rows(without_export, label_dir, export_dir, output_dir)
+    begin = time.perf_counter()
+    with click.progressbar(length=len(pairs), label='Processing', show_pos=True) as bar:
+        rows = run_batch(pairs, jobs, output_format, partition_unit, chunk_rows, force,
+                         progress=lambda row: bar.update(1)) + missing
+    report_path = write_report(rows, report_path or os.path.join(output_dir, REPORT_FILE))
+    counts = {status: sum(row['status'] == status for row in rows) for status in ('done', 'skipped', 'failed')}
+    click.echo("{done} done, {skipped} skipped, {failed} failed".format(**counts) +
+               f" in {time.perf_counter() - begin:.1f} s, report in {report_path}")
+    for row in rows:
+        if row['status'] == 'failed':
+            click.echo(f"Failed {row['label']}: {row['error'].splitlines()[0]}", err=True)
+    if counts['failed']:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,178 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Typed columns of a processed drift series
+COLUMNS = {'timestamp': 'datetime64[s]', 'value': 'float64', 'category_label': 'int8', 'drift_label': 'int64'}
+FORMATS = ('parquet', 'feather', 'npz')
+MANIFEST_FILE = 'manifest.json'
+
+
+def _require_pyarrow(fmt):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise ImportError(f"The {fmt} dataset format needs pyarrow, install it with pip install pyarrow "
+                          f"or use the npz format")
+
+
+class DatasetWriter:
+    """
+    Writes a processed drift series as a partitioned columnar dataset.
+    Rows arrive in time order, possibly in chunks; every partition_unit of time ('h', 'D' or 'M') becomes one
+    Parquet, Feather or npz file, and manifest.json lists the partitions with their row count and min/max
+    statistics, so readers only open the partitions of the time ranges and drift types they need.
+    """
+
+    def __init__(self, directory, fmt='parquet', partition_unit='D'):
+        """
+        :param directory (str): Directory of the dataset, created if needed.
+        :param fmt (str): One of parquet, feather or npz.
+        :param partition_unit (str): NumPy datetime unit of a partition.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown dataset format {fmt}")
+        if fmt != 'npz':
+            _require_pyarrow(fmt)
+        self.directory = directory
+        self.fmt = fmt
+        self.partition_unit = partition_unit
+        self.partitions = []
+        self._buffer = []
+        self._key = None
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, frame):
+        """
+        Append rows with the COLUMNS columns, a partition is written once a later one starts
+        """
+        frame = pd.DataFrame({name: np.asarray(frame[name]).astype(dtype) for name, dtype in COLUMNS.items()})
+        if len(frame) == 0:
+            return
+        keys = frame['timestamp'].values.astype(f'datetime64[{self.partition_unit}]')
+        if self._key is not None and keys[0] < self._key:
+            raise ValueError("Rows must be written in time order")
+        bounds = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        for part, key in zip(np.split(np.arange(len(frame)), bounds), keys[np.concatenate([[0], bounds])]):
+            if self._key is not None and key != self._key:
+                self._flush()
+            self._key = key
+            self._buffer.append(frame.iloc[part])
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        frame = pd.concat(self._buffer, ignore_index=True)
+        self._buffer = []
+        name = "part-{}.{}".format(str(self._key).replace(':', '-'), self.fmt)
+        path = os.path.join(self.directory, name)
+        if self.fmt == 'parquet':
+            frame.to_parquet(path, index=False)
+        elif self.fmt == 'feather':
+            # Uncompressed, so readers can memory-map it
+            frame.to_feather(path, compression='uncompressed')
+        else:
+            np.savez(path, **{column: frame[column].to_numpy() for column in COLUMNS})
+        values = frame['value'].to_numpy()
+        finite = values[~np.isnan(values)]
+        self.partitions.append({
+            'file': name,
+            'rows': len(frame),
+            'timestamp_min': str(frame['timestamp'].min()),
+            'timestamp_max': str(frame['timestamp'].max()),
+            'value_min': float(finite.min()) if len(finite) else None,
+            'value_max': float(finite.max()) if len(finite) else None,
+            'categories': sorted(int(category) for category in np.unique(frame['category_label'])),
+        })
+
+    def close(self):
+        """
+        Write the last partition and the manifest
+        :return:
+            str: Path of the manifest.
+        """
+        self._flush()
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        with open(path + '.tmp', 'w') as file:
+            json.dump({'format': self.fmt, 'partition_unit': self.partition_unit, 'columns': COLUMNS,
+                       'partitions': self.partitions}, file, indent=1)
+        os.replace(path + '.tmp', path)
+        return path
+
+
+def write_dataset(frame, directory, fmt='parquet', partition_unit='D'):
+    writer = DatasetWriter(directory, fmt, partition_unit)
+    writer.write(frame)
+    return writer.close()
+
+
+def read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_FILE), 'r') as file:
+        return json.load(file)
+
+
+def select_partitions(manifest, start=None, end=None, categories=None):
+    """
+    Partitions that may hold rows in [start, end] with one of the categories, from the manifest statistics alone
+    """
+    selected = []
+    for partition in manifest['partitions']:
+        if start is not None and pd.Timestamp(partition['timestamp_max']) < pd.Timestamp(start):
+            continue
+        if end is not None and pd.Timestamp(partition['timestamp_min']) > pd.Timestamp(end):
+            continue
+        if categories is not None and not set(categories) & set(partition['categories']):
+            continue
+        selected.append(partition)
+    return selected
+
+
+def read_dataset(directory, start=None, end=None, categories=None, columns=None):
+    """
+    Read the rows of a dataset in [start, end] whose category_label is in categories.
+    Partitions are pruned with the manifest, Parquet rows are filtered while reading and Feather files are
+    memory-mapped.
+    :param directory (str): Directory of the dataset.
+    :param start, end (datetime-like or None): Time range, inclusive.
+    :param categories (list or None): Category labels to keep, all by default.
+    :param columns (list or None): Columns to return, all by default.
+    :return:
+        DataFrame: The selected rows in time order.
+    """
+    manifest = read_manifest(directory)
+    fmt = manifest['format']
+    columns = list(columns or COLUMNS)
+    # The filter columns are read too and dropped at the end
+    read_columns = list(dict.fromkeys(columns + ['timestamp', 'category_label']))
+    frames = []
+    for partition in select_partitions(manifest, start, end, categories):
+        path = os.path.join(directory, partition['file'])
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            filters = []
+            if start is not None:
+                filters.append(('timestamp', '>=', pd.Timestamp(start)))
+            if end is not None:
+                filters.append(('timestamp', '<=', pd.Timestamp(end)))
+            if categories is not None:
+                filters.append(('category_label', 'in', list(categories)))
+            frame = pq.read_table(path, columns=read_columns, filters=filters or None).to_pandas()
+        elif fmt == 'feather':
+            import pyarrow.feather as feather
+            frame = feather.read_table(path, columns=read_columns, memory_map=True).to_pandas()
+        else:
+            with np.load(path) as data:
+                frame = pd.DataFrame({column: data[column] for column in read_columns})
+        mask = np.ones(len(frame), dtype=bool)
+        if start is not None:
+            mask &= frame['timestamp'].values >= np.datetime64(pd.Timestamp(start))
+        if end is not None:
+            mask &= frame['timestamp'].values <= np.datetime64(pd.Timestamp(end))
+        if categories is not None:
+            mask &= np.isin(frame['category_label'].values, list(categories))
+        frames.append(frame.loc[mask, columns])
+    if not frames:
+        return pd.DataFrame({column: np.empty(0, dtype=COLUMNS[column]) for column in columns})
+    return pd.concat(frames, ignore_index=True)
@@ -1,13 +1,45 @@
 import os
 import pickle
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
 
+from utils.dataset import MANIFEST_FILE, DatasetWriter, write_dataset
+
+# Drift segment: rows [start, end) of the processed series and the category of its first row
+SEGMENT_DTYPE = np.dtype([('start', np.int64), ('end', np.int64), ('type', np.int8)])
+
+
+def encode_runs(categories, offset=0):
+    # Run-length encoding of the category column in one pass: consecutive non-zero rows form one drift segment.
+    # Returns the segments as a SEGMENT_DTYPE array, with row numbers shifted by offset, and the length of
+    # its segment for every row (0 outside of the drifts), the drift_label column of the processed CSV
+    categories = np.asarray(categories)
+    drifting = categories != 0
+    edges = np.diff(np.concatenate([[0], drifting.astype(np.int8), [0]]))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    lengths = np.zeros(len(categories), dtype=np.int64)
+    lengths[drifting] = np.repeat(ends - starts, ends - starts)
+    segments = np.empty(len(starts), dtype=SEGMENT_DTYPE)
+    segments['start'], segments['end'] = starts + offset, ends + offset
+    segments['type'] = categories[starts]
+    return segments, lengths
+
+
+def load_segments(path, mmap=True):
+    # Read a segment file written by DataProcessor, memory-mapped by default
+    return np.load(path, mmap_mode='r' if mmap else None)
+
 
 class DataProcessor:
-    def __init__(self, label_data_path, drift_data_path):
+    def __init__(self, label_data_path, drift_data_path, output_format='csv', partition_unit='D',
+                 output_dir='processed'):
+        # output_format is csv, or parquet, feather or npz for a partitioned dataset (see utils/dataset.py)
         self.label_data_path = label_data_path
         self.drift_data_path = drift_data_path
+        self.output_format = output_format
+        self.partition_unit = partition_unit
+        self.output_dir = output_dir
         self.event_types = {'Sudden': 1, 'Blip': 2, 'Recurrent': 3, 'Incremental': 4, 'Gradual': 5}
         self.resampled_data = None
 
@@ -18,9 +50,63 @@ class DataProcessor:
 
         # Process data
         annotated_data = self.convert_to_annotated_data(label_data, drift_data)
-        length_list = self.process_continuous(annotated_data)
-        df = self.save_as_csv(annotated_data, length_list)
-        self.extract_segments(df)
+        segments, lengths = encode_runs([category for _, _, category in annotated_data])
+        if self.output_format == 'csv':
+            self.save_as_csv(annotated_data, lengths)
+        else:
+            self.save_as_dataset(annotated_data, lengths)
+        self.save_segments(segments)
+
+    def process_data_streaming(self, chunk_rows=500000):
+        # Same output as process_data, reading the drift export in chunks of chunk_rows rows so the memory
+        # stays bounded. The export must be in time order; the last sample of a chunk is carried over to
+        # interpolate the timesteps up to the first sample of the next one
+        intervals = self.label_intervals(self.load_label_data())
+        start_time, end_time = self.create_standard_time_bounds()
+        step = np.timedelta64(10, 's')
+        next_step, end_step = np.datetime64(start_time, 's'), np.datetime64(end_time, 's')
+        dataset = None
+        if self.output_format != 'csv':
+            dataset = DatasetWriter(self.processed_dataset_path(), self.output_format, self.partition_unit)
+        writer = _AnnotatedWriter(self.processed_csv_path(), dataset)
+        last = None
+        for chunk in pd.read_csv(self.drift_data_path, usecols=['_time', '_value'], chunksize=chunk_rows):
+            times, values = self.whole_second_samples(chunk)
+            if len(times) == 0:
+                continue
+            if last is not None:
+                if times[0] < last[0]:
+                    raise ValueError("The drift data must be sorted by _time for the streaming mode")
+                times, values = np.concatenate([[last[0]], times]), np.concatenate([[last[1]], values])
+            # Timesteps before the last sample can be interpolated now
+            steps = np.arange(next_step, min(times[-1], end_step + step), step)
+            if len(steps):
+                writer.write(steps, self.interpolate_samples(steps, times, values), self.paint_labels(steps, intervals))
+                next_step = steps[-1] + step
+            last = (times[-1], values[-1])
+        # The timesteps after the last sample keep its value
+        steps = np.arange(next_step, end_step + step, step)
+        if len(steps):
+            filled = np.full(len(steps), np.nan if last is None else last[1])
+            writer.write(steps, filled, self.paint_labels(steps, intervals))
+        self.save_segments(writer.close())
+
+    @staticmethod
+    def whole_second_samples(chunk):
+        # Samples of a chunk that fall on a whole second, like resample('1s').asfreq(), as UTC times and values
+        times = pd.to_datetime(chunk['_time'], utc=True).dt.tz_localize(None).values.astype('datetime64[ns]')
+        values = chunk['_value'].to_numpy(dtype=float)
+        keep = (times.astype(np.int64) % 10 ** 9 == 0) & ~np.isnan(values)
+        order = np.argsort(times[keep], kind='stable')
+        return times[keep][order].astype('datetime64[s]'), values[keep][order]
+
+    @staticmethod
+    def interpolate_samples(steps, times, values):
+        # Linear interpolation of the samples at the timesteps, NaN before the first sample
+        seconds = (times - times[0]).astype(np.int64).astype(float)
+        result = np.interp((steps - times[0]).astype(np.int64).astype(float), seconds, values)
+        result[steps < times[0]] = np.nan
+        return result
 
     def load_label_data(self):
         # Load label data from CSV
@@ -33,23 +119,92 @@ class DataProcessor:
         drift_data['_time'] = pd.to_datetime(drift_data['_time'])
         drift_data.sort_values(by='_time', inplace=True)
         drift_data.set_index('_time', inplace=True)
-        drift_data = drift_data.resample('1S').asfreq().interpolate(method='linear')
+        drift_data = drift_data.resample('1s').asfreq().interpolate(method='linear')
         return drift_data
 
+    def category_of(self, drift_label):
+        # Composite labels such as 'Incremental+Blip' take the category of the overlay on top
+        return self.event_types[drift_label.split('+')[-1]]
+
+    @staticmethod
+    def parse_label_time(text):
+        # Label times are exported with whole seconds, newer labels may carry fractions of a second
+        for fmt in ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S.%f'):
+            try:
+                return datetime.strptime(text, fmt)
+            except ValueError:
+                continue
+        raise ValueError(f"Unknown label time format: {text}")
+
     @staticmethod
     def convert_to_rfc3339(label_data):
         # Convert label data time to RFC3339 format
         rfc3339_data = []
         for item in label_data.iterrows():
-            event_type = item[1][1]
-            start_time = datetime.strptime(item[1][2], '%d/%m/%Y %H:%M:%S') - timedelta(hours=8)
-            end_time = datetime.strptime(item[1][3], '%d/%m/%Y %H:%M:%S') - timedelta(hours=8)
+            event_type = item[1].iloc[1]
+            start_time = DataProcessor.parse_label_time(item[1].iloc[2]) - timedelta(hours=8)
+            end_time = DataProcessor.parse_label_time(item[1].iloc[3]) - timedelta(hours=8)
             start_time, end_time = start_time.isoformat(), end_time.isoformat()
             rfc3339_data.append([event_type, (start_time, end_time)])
         return rfc3339_data
 
+    @staticmethod
+    def parse_label_times(texts):
+        # Vectorized parse_label_time of a column of label times
+        texts = pd.Series(texts, dtype=object).reset_index(drop=True)
+        times = np.full(len(texts), np.datetime64('NaT'), dtype='datetime64[us]')
+        for fmt in ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M:%S.%f'):
+            missing = np.isnat(times)
+            if not missing.any():
+                break
+            parsed = pd.to_datetime(texts[missing], format=fmt, errors='coerce')
+            times[missing] = parsed.values.astype('datetime64[us]')
+        for i in np.flatnonzero(np.isnat(times)):
+            # Raises on an unknown format like parse_label_time
+            times[i] = DataProcessor.parse_label_time(texts[i])
+        return times
+
+    def label_intervals(self, label_data):
+        # Start and end of every label in whole seconds and its category, in file order.
+        # The times are floored to the second like the ISO string comparison of the legacy join,
+        # so a label covers the timesteps t with floor(start) <= t < floor(end)
+        offset = np.timedelta64(8, 'h')
+        starts = (self.parse_label_times(label_data.iloc[:, 2]) - offset).astype('datetime64[s]')
+        ends = (self.parse_label_times(label_data.iloc[:, 3]) - offset).astype('datetime64[s]')
+        categories = np.array([self.category_of(drift_type) for drift_type in label_data.iloc[:, 1]], dtype=np.int64)
+        return starts, ends, categories
+
+    def annotate(self, times, label_data):
+        # Category of every sorted timestep, 0 outside of the labels.
+        # Where labels overlap the first one in the file wins, so the labels are painted in reverse order
+        return self.paint_labels(times, self.label_intervals(label_data))
+
+    @staticmethod
+    def paint_labels(times, intervals):
+        # annotate with the label intervals already parsed
+        times = np.asarray(times, dtype='datetime64[s]')
+        starts, ends, categories = intervals
+        first = np.searchsorted(times, starts, side='left')
+        last = np.searchsorted(times, ends, side='left')
+        result = np.zeros(len(times), dtype=np.int64)
+        for i in range(len(categories) - 1, -1, -1):
+            result[first[i]:last[i]] = categories[i]
+        return result
+
     def convert_to_annotated_data(self, label_data, drift_data):
-        # Convert data to annotated format
+        # Convert data to annotated format, joining the timesteps with the label intervals on sorted arrays
+        time_range = self.create_standard_time_range()
+        if drift_data.index.tz is not None:
+            time_range = time_range.tz_localize('UTC')
+        self.resampled_data = drift_data.reindex(time_range, method='ffill')
+        times = time_range.tz_localize(None).values
+        timestamps = np.char.add(np.datetime_as_string(times, unit='s'), 'Z').tolist()
+        categories = self.annotate(times, label_data)
+        return [[timestamp, value, category] for timestamp, value, category in
+                zip(timestamps, self.resampled_data['_value'].tolist(), categories.tolist())]
+
+    def convert_to_annotated_data_legacy(self, label_data, drift_data):
+        # Row by row join of the timesteps with the labels, kept as the reference of convert_to_annotated_data
         annotated_data, temp = [], []
         rfc3339_data = self.convert_to_rfc3339(label_data)
         timestep = self.create_standard_timestep()
@@ -61,7 +216,7 @@ class DataProcessor:
             for label in rfc3339_data:
                 drift_type, (drift_start, drift_end) = label
                 if drift_start <= timestamp <= drift_end:
-                    temp.append([timestamp, value, self.event_types[drift_type]])
+                    temp.append([timestamp, value, self.category_of(drift_type)])
                     found = True
                     break
             if not found:
@@ -71,66 +226,125 @@ class DataProcessor:
                 temp = []
         return annotated_data
 
-    def create_standard_timestep(self):
-        # Create standard timestep based on label file name
+    def create_standard_time_bounds(self):
+        # First and last standard timestep (UTC) based on label file name
         file_name = os.path.basename(self.label_data_path).strip(".csv")
         start_time = f"{file_name.split('_')[1]} {file_name.split('_')[2].replace('-', ':')}"
         end_time = f"{file_name.split('_')[4]} {file_name.split('_')[5].replace('-', ':')}"
         start_time = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S') - timedelta(hours=8)
         end_time = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S') - timedelta(hours=8)
-        time_columns = pd.date_range(start=start_time, end=end_time, freq='10S')
-        time_columns = [timestep.strftime('%Y-%m-%dT%H:%M:%SZ') for timestep in time_columns]
-        return time_columns
+        return start_time, end_time
+
+    def create_standard_time_range(self):
+        # Standard 10 s timesteps (UTC) based on label file name
+        start_time, end_time = self.create_standard_time_bounds()
+        return pd.date_range(start=start_time, end=end_time, freq='10s')
+
+    def create_standard_timestep(self):
+        # Create standard timestep based on label file name, as 'YYYY-MM-DDTHH:MM:SSZ' strings
+        time_range = self.create_standard_time_range()
+        return np.char.add(np.datetime_as_string(time_range.values, unit='s'), 'Z').tolist()
 
     @staticmethod
     def process_continuous(data):
         # Process continuous data and return a list of lengths
-        length = 0
-        result = []
-        for _, _, val in data:
-            if val != 0:
-                length += 1
-            else:
-                if length > 0:
-                    result.extend([length] * length)
-                    length = 0
-                result.append(0)
-        if length > 0:
-            result.extend([length] * length)
-        return result
+        return encode_runs([val for _, _, val in data])[1].tolist()
 
     def save_as_csv(self, annotated_data, length_data):
         # Save annotated data as CSV and return DataFrame
         df = pd.DataFrame(annotated_data, columns=['timestamp', 'value', 'category_label'])
         df['drift_label'] = length_data
-        new_file_name = os.path.basename(self.label_data_path).replace('project', 'cpu').replace('.pkl', '.csv')
-        new_file_path = f"processed/{new_file_name}"
-        df.to_csv(new_file_path, index=False)
+        df.to_csv(self.processed_csv_path(), index=False)
         return df
 
+    def processed_csv_path(self):
+        new_file_name = os.path.basename(self.label_data_path).replace('project', 'cpu').replace('.pkl', '.csv')
+        return os.path.join(self.output_dir, new_file_name)
+
+    def processed_dataset_path(self):
+        return os.path.splitext(self.processed_csv_path())[0]
+
+    def processed_segments_path(self):
+        new_file_name = os.path.basename(self.label_data_path).replace('project', 'cpu').strip(".csv")
+        return os.path.join(self.output_dir, f'standard_drift_index_{new_file_name}.npy')
+
+    def output_paths(self):
+        # Files written by process_data and process_data_streaming, the segment file is written last
+        if self.output_format == 'csv':
+            return [self.processed_csv_path(), self.processed_segments_path()]
+        return [os.path.join(self.processed_dataset_path(), MANIFEST_FILE), self.processed_segments_path()]
+
+    def save_as_dataset(self, annotated_data, length_data):
+        # Save annotated data as a partitioned columnar dataset with typed columns and return its manifest path
+        timestamps, values, categories = zip(*annotated_data) if annotated_data else ([], [], [])
+        frame = pd.DataFrame({'timestamp': pd.to_datetime(list(timestamps), format='%Y-%m-%dT%H:%M:%SZ'),
+                              'value': values, 'category_label': categories, 'drift_label': length_data})
+        return write_dataset(frame, self.processed_dataset_path(), self.output_format, self.partition_unit)
+
     def save_as_pkl(self, drift_segments):
-        # Save drift segments as pickle file
+        # Save drift segments as pickle file, the format before save_segments
         new_file_name = os.path.basename(self.label_data_path).replace('project', 'cpu').strip(".csv")
-        new_file_path = f'processed/standard_drift_index_{new_file_name}.pkl'
+        new_file_path = os.path.join(self.output_dir, f'standard_drift_index_{new_file_name}.pkl')
         with open(new_file_path, 'wb') as file:
             pickle.dump(drift_segments, file)
         return new_file_path
 
+    def save_segments(self, segments):
+        # Save drift segments as a SEGMENT_DTYPE .npy file, which training jobs can memory-map with load_segments
+        new_file_path = self.processed_segments_path()
+        np.save(new_file_path, segments)
+        return new_file_path
+
     def extract_segments(self, resampled_data):
-        # Extract segments from resampled data and save as pickle
-        segments = []
-        drift_label_list = resampled_data['drift_label'].to_list()
-        start_index, index = 0, 0
-        while index < len(drift_label_list):
-            if drift_label_list[index] != 0:
-                start_index = index
-                end_index = start_index + drift_label_list[index]
-                segments.append([start_index, end_index])
-                index = end_index
-            else:
-                index = index + 1
-        self.save_as_pkl(segments)
-        return segments
+        # Extract segments from resampled data and save them
+        segments, _ = encode_runs(resampled_data['category_label'].to_numpy())
+        self.save_segments(segments)
+        return np.stack([segments['start'], segments['end']], axis=1).tolist()
+
+
+class _AnnotatedWriter:
+    # Appends annotated timesteps to the processed CSV, or to a DatasetWriter when given. The rows of a drift
+    # run that may continue in the next chunk are held back, so the run length in the drift_label column is
+    # known when they are written
+
+    def __init__(self, path, dataset=None):
+        self.path = path
+        self.dataset = dataset
+        self.offset = 0
+        self.segments = []
+        self._header = True
+        self._pending = (np.empty(0, dtype='datetime64[s]'), np.empty(0), np.empty(0, dtype=np.int64))
+
+    def write(self, steps, values, categories, final=False):
+        steps, values, categories = (np.concatenate([held, new]) for held, new in
+                                     zip(self._pending, (steps, values, categories)))
+        drifting = categories != 0
+        cut = len(steps)
+        if not final and len(steps) and drifting[-1]:
+            # Hold back the open run at the end
+            calm = np.flatnonzero(~drifting)
+            cut = calm[-1] + 1 if len(calm) else 0
+        self._pending = (steps[cut:], values[cut:], categories[cut:])
+        if cut == 0:
+            return
+        segments, lengths = encode_runs(categories[:cut], self.offset)
+        self.segments.append(segments)
+        self.offset += cut
+        if self.dataset is not None:
+            self.dataset.write({'timestamp': steps[:cut], 'value': values[:cut], 'category_label': categories[:cut],
+                                'drift_label': lengths})
+            return
+        df = pd.DataFrame({'timestamp': np.char.add(np.datetime_as_string(steps[:cut], unit='s'), 'Z'),
+                           'value': values[:cut], 'category_label': categories[:cut], 'drift_label': lengths})
+        df.to_csv(self.path, mode='w' if self._header else 'a', header=self._header, index=False)
+        self._header = False
+
+    def close(self):
+        # Flush the held back rows and return the drift segments
+        self.write(*(array[:0] for array in self._pending), final=True)
+        if self.dataset is not None:
+            self.dataset.close()
+        return np.concatenate(self.segments) if self.segments else np.empty(0, dtype=SEGMENT_DTYPE)
 
 
 if __name__ == '__main__':
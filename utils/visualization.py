@@ -1,17 +1,159 @@
+import os
 import pickle
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+# pandas and matplotlib are imported where they are used, so the command line help and the worker processes
+# that only render do not pay for both of them at startup
+
+COLORS = {'Sudden': 'blue', 'Blip': 'yellow', 'Recurrent': 'red', 'Incremental': 'green', 'Gradual': 'pink'}
+
+
+def lttb(x, y, threshold):
+    # Largest-Triangle-Three-Buckets downsampling of the sorted points (x, y) to threshold points. The first and
+    # last points are kept, and from every bucket in between the point forming the largest triangle with the
+    # point kept before it and the mean of the next bucket, so peaks and drops survive
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if threshold >= len(x):
+        return x, y
+    if threshold < 3:
+        raise ValueError("LTTB needs a threshold of at least 3 points")
+    edges = np.linspace(1, len(x) - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, len(x) - 1
+    a = 0
+    for i in range(threshold - 2):
+        low, high = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[high:edges[i + 2]].mean(), y[high:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        area = np.abs((x[a] - next_x) * (y[low:high] - y[a]) - (x[a] - x[low:high]) * (next_y - y[a]))
+        a = low + int(np.argmax(area))
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+def parse_rfc3339(texts):
+    # UTC times of RFC3339 strings as naive datetime64[ns]. The 'Z' times of the InfluxDB exports are parsed by
+    # NumPy, several times faster than pd.to_datetime; other offsets go through pandas
+    texts = np.asarray(texts, dtype=str)
+    if len(texts) and np.all(np.char.endswith(texts, 'Z')):
+        return np.char.rstrip(texts, 'Z').astype('datetime64[ns]')
+    import pandas as pd
+    return pd.to_datetime(pd.Series(texts), utc=True).dt.tz_localize(None).values.astype('datetime64[ns]')
+
+
+def to_date_numbers(times):
+    # Matplotlib date numbers of int64 nanosecond times
+    from matplotlib import dates as mdates
+    return mdates.date2num(np.asarray(times, dtype=np.int64).view('datetime64[ns]'))
+
+
+class LabelIndex:
+    """
+    Sorted interval index of drift labels, to find the labels overlapping a time range with searchsorted.
+    The labels are sorted by start; reach[i] is the latest end among the first i + 1 labels, so it is sorted too
+    and the labels that can overlap [low, high] lie between the first reach >= low and the last start <= high.
+    A query costs O(log n) plus the labels it returns, however many labels there are.
+    """
+
+    def __init__(self, label_data):
+        """
+        :param label_data (list): [event_type, (start, end)] labels with local (UTC+8) datetime bounds, as
+            read from the label pickle files.
+        """
+        offset = np.timedelta64(8, 'h')
+        starts = np.array([start for _, (start, _) in label_data], dtype='datetime64[ns]') - offset
+        ends = np.array([end for _, (_, end) in label_data], dtype='datetime64[ns]') - offset
+        types = np.array([event_type.split('+')[-1] for event_type, _ in label_data], dtype=object)
+        order = np.argsort(starts, kind='stable')
+        self.starts, self.ends, self.types = starts[order].view(np.int64), ends[order].view(np.int64), types[order]
+        self.reach = np.maximum.accumulate(self.ends) if len(self.ends) else self.ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, low, high):
+        """
+        Positions of the labels overlapping [low, high], in int64 nanoseconds
+        :return:
+            np.ndarray: Positions in start order.
+        """
+        first = np.searchsorted(self.reach, low, side='left')
+        last = np.searchsorted(self.starts, high, side='right')
+        candidates = np.arange(first, max(first, last))
+        return candidates[self.ends[candidates] >= low]
+
+    def spans(self, low, high):
+        # (start, width) ranges in date numbers of the labels overlapping [low, high], clipped to it, per drift type
+        found = self.overlapping(low, high)
+        begin = to_date_numbers(np.maximum(self.starts[found], low))
+        end = to_date_numbers(np.minimum(self.ends[found], high))
+        spans = {}
+        for drift_type, start, stop in zip(self.types[found], begin, end):
+            spans.setdefault(drift_type, []).append((start, stop - start))
+        return spans
+
+    def sample_spans(self, times):
+        # (drift type, first, last) sample positions covered by each label overlapping the sorted times
+        if len(times) == 0:
+            return []
+        found = self.overlapping(times[0], times[-1])
+        first = np.searchsorted(times, self.starts[found], side='left')
+        last = np.searchsorted(times, self.ends[found], side='right') - 1
+        return [(drift_type, i, j) for drift_type, i, j in zip(self.types[found], first, last) if i <= j]
+
+
+def _draw(ax, x, y, spans, title, width_px):
+    # Plot the downsampled series and one collection of label spans per drift type
+    from matplotlib.lines import Line2D
+    x, y = lttb(x, y, width_px)
+    ax.plot(x, y, label='_value', linewidth=0.8)
+    for drift_type, ranges in spans.items():
+        ax.broken_barh(ranges, (0, 1), transform=ax.get_xaxis_transform(), alpha=0.2,
+                       facecolor=COLORS.get(drift_type, 'gray'))
+    ax.set_xlabel('Time')
+    ax.set_ylabel('Value')
+    ax.set_title(title)
+    custom_legend = [Line2D([0], [0], color=color, lw=4, label=label) for label, color in COLORS.items()]
+    ax.legend(handles=custom_legend, loc='upper right')
+
+
+def render_chunk(x, y, spans, title, path, figsize=(50, 6), dpi=100):
+    """
+    Render a chunk to an image file without a display, the format follows the file extension (png, svg)
+    :param x (np.ndarray): Matplotlib date numbers of the samples.
+    :param y (np.ndarray): Values of the samples.
+    :param spans (dict): Drift type -> list of (start, width) label spans in date numbers.
+    :return:
+        str: The path.
+    """
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=figsize, dpi=dpi)
+    ax = fig.add_subplot()
+    _draw(ax, x, y, spans, title, int(figsize[0] * dpi))
+    ax.set_xticks([])
+    fig.savefig(path)
+    return path
+
+
+def _render_task(task):
+    return render_chunk(*task)
 
 
 class Visualization:
-    def __init__(self, pkl_path, csv_path):
+    def __init__(self, pkl_path, csv_path, chunk_rows=500):
         self.pkl_path = pkl_path
         self.csv_path = csv_path
+        self.chunk_rows = chunk_rows
 
     def read_csv_file(self):
         # Read CSV file and sort by '_time'
+        import pandas as pd
         drift_data = pd.read_csv(self.csv_path)
         drift_data.sort_values(by='_time', inplace=True)
         return drift_data
@@ -33,43 +175,89 @@ class Visualization:
             rfc3339_data.append([event_type, (start_time, end_time)])
         return rfc3339_data
 
-    def visualize_chunk(self, chunk_data, label_data, chunk_index):
-        # Visualize a chunk of data with labels
-        colors = {'Sudden': 'blue', 'Blip': 'yellow', 'Recurrent': 'red', 'Incremental': 'green', 'Gradual': 'pink'}
+    def load_series(self):
+        # Sample times as int64 nanoseconds (UTC) and values, sorted by time, without the missing values
+        import pandas as pd
+        drift_data = pd.read_csv(self.csv_path, usecols=['_time', '_value'])
+        times = parse_rfc3339(drift_data['_time'].to_numpy()).view(np.int64)
+        values = drift_data['_value'].to_numpy(dtype=float)
+        order = np.argsort(times, kind='stable')
+        keep = ~np.isnan(values[order])
+        return times[order][keep], values[order][keep]
 
+    def chunk_bounds(self, count):
+        # Row ranges [begin, end) of the chunks of chunk_rows samples
+        return [(begin, min(begin + self.chunk_rows, count)) for begin in range(0, count, self.chunk_rows)]
+
+    def visualize_chunk(self, chunk_times, chunk_values, label_index, chunk_index):
+        # Visualize a chunk of data with the labels that overlap it, spanning their samples in the chunk
+        import matplotlib.pyplot as plt
         plt.figure(figsize=(50, 6))
-        plt.plot(chunk_data['_time'], chunk_data['_value'], label='_value')
+        x = to_date_numbers(chunk_times)
+        plt.plot(x, chunk_values, label='_value')
 
-        for label, (start_time, end_time) in label_data:
-            start_index = chunk_data[chunk_data['_time'] >= start_time].index
-            end_index = chunk_data[chunk_data['_time'] <= end_time].index
-            if not start_index.empty and not end_index.empty:
-                start_index, end_index = start_index[0], end_index[-1]
-                plt.axvspan(chunk_data.at[start_index, '_time'], chunk_data.at[end_index, '_time'],
-                            alpha=0.2, label=label, facecolor=colors.get(label, 'gray'))
+        for drift_type, first, last in label_index.sample_spans(chunk_times):
+            plt.axvspan(x[first], x[last], alpha=0.2, label=drift_type, facecolor=COLORS.get(drift_type, 'gray'))
 
         plt.xticks([])
         plt.xlabel('Time')
         plt.ylabel('Value')
         plt.title(f'Visualization of Data with Labels (Chunk {chunk_index + 1})')
-        custom_legend = [plt.Line2D([0], [0], color=colors[label], lw=4, label=label) for label in colors]
+        custom_legend = [plt.Line2D([0], [0], color=COLORS[label], lw=4, label=label) for label in COLORS]
         plt.legend(handles=custom_legend, loc='upper right')
         plt.show()
 
     def visual(self):
-        # Read data and preprocess labels
-        label_data = self.read_pkl_file()
-        drift_data = self.read_csv_file()
-        label_data = self.convert_to_rfc3339(label_data)
+        # Read data and index the labels once, then visualize each chunk
+        label_index = LabelIndex(self.read_pkl_file())
+        times, values = self.load_series()
+        for i, (begin, end) in enumerate(self.chunk_bounds(len(times))):
+            self.visualize_chunk(times[begin:end], values[begin:end], label_index, i)
 
-        # Split data into chunks
-        time_chunks = np.array_split(drift_data['_time'], len(drift_data) // 500)
+    def render(self, output_dir, fmt='png', jobs=None, figsize=(50, 6), dpi=100):
+        """
+        Headless version of visual: render every chunk of chunk_rows samples to output_dir/chunk-<n>.<fmt>,
+        on a pool of jobs worker processes. Each chunk is downsampled with LTTB to the pixel width of the image
+        :param output_dir (str): Directory of the images, created if needed.
+        :param fmt (str): png or svg.
+        :param jobs (int or None): Worker processes, the number of CPUs by default.
+        :return:
+            list: Paths of the images, in time order.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        times, values = self.load_series()
+        label_index = LabelIndex(self.read_pkl_file())
+        tasks = []
+        for i, (begin, end) in enumerate(self.chunk_bounds(len(times))):
+            tasks.append((to_date_numbers(times[begin:end]), values[begin:end],
+                          label_index.spans(times[begin], times[end - 1]),
+                          f'Visualization of Data with Labels (Chunk {i + 1})',
+                          os.path.join(output_dir, f'chunk-{i + 1:05d}.{fmt}'), figsize, dpi))
+        if not tasks:
+            return []
+        workers = min(jobs or os.cpu_count() or 1, len(tasks))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # A few tasks per message, the chunk arrays are small next to the rendering
+            return list(executor.map(_render_task, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
 
-        # Visualize each chunk
-        for i, time_chunk in enumerate(time_chunks):
-            chunk_data = drift_data[
-                (drift_data['_time'] >= time_chunk.iloc[0]) & (drift_data['_time'] <= time_chunk.iloc[-1])]
-            self.visualize_chunk(chunk_data, label_data, i + 1)
+    def overview(self, path, figsize=(20, 5), dpi=100):
+        """
+        One image of the whole series with all the labels, downsampled with LTTB to its pixel width
+        :return:
+            str: The path.
+        """
+        times, values = self.load_series()
+        label_index = LabelIndex(self.read_pkl_file())
+        from matplotlib.figure import Figure
+        fig = Figure(figsize=figsize, dpi=dpi)
+        ax = fig.add_subplot()
+        if len(times):
+            _draw(ax, to_date_numbers(times), values, label_index.spans(times[0], times[-1]),
+                  'Overview of Data with Labels', int(figsize[0] * dpi))
+        ax.xaxis_date()
+        fig.autofmt_xdate()
+        fig.savefig(path)
+        return path
 
     def count_drift_num(self):
         # Count the number of drifts in the label data
@@ -77,8 +265,24 @@ class Visualization:
         return len(drift_data)
 
 
+@click.command()
+@click.argument('pkl_path', type=click.Path(exists=True, dir_okay=False))
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--output', 'output_dir', type=click.Path(file_okay=False), default='plots', show_default=True,
+              help='Directory of the images')
+@click.option('--format', 'fmt', type=click.Choice(['png', 'svg']), default='png', show_default=True)
+@click.option('--chunk-rows', type=click.IntRange(min=1), default=500, show_default=True,
+              help='Samples per chunk image')
+@click.option('--jobs', type=click.IntRange(min=1), default=None, help='Worker processes  [default: CPU count]')
+@click.option('--overview-only', is_flag=True, help='Only render the overview image')
+def _main(pkl_path, csv_path, output_dir, fmt, chunk_rows, jobs, overview_only):
+    v = Visualization(pkl_path, csv_path, chunk_rows)
+    os.makedirs(output_dir, exist_ok=True)
+    click.echo("Overview in {}".format(v.overview(os.path.join(output_dir, f'overview.{fmt}'))))
+    if not overview_only:
+        click.echo("Rendered {} chunks into {}".format(len(v.render(output_dir, fmt, jobs)), output_dir))
+
+
 if __name__ == '__main__':
-    # Example usage
-    v = Visualization('../storage/cpu_2023-10-23_13-59-29_to_2023-10-24_00-55-54.pkl',
-                      '../data/2023-11-17_08_09_influxdb_data.csv')
-    v.visual()
+    # Example usage: python -m utils.visualization storage/cpu_....pkl data/..._influxdb_data.csv --output plots
+    _main()